@@ -1,52 +1,129 @@
-from flask import Flask, render_template, request, redirect, flash, session, g
-from flask_debugtoolbar import DebugToolbarExtension
+from flask import (Flask, Blueprint, render_template, request, redirect,
+                   flash, session, g, jsonify, has_request_context,
+                   current_app, abort, Response, stream_with_context,
+                   make_response)
+from flask.ctx import _AppCtxGlobals
 from flask_migrate import Migrate
 from models import db, connect_db, User, Recipe
-from forms import RegisterForm, LoginForm, RecipeForm
+import assets
+import catalog
+import jobs
+import thumbnails
+import transfer
+from config import get_config
+from dbpool import pool_stats
+from metrics import Metrics
+from forms import (RegisterForm, UserEditForm, LoginForm, RecipeForm,
+                   RecipeImportForm)
+from hashing import HashingBusy
+from cache import ResponseCache, MemoryBackend
+from recipe_source import RecipeSource, get_recipe_source, PLACEHOLDER_TITLE
+from sqlalchemy import func, tuple_
 from sqlalchemy.exc import IntegrityError
-import requests
-import os
-from dotenv import load_dotenv
+from sqlalchemy.orm import joinedload, load_only
+import datetime
+import hashlib
 
-load_dotenv()
+CURR_USER_KEY = 'curr_user'
 
-API_KEY = os.getenv('API_KEY')
+bp = Blueprint('main', __name__)
+migrate = Migrate()
 
-API_BASE_URL = 'https://api.spoonacular.com'
-CURR_USER_KEY = 'curr_user'
 
-app = Flask(__name__)
-migrate = Migrate(app, db)
+class LazyUserGlobals(_AppCtxGlobals):
+    """Flask `g` that loads the logged-in user on first use of g.user."""
+
+    def __getattr__(self, name):
+        if name != 'user':
+            raise AttributeError(name)
+
+        self.user = load_current_user()
+        return self.user
+
+
+def create_app(config=None, start_background=False):
+    """Build the app from a config profile name or class.
+
+    Without a config, the profile comes from the environment (see
+    config.get_config). Dev-only tooling is imported only by profiles that
+    turn it on.
+
+    Only the web server passes start_background, to start job worker
+    threads and warm the recipe pool. Scripts, migrations and the shell
+    build the app without touching the queue or the Spoonacular quota;
+    run jobs for them with `python jobs.py`.
+    """
+
+    app = Flask(__name__)
+    app.app_ctx_globals_class = LazyUserGlobals
+    app.config.from_object(get_config(config))
 
-URI = os.environ.get(
-    'DATABASE_URL', 'postgresql:///nomnom')
-if URI.startswith("postgres://"):
-    URI = URI.replace("postgres://", "postgresql://", 1)
+    connect_db(app)
+    migrate.init_app(app, db)
 
-app.config['SQLALCHEMY_DATABASE_URI'] = URI
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True
+    if app.config['DEBUG_TOOLBAR']:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
 
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'secret_key')
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
+    app.extensions['user_cache'] = ResponseCache(
+        MemoryBackend(app.config['USER_CACHE_MAX_SIZE']),
+        ttl=app.config['USER_CACHE_TTL'],
+        stale_ttl=0)
 
-toolbar = DebugToolbarExtension(app)
+    metrics = Metrics(app.config['METRICS_DIR'],
+                      app.config['METRICS_FLUSH_INTERVAL'])
+    metrics.init_app(app)
 
-connect_db(app)
+    source = RecipeSource(app)
+    source.client.listeners.append(metrics.record_spoonacular)
+    app.extensions['recipe_source'] = source
+
+    queue = jobs.create_queue(app)
+    queue.register('fill_random_recipe', source.fill_random_recipe,
+                   on_failure=source.fill_degraded_recipe)
+    app.extensions['jobs'] = queue
+
+    if start_background:
+        source.warm()
+        queue.start_workers(app, app.config['JOB_WORKER_THREADS'])
+
+    app.register_blueprint(bp)
+    assets.init_app(app)
+    thumbnails.init_app(app)
+
+    return app
 
 
 ###############################################################
 # User register/login/logout
 
 
-@app.before_request
-def add_user_to_g():
-    """If logged in, add current user to Flask global."""
+def load_current_user():
+    """Return the logged-in user, or None.
 
-    if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
-    else:
-        g.user = None
+    Called by `g` the first time a request touches g.user, so requests
+    that never do (static files, redirects) skip the lookup. The user's
+    identity is cached briefly, so most pages skip the query too.
+    """
+
+    if not has_request_context() or CURR_USER_KEY not in session:
+        return None
+
+    user_id = session[CURR_USER_KEY]
+
+    def lookup():
+        user = User.query.get(user_id)
+        return user.identity() if user else None
+
+    user_cache = current_app.extensions['user_cache']
+    identity = user_cache.get_or_fetch(user_id, lookup)
+    return User.from_identity(identity) if identity else None
+
+
+def forget_user(user_id):
+    """Drop a user's cached identity after it changes."""
+
+    current_app.extensions['user_cache'].backend.delete(user_id)
 
 
 def do_login(user):
@@ -62,7 +139,7 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register_user():
     """Show register form and handle user registration."""
 
@@ -96,7 +173,7 @@ def register_user():
     return render_template('users/register.html', form=form)
 
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login_user():
     """Handle user login."""
 
@@ -124,7 +201,7 @@ def login_user():
     return render_template('users/login.html', form=form)
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     """Logs user out and redirect to homepage."""
 
@@ -134,18 +211,80 @@ def logout():
     return redirect('/')
 
 
+################################################################
+# Conditional GET
+
+
+def make_etag(version):
+    """Return a strong ETag for the parts a page was rendered from."""
+
+    return hashlib.sha1(repr(version).encode()).hexdigest()
+
+
+def not_modified(version, last_modified):
+    """Return a 304 if the client's copy of the page is current, else None.
+
+    version holds everything the page is rendered from, so it changes
+    whenever the page would. Pages with flash messages waiting are always
+    rendered.
+    """
+
+    if '_flashes' in session:
+        return None
+
+    etag = make_etag(version)
+    if request.if_none_match:
+        current = request.if_none_match.contains(etag)
+    else:
+        since = request.if_modified_since
+        current = since is not None and since >= http_time(last_modified)
+
+    if current:
+        return with_validators(make_response('', 304), version, last_modified)
+    return None
+
+
+def with_validators(response, version, last_modified):
+    """Add ETag and Last-Modified headers to response."""
+
+    response.set_etag(make_etag(version))
+    response.last_modified = http_time(last_modified)
+    # browsers must check with us before reusing a page, and shared caches
+    # must not keep per-user pages at all
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def http_time(timestamp):
+    """Return a naive local timestamp as UTC at whole seconds."""
+
+    return (timestamp
+            .astimezone(datetime.timezone.utc)
+            .replace(microsecond=0))
+
+
+def render_if_modified(version, last_modified, template, **context):
+    """Render template with validators, or answer 304 without rendering."""
+
+    return (not_modified(version, last_modified)
+            or with_validators(
+                make_response(render_template(template, **context)),
+                version, last_modified))
+
+
 ################################################################
 # General user routes
 
 
-@app.route('/')
+@bp.route('/')
 def show_search_form():
     """Show homepage with search bar."""
 
     return render_template('index.html')
 
 
-@app.route('/users/<int:user_id>')
+@bp.route('/users/<int:user_id>')
 def show_user(user_id):
     """Show user's info."""
 
@@ -155,10 +294,11 @@ def show_user(user_id):
 
     user = User.query.get_or_404(user_id)
 
-    return render_template('users/show.html', user=user)
+    return render_if_modified(('user', user.id, user.updated_on, g.user.id),
+                              user.updated_on, 'users/show.html', user=user)
 
 
-@app.route('/users/profile', methods=['GET', 'POST'])
+@bp.route('/users/profile', methods=['GET', 'POST'])
 def edit_profile():
     """Update profile for current user."""
 
@@ -167,7 +307,7 @@ def edit_profile():
         return redirect('/')
 
     user = g.user
-    form = RegisterForm(obj=user)
+    form = UserEditForm(obj=user)
 
     if form.validate_on_submit():
         if User.authenticate(user.email, form.password.data):
@@ -177,6 +317,7 @@ def edit_profile():
             user.image_url = form.image_url.data
 
             db.session.commit()
+            forget_user(user.id)
             return redirect(f'/users/{user.id}')
 
         flash('Wrong password, please try again.', 'danger')
@@ -184,7 +325,7 @@ def edit_profile():
     return render_template('users/edit.html', form=form, user_id=user.id)
 
 
-@app.route('/users/delete', methods=['POST'])
+@bp.route('/users/delete', methods=['POST'])
 def delete_user():
     """Delete user."""
 
@@ -194,8 +335,10 @@ def delete_user():
 
     do_logout()
 
+    user_id = g.user.id
     db.session.delete(g.user)
     db.session.commit()
+    forget_user(user_id)
 
     flash('Account deleted.', 'danger')
     return redirect('/')
@@ -205,22 +348,16 @@ def delete_user():
 # Recipes routes
 
 
-@app.route('/recipes')
+@bp.route('/recipes')
 def search_recipes():
     """Search recipes by ingredients."""
     try:
-        tags = (request.args['tags']).lower()
-
-        res = requests.get(
-            f'{API_BASE_URL}/recipes/random?apiKey={API_KEY}&tags={tags}&number=1')
-
-        data = res.json()
-        entry = data['recipes'][0]
+        entry = get_recipe_source().random_recipe(request.args['tags'])
 
         title = entry['title']
         image = entry['image']
-        readyInMinutes = entry['readyInMinutes']
-        servings = entry['servings']
+        readyInMinutes = entry.get('readyInMinutes')
+        servings = entry.get('servings')
         sourceUrl = entry['sourceUrl']
 
         new_recipes = {
@@ -235,7 +372,17 @@ def search_recipes():
         return render_template('404.html')
 
 
-@app.route('/recipes/new', methods=['GET', 'POST'])
+@bp.route('/recipes/search')
+def search_catalog():
+    """Search recipes we have already received from Spoonacular."""
+
+    q = request.args.get('q', '').strip()
+    results = catalog.search(q) if q else []
+
+    return render_template('recipes/search.html', q=q, results=results)
+
+
+@bp.route('/recipes/new', methods=['GET', 'POST'])
 def add_recipe():
     """Show add recipe form & handle adding recipes."""
 
@@ -271,7 +418,7 @@ def add_recipe():
                            new_recipe=new_recipe)
 
 
-@app.route('/users/<int:user_id>/recipes', methods=['GET', 'POST'])
+@bp.route('/users/<int:user_id>/recipes', methods=['GET', 'POST'])
 def list_recipes(user_id):
     """Show user's recipes when logged in."""
 
@@ -280,54 +427,151 @@ def list_recipes(user_id):
         return redirect('/')
 
     user = User.query.get_or_404(user_id)
-    recipes = (Recipe
-               .query
-               .filter(Recipe.user_id == user_id)
-               .order_by(Recipe.created_on.desc())
+    per_page = current_app.config['RECIPES_PER_PAGE']
+
+    # any added, edited or deleted recipe changes the count or latest edit
+    count, last_edit = (db.session
+                        .query(func.count(Recipe.id),
+                               func.max(Recipe.updated_on))
+                        .filter(Recipe.user_id == user_id)
+                        .one())
+    last_modified = max(user.updated_on, last_edit or user.updated_on)
+    version = ('recipes', user.id, user.updated_on, count, last_edit,
+               request.query_string, per_page, g.user.id)
+
+    cached = not_modified(version, last_modified)
+    if cached:
+        return cached
+
+    # only the columns the list template and the next cursor use
+    query = (Recipe
+             .query
+             .options(load_only('id', 'title', 'done', 'created_on'))
+             .filter(Recipe.user_id == user_id))
+
+    pending = request.args.get('show') == 'pending'
+    if pending:
+        query = query.filter(db.not_(Recipe.done))
+
+    cursor = decode_cursor(request.args.get('after'))
+    if cursor:
+        query = query.filter(tuple_(Recipe.created_on, Recipe.id) < cursor)
+
+    recipes = (query
+               .order_by(Recipe.created_on.desc(), Recipe.id.desc())
+               .limit(per_page + 1)
                .all())
 
-    return render_template('recipes/list.html', user=user, recipes=recipes)
+    next_cursor = None
+    if len(recipes) > per_page:
+        recipes = recipes[:per_page]
+        next_cursor = encode_cursor(recipes[-1])
+
+    return with_validators(
+        make_response(render_template(
+            'recipes/list.html', user=user, recipes=recipes,
+            next_cursor=next_cursor, paged=bool(cursor), pending=pending)),
+        version, last_modified)
+
+
+def encode_cursor(recipe):
+    """Return the keyset cursor for the page after recipe."""
+
+    return f'{recipe.created_on.isoformat()}_{recipe.id}'
+
+
+def decode_cursor(cursor):
+    """Parse a cursor from encode_cursor into (created_on, id), or None."""
+
+    try:
+        created_on, recipe_id = cursor.rsplit('_', 1)
+        return datetime.datetime.fromisoformat(created_on), int(recipe_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+EXPORT_FORMATS = {
+    'ndjson': (transfer.to_ndjson, 'application/x-ndjson'),
+    'csv': (transfer.to_csv, 'text/csv'),
+}
+
+
+@bp.route('/users/<int:user_id>/recipes/export')
+def export_recipes(user_id):
+    """Download all of a user's recipes as NDJSON or CSV."""
+
+    if not g.user or g.user.id != user_id:
+        flash('Access unauthorized.', 'danger')
+        return redirect('/')
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+    encode, mimetype = EXPORT_FORMATS[fmt]
+
+    # streamed straight from the database cursor as the client reads it
+    lines = encode(transfer.export_rows(user_id))
+    return Response(
+        stream_with_context(lines), mimetype=mimetype,
+        headers={'Content-Disposition':
+                 f'attachment; filename=recipes.{fmt}'})
 
 
-@app.route('/users/<int:user_id>/recipes/random', methods=['GET', 'POST'])
+@bp.route('/users/<int:user_id>/recipes/import', methods=['GET', 'POST'])
+def import_recipes(user_id):
+    """Show import form & add every valid recipe in an uploaded file."""
+
+    if not g.user or g.user.id != user_id:
+        flash('Access unauthorized.', 'danger')
+        return redirect('/')
+
+    form = RecipeImportForm()
+
+    if form.validate_on_submit():
+        upload = form.file.data
+        imported, errors = transfer.import_rows(
+            transfer.read_rows(upload.stream, upload.filename),
+            user_id, batch_size=current_app.config['RECIPE_IMPORT_BATCH'])
+
+        flash(f'{imported} recipes imported.', 'success')
+        if errors:
+            shown = '; '.join(f'line {line}: {error}'
+                              for line, error in errors[:5])
+            flash(f'{len(errors)} rows skipped. {shown}', 'warning')
+        return redirect(f'/users/{user_id}/recipes')
+
+    return render_template('recipes/import.html', form=form)
+
+
+@bp.route('/users/<int:user_id>/recipes/random', methods=['GET', 'POST'])
 def add_random_recipe(user_id):
-    """Add a random recipe to user's list."""
+    """Add a random recipe to user's list.
+
+    A placeholder goes on the list right away; a background job fills it
+    in from Spoonacular.
+    """
 
     if not g.user:
         flash('Please log in first.', 'danger')
         return redirect('/')
 
-    try:
-        tags = (request.args['tags']).lower()
-        res = requests.get(
-            f'{API_BASE_URL}/recipes/random?apiKey={API_KEY}&number=1&tags={tags}')
+    tags = request.args['tags']
+    user_id = g.user.id
 
-        data = res.json()
-        entry = data['recipes'][0]
+    placeholder = Recipe(title=PLACEHOLDER_TITLE, user_id=user_id)
+    db.session.add(placeholder)
+    db.session.flush()
+    recipe_id = placeholder.id
+    db.session.commit()
 
-        title = entry['title']
-        source_url = entry['sourceUrl']
-        image_url = entry['image']
-
-        random_recipe = Recipe(
-            title=title,
-            source_url=source_url,
-            image_url=image_url,
-            user_id=g.user.id
-        )
-
-        db.session.add(random_recipe)
-        g.user.recipes.append(random_recipe)
-        db.session.commit()
+    jobs.get_job_queue().enqueue('fill_random_recipe', recipe_id=recipe_id,
+                                 tags=tags)
 
-        flash('New recipe added.', 'success')
-        return redirect(f'/users/{g.user.id}/recipes')
+    flash('New recipe added. It will be filled in shortly.', 'success')
+    return redirect(f'/users/{user_id}/recipes')
 
-    except IndexError:
-        return render_template('404.html')
 
-
-@app.route('/recipes/<int:recipe_id>')
+@bp.route('/recipes/<int:recipe_id>')
 def show_recipe(recipe_id):
     """Show an added recipe."""
 
@@ -335,11 +579,22 @@ def show_recipe(recipe_id):
         flash('Please log in first.', 'danger')
         return redirect('/')
 
-    recipe = Recipe.query.get_or_404(recipe_id)
-    return render_template('recipes/show.html', recipe=recipe)
+    recipe = (Recipe
+              .query
+              .options(joinedload(Recipe.canonical))
+              .get_or_404(recipe_id))
 
+    # a shared recipe also changes when Spoonacular's copy is refreshed
+    last_modified = recipe.updated_on
+    if recipe.canonical is not None:
+        last_modified = max(last_modified, recipe.canonical.fetched_on)
 
-@app.route('/recipes/<int:recipe_id>/done')
+    return render_if_modified(
+        ('recipe', recipe.id, recipe.updated_on, g.user.id, last_modified),
+        last_modified, 'recipes/show.html', recipe=recipe)
+
+
+@bp.route('/recipes/<int:recipe_id>/done')
 def cooked_recipe(recipe_id):
     """Mark as done after making a recipe."""
 
@@ -347,14 +602,79 @@ def cooked_recipe(recipe_id):
         flash('Please log in first.', 'danger')
         return redirect('/')
 
-    recipe = Recipe.query.filter_by(id=recipe_id).first()
-    recipe.done = not recipe.done
+    user_id = g.user.id
+    if not Recipe.toggle_done(recipe_id, user_id):
+        abort(404)
+    db.session.commit()
+
+    return redirect(f'/users/{user_id}/recipes')
+
+
+@bp.route('/recipes/<int:recipe_id>/done', methods=['POST'])
+def toggle_recipe_done(recipe_id):
+    """Mark as done or not without reloading the list; return JSON."""
+
+    if not g.user:
+        return jsonify(error='Please log in first.'), 401
+    # a JSON body can't come from a plain cross-site form
+    if not request.is_json:
+        abort(415)
+
+    row = Recipe.toggle_done(recipe_id, g.user.id)
+    if not row:
+        return jsonify(error='Recipe not found.'), 404
+    db.session.commit()
+
+    return jsonify(id=row.id, done=row.done,
+                   done_on=row.done_on and row.done_on.isoformat())
+
+
+BATCH_ACTIONS = {
+    'done': lambda ids, user_id: Recipe.set_done(ids, user_id, True),
+    'undone': lambda ids, user_id: Recipe.set_done(ids, user_id, False),
+    'delete': Recipe.delete_many,
+}
+
+
+@bp.route('/recipes/batch', methods=['POST'])
+def batch_recipes():
+    """Mark done, undone or delete many recipes at once; return JSON.
+
+    Takes {"action": ..., "ids": [...]} and returns the ids changed, and
+    those that weren't the user's or didn't exist as missing.
+    """
+
+    if not g.user:
+        return jsonify(error='Please log in first.'), 401
+    # a JSON body can't come from a plain cross-site form
+    if not request.is_json:
+        abort(415)
+
+    data = request.get_json(silent=True) or {}
+    action = BATCH_ACTIONS.get(data.get('action'))
+    ids = data.get('ids')
+    if action is None:
+        return jsonify(error=f'action must be one of '
+                             f'{", ".join(BATCH_ACTIONS)}.'), 400
+    if (not isinstance(ids, list)
+            or not all(type(i) is int for i in ids)
+            or len(ids) > current_app.config['RECIPE_BATCH_MAX']):
+        return jsonify(error=f'ids must be a list of at most '
+                             f'{current_app.config["RECIPE_BATCH_MAX"]} '
+                             f'recipe ids.'), 400
+
+    user_id = g.user.id
+    changed = action(ids, user_id) if ids else []
     db.session.commit()
+    if data['action'] == 'delete' and changed:
+        # deletes touch the user, for the list's Last-Modified
+        forget_user(user_id)
 
-    return redirect(f'/users/{g.user.id}/recipes')
+    return jsonify(action=data['action'], ids=sorted(changed),
+                   missing=sorted(set(ids) - set(changed)))
 
 
-@app.route('/recipes/<int:recipe_id>/edit', methods=['GET', 'POST'])
+@bp.route('/recipes/<int:recipe_id>/edit', methods=['GET', 'POST'])
 def edit_recipe(recipe_id):
     """Show a form to edit an existing recipe."""
 
@@ -362,7 +682,10 @@ def edit_recipe(recipe_id):
         flash('Please log in first.', 'danger')
         return redirect('/')
 
-    recipe = Recipe.query.get_or_404(recipe_id)
+    recipe = (Recipe
+              .query
+              .options(joinedload(Recipe.canonical))
+              .get_or_404(recipe_id))
     form = RecipeForm(obj=recipe)
 
     if form.validate_on_submit():
@@ -379,7 +702,7 @@ def edit_recipe(recipe_id):
     return render_template('recipes/edit.html', form=form, recipe=recipe)
 
 
-@app.route('/recipes/<int:recipe_id>/delete', methods=['GET', 'POST'])
+@bp.route('/recipes/<int:recipe_id>/delete', methods=['GET', 'POST'])
 def delete_recipe(recipe_id):
     """Delete a recipe."""
 
@@ -392,26 +715,94 @@ def delete_recipe(recipe_id):
         flash('Access unauthorized.', 'danger')
         return redirect("/")
 
+    user_id = g.user.id
     db.session.delete(recipe)
+    # the list's Last-Modified must move though no recipe was updated
+    User.touch(user_id)
     db.session.commit()
+    forget_user(user_id)
 
     flash(f"{recipe.title} deleted.", 'danger')
-    return redirect(f'/users/{g.user.id}/recipes')
+    return redirect(f'/users/{user_id}/recipes')
+
+
+################################################################
+# Status
+
+
+@bp.route('/status/cache')
+def cache_status():
+    """Show Spoonacular cache counters for this worker."""
+
+    return jsonify(get_recipe_source().cache.stats())
+
+
+@bp.route('/status/breaker')
+def breaker_status():
+    """Show Spoonacular circuit breaker state for this worker."""
+
+    return jsonify(get_recipe_source().breaker.stats())
+
+
+@bp.route('/status/quota')
+def quota_status():
+    """Show the Spoonacular points left this minute and today."""
+
+    return jsonify(get_recipe_source().quota.remaining())
+
+
+@bp.route('/status/pool')
+def pool_status():
+    """Show prefetch pool buffers for this worker."""
+
+    return jsonify(get_recipe_source().pool.stats())
+
+
+@bp.route('/status/jobs')
+def jobs_status():
+    """Show background job counts for the host."""
+
+    return jsonify(jobs.get_job_queue().stats())
+
+
+@bp.route('/status/db')
+def db_status():
+    """Show database connection pool counters for this worker."""
+
+    return jsonify(pool_stats(db.engine))
+
+
+@bp.route('/metrics')
+def show_metrics():
+    """Show request, SQL and Spoonacular metrics for every worker."""
+
+    return Response(current_app.extensions['metrics'].render(),
+                    mimetype='text/plain; version=0.0.4')
 
 
 ################################################################
 # About and 404 pages
 
 
-@app.route("/about")
+@bp.route("/about")
 def about_page():
     """Show About page."""
 
     return render_template('about.html')
 
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def page_not_found(e):
     """Show 404 page."""
 
     return render_template('404.html'), 404
+
+
+@bp.app_errorhandler(HashingBusy)
+def hashing_busy(e):
+    """Ask the user to retry when the password hashing pool is full."""
+
+    db.session.rollback()
+    flash('We are handling a lot of sign-ins right now. '
+          'Please try again in a moment.', 'warning')
+    return redirect(request.path)
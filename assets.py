@@ -0,0 +1,236 @@
+"""Fingerprinted, precompressed static assets.
+
+Build them before deploying (the Heroku build runs this from
+bin/post_compile):
+
+    python assets.py
+
+Every file under static/ is copied to static/dist/ with a content hash
+in its name, text files get .gz (and, with the brotli package, .br)
+copies next to them, and PNGs are optimized losslessly with oxipng or
+optipng when one is installed, or else with Pillow. Templates link assets through
+asset_url(), which falls back to the plain /static/ URL when there is
+no build, as in development.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import subprocess
+
+from flask import (Blueprint, abort, current_app, request, send_from_directory,
+                   url_for)
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = 'manifest.json'
+
+# worth compressing; images are compressed already
+COMPRESS_TYPES = {'.css', '.js', '.svg', '.ico', '.json', '.txt'}
+
+# best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+bp = Blueprint('assets', __name__)
+
+log = logging.getLogger(__name__)
+
+
+################################################################
+# Build
+
+
+def fingerprint(path):
+    """Return the first 12 hex digits of the file's SHA-256."""
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def optimize_png(path):
+    """Recompress a PNG in place without changing a pixel, if we can.
+
+    Pillow's optimize=True is the fallback: it only retries zlib, so it
+    saves less than oxipng or optipng, but it is always installed.
+    """
+
+    if shutil.which('oxipng'):
+        command = ['oxipng', '--opt', '4', '--strip', 'safe', '--quiet', path]
+    elif shutil.which('optipng'):
+        command = ['optipng', '-o5', '-quiet', path]
+    elif Image is not None:
+        return resave_png(path)
+    else:
+        log.warning('%s: no PNG optimizer (oxipng, optipng or Pillow); '
+                    'left as is', path)
+        return False
+
+    subprocess.run(command, check=True)
+    return True
+
+
+def resave_png(path):
+    """Re-encode a PNG with Pillow, keeping the result only if smaller.
+
+    Pillow reads 16 bits per channel colour PNGs at 8 bits, so those are
+    left alone.
+    """
+
+    with open(path, 'rb') as f:
+        header = f.read(26)
+    # IHDR: bit depth at byte 24, colour type (0 is greyscale) at 25
+    if header[24] == 16 and header[25] != 0:
+        return False
+
+    temp = path + '.tmp'
+    with Image.open(path) as image:
+        image.save(temp, format='PNG', optimize=True)
+    if os.path.getsize(temp) < os.path.getsize(path):
+        os.replace(temp, path)
+        return True
+    os.remove(temp)
+    return False
+
+
+def precompress(path):
+    """Write .gz and .br copies of path, keeping those that are smaller."""
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Fingerprint every static file into dist_dir; return the manifest.
+
+    The manifest maps each file's path under static_dir to its
+    fingerprinted path under dist_dir.
+    """
+
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+    os.makedirs(dist_dir)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d))
+                   != os.path.abspath(dist_dir)]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            stem, ext = os.path.splitext(logical)
+            built = f'{stem}.{fingerprint(source)}{ext}'
+            target = os.path.join(dist_dir, built)
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            if ext.lower() == '.png':
+                optimize_png(target)
+            if ext.lower() in COMPRESS_TYPES:
+                precompress(target)
+            manifest[logical] = built
+
+    with open(os.path.join(dist_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+################################################################
+# Serving
+
+
+def init_app(app):
+    """Load the build manifest and add asset_url() to templates."""
+
+    directory = app.config.get('ASSETS_DIR') or DIST_DIR
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+
+    app.extensions['assets'] = {'directory': directory, 'manifest': manifest}
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.register_blueprint(bp)
+
+
+def asset_url(filename):
+    """Return the URL of a file under static/, fingerprinted if built."""
+
+    built = current_app.extensions['assets']['manifest'].get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.serve_asset', filename=built)
+
+
+@bp.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Serve a fingerprinted asset, precompressed when the client allows.
+
+    The name changes with the content, so clients may keep it forever.
+    """
+
+    assets = current_app.extensions['assets']
+    directory = assets['directory']
+    if filename == MANIFEST:
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    served, encoding = filename, None
+    for candidate, suffix in ENCODINGS:
+        if (request.accept_encodings[candidate]
+                and os.path.isfile(os.path.join(directory,
+                                                filename + suffix))):
+            served, encoding = filename + suffix, candidate
+            break
+
+    response = send_from_directory(directory, served, mimetype=mimetype,
+                                   max_age=current_app.config['ASSET_MAX_AGE'])
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--static-dir', default=STATIC_DIR)
+    parser.add_argument('--dist-dir', default=DIST_DIR)
+    args = parser.parse_args()
+
+    manifest = build(args.static_dir, args.dist_dir)
+    print(f'{len(manifest)} assets built into {args.dist_dir}'
+          + ('' if brotli else ' (no brotli package: gzip only)'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+"""Load benchmark of the main user flows, end to end.
+
+Run it like:
+
+    createdb nomnom_bench
+    python benchmarks/load.py --concurrency 1 4 16 \\
+        --save-baseline benchmarks/baseline.json
+    # ...change something...
+    python benchmarks/load.py --concurrency 1 4 16 \\
+        --baseline benchmarks/baseline.json
+
+The run wipes and seeds `--database-url` with `--users` users holding
+`--recipes` recipes each, starts a local stand-in for api.spoonacular.com
+that answers after `--stub-latency` ms and fails `--stub-error-rate` of
+calls, and serves the app (production profile, CSRF off) on a local port.
+At each concurrency level, that many virtual users register, log in, and
+then repeat search, random add, list, toggle done, edit and delete for
+`--iterations` rounds over HTTP.
+
+Each flow reports p50/p95/p99 latency, error rate and database queries
+per request, and each level its throughput. With --baseline, the run
+exits 1 if any flow's p95 is more than --tolerance slower than the
+baseline, makes more queries per request, or fails more often.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+from flask import g, has_app_context
+from sqlalchemy import event, insert, select
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from config import ProductionConfig  # noqa: E402
+from models import db, hasher, User, Recipe  # noqa: E402
+
+FLOWS = ('register', 'login', 'search', 'random add', 'list', 'toggle done',
+         'edit', 'delete')
+
+TAGS = ('vegetarian', 'vegan', 'dessert', 'keto', 'gluten free', 'pasta',
+        'soup', 'chicken')
+
+PASSWORD = 'benchmark'
+
+# Cache hits make some flows' query counts vary a little between runs; an
+# extra query on every request is a regression
+QUERY_TOLERANCE = 0.5
+
+
+################################################################
+# Spoonacular stand-in
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answer /recipes/random after the server's latency, failing some."""
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+
+        if random.random() < server.error_rate:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        query = parse_qs(urlparse(self.path).query)
+        number = int(query.get('number', ['1'])[0])
+        tags = query.get('tags', [''])[0]
+        recipes = []
+        for _ in range(number):
+            recipe_id = random.randrange(1, 10 ** 7)
+            recipes.append({
+                'id': recipe_id,
+                'title': f'{tags.title() or "Any"} Recipe {recipe_id}',
+                'image': f'https://img.example.com/{recipe_id}.jpg',
+                'sourceUrl': f'https://example.com/recipes/{recipe_id}',
+                'readyInMinutes': random.randrange(10, 120),
+                'servings': random.randrange(1, 8),
+                'dishTypes': ['main course'],
+                'diets': tags.split(','),
+            })
+        body = json.dumps({'recipes': recipes}).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(latency, error_rate):
+    """Start the stub on a free port and return its base URL."""
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    host, port = server.server_address
+    return f'http://{host}:{port}'
+
+
+################################################################
+# App under test
+
+
+def make_app(args, stub_url):
+    """Build the app against the benchmark database and the stub."""
+
+    class BenchmarkConfig(ProductionConfig):
+        SQLALCHEMY_DATABASE_URI = args.database_url
+        WTF_CSRF_ENABLED = False
+        API_KEY = 'benchmark'
+        SPOONACULAR_BASE_URL = stub_url
+        SPOONACULAR_QUOTA_PATH = os.path.join(tempfile.mkdtemp(),
+                                              'quota.sqlite3')
+        SPOONACULAR_QUOTA_PER_MINUTE = 10 ** 9
+        SPOONACULAR_QUOTA_PER_DAY = 10 ** 9
+        RECIPE_POOL_WARM_TAGS = ''
+        JOB_QUEUE_PATH = os.path.join(tempfile.mkdtemp(), 'jobs.sqlite3')
+        BCRYPT_LOG_ROUNDS = args.rounds
+
+    app = create_app(BenchmarkConfig, start_background=True)
+    count_queries(app)
+    return app
+
+
+def count_queries(app):
+    """Report each request's SQL statement count in X-Query-Count."""
+
+    def before_cursor_execute(*args):
+        # background threads (prefetch refills) have no app context
+        if has_app_context():
+            g.query_count = g.get('query_count', 0) + 1
+
+    event.listen(db.get_engine(app), 'before_cursor_execute',
+                 before_cursor_execute)
+
+    @app.after_request
+    def add_query_count(response):
+        response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+        return response
+
+
+def seed(app, users, recipes):
+    """Recreate the tables with users * recipes recipes.
+
+    Returns {user id: [recipe ids]}.
+    """
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        password = hasher.hash(PASSWORD)
+        db.session.execute(insert(User.__table__), [
+            {'id': i, 'first_name': 'Bench', 'last_name': f'User {i}',
+             'email': f'bench{i}@example.com', 'password': password}
+            for i in range(1, users + 1)])
+        db.session.execute(
+            select(db.func.setval('users_id_seq', users)))
+
+        for user_id in range(1, users + 1):
+            db.session.execute(insert(Recipe.__table__), [
+                {'title': f'Seeded Recipe {user_id}-{i}',
+                 'source_url': f'https://example.com/seeded/{user_id}/{i}',
+                 'ingredients': 'flour\nwater\nsalt',
+                 'instructions': 'Mix and bake.',
+                 'done': i % 3 == 0,
+                 'user_id': user_id}
+                for i in range(recipes)])
+        db.session.commit()
+
+        rows = db.session.execute(
+            select(Recipe.id, Recipe.user_id).order_by(Recipe.id))
+        owned = {user_id: [] for user_id in range(1, users + 1)}
+        for recipe_id, user_id in rows:
+            owned[user_id].append(recipe_id)
+        db.session.remove()
+
+    return owned
+
+
+def serve(app):
+    """Serve app on a free local port and return its base URL."""
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+################################################################
+# Virtual users
+
+
+class Recorder:
+    """Collect (seconds, status, queries) samples per flow."""
+
+    def __init__(self):
+        self.samples = {flow: [] for flow in FLOWS}
+        self.lock = threading.Lock()
+
+    def add(self, flow, seconds, status, queries):
+        with self.lock:
+            self.samples[flow].append((seconds, status, queries))
+
+
+class VirtualUser:
+    """One browser session working through the flows."""
+
+    def __init__(self, base_url, recorder, user_id, recipe_ids, name):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.user_id = user_id
+        self.recipe_ids = recipe_ids
+        self.name = name
+        self.session = requests.Session()
+
+    def request(self, flow, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            res = self.session.request(method, self.base_url + path,
+                                       allow_redirects=False, timeout=60,
+                                       **kwargs)
+            status = res.status_code
+            queries = int(res.headers.get('X-Query-Count', 0))
+        except requests.RequestException:
+            status, queries = 599, 0
+        self.recorder.add(flow, time.perf_counter() - start, status, queries)
+
+    def run(self, iterations):
+        self.request('register', 'POST', '/register', data={
+            'first_name': 'New', 'last_name': 'User',
+            'email': f'{self.name}@example.com', 'password': PASSWORD})
+        self.request('register', 'GET', '/logout')
+
+        self.request('login', 'POST', '/login', data={
+            'email': f'bench{self.user_id}@example.com',
+            'password': PASSWORD})
+
+        for _ in range(iterations):
+            tags = random.choice(TAGS)
+            recipe_id = random.choice(self.recipe_ids)
+
+            self.request('search', 'GET', '/recipes',
+                         params={'tags': tags})
+            self.request('random add', 'GET',
+                         f'/users/{self.user_id}/recipes/random',
+                         params={'tags': tags})
+            self.request('list', 'GET', f'/users/{self.user_id}/recipes')
+            self.request('toggle done', 'GET', f'/recipes/{recipe_id}/done')
+            self.request('edit', 'POST', f'/recipes/{recipe_id}/edit', data={
+                'title': f'Edited Recipe {recipe_id}',
+                'source_url': 'https://example.com/edited',
+                'ingredients': 'flour\nwater',
+                'instructions': 'Mix.',
+                'image_url': 'https://img.example.com/edited.jpg'})
+
+            if len(self.recipe_ids) > 1:
+                self.recipe_ids.remove(recipe_id)
+                self.request('delete', 'POST', f'/recipes/{recipe_id}/delete')
+
+
+def run_level(base_url, owned, concurrency, iterations):
+    """Run concurrency virtual users; return (Recorder, wall seconds)."""
+
+    recorder = Recorder()
+    run_id = f'{time.time_ns():x}'
+    users = [VirtualUser(base_url, recorder, user_id, owned[user_id],
+                         f'vu-{run_id}-{user_id}')
+             for user_id in list(owned)[:concurrency]]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as threads:
+        list(threads.map(lambda user: user.run(iterations), users))
+    return recorder, time.perf_counter() - start
+
+
+################################################################
+# Reporting
+
+
+def percentile(sorted_values, pct):
+    """Return the nearest-rank percentile of already sorted values."""
+
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[rank]
+
+
+def summarize(recorder, seconds):
+    """Return {flow: stats} plus the level's throughput."""
+
+    summary = {}
+    total = 0
+    for flow, samples in recorder.samples.items():
+        if not samples:
+            continue
+        total += len(samples)
+        latencies = sorted(sample[0] for sample in samples)
+        errors = sum(1 for sample in samples if sample[1] >= 400)
+        summary[flow] = {
+            'requests': len(samples),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'error_rate': round(errors / len(samples), 4),
+            'queries': round(sum(sample[2] for sample in samples)
+                             / len(samples), 2),
+        }
+    summary['throughput'] = round(total / seconds, 1)
+    return summary
+
+
+def print_level(concurrency, summary):
+    print(f'\nconcurrency {concurrency}: '
+          f'{summary["throughput"]} requests/s')
+    print(f'{"flow":<12} {"requests":>8} {"p50 ms":>8} {"p95 ms":>8} '
+          f'{"p99 ms":>8} {"errors":>7} {"queries":>7}')
+    for flow in FLOWS:
+        if flow not in summary:
+            continue
+        stats = summary[flow]
+        print(f'{flow:<12} {stats["requests"]:>8} {stats["p50_ms"]:>8} '
+              f'{stats["p95_ms"]:>8} {stats["p99_ms"]:>8} '
+              f'{stats["error_rate"]:>7.1%} {stats["queries"]:>7}')
+
+
+def compare(results, baseline, tolerance):
+    """Return a description of every regression against baseline."""
+
+    regressions = []
+    for level, summary in results.items():
+        for flow in FLOWS:
+            old = baseline.get(level, {}).get(flow)
+            new = summary.get(flow)
+            if not old or not new:
+                continue
+
+            where = f'concurrency {level} {flow}'
+            if new['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+                regressions.append(f'{where}: p95 {old["p95_ms"]} ms -> '
+                                   f'{new["p95_ms"]} ms')
+            if new['queries'] > old['queries'] + QUERY_TOLERANCE:
+                regressions.append(f'{where}: queries per request '
+                                   f'{old["queries"]} -> {new["queries"]}')
+            if new['error_rate'] > old['error_rate'] + 0.01:
+                regressions.append(f'{where}: error rate '
+                                   f'{old["error_rate"]:.1%} -> '
+                                   f'{new["error_rate"]:.1%}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url',
+                        default=os.environ.get('BENCH_DATABASE_URL',
+                                               'postgresql:///nomnom_bench'))
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--recipes', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 4, 16])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=12,
+                        help='bcrypt cost for passwords')
+    parser.add_argument('--stub-latency', type=float, default=50,
+                        help='Spoonacular stub latency in ms')
+    parser.add_argument('--stub-error-rate', type=float, default=0.0)
+    parser.add_argument('--baseline')
+    parser.add_argument('--save-baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed p95 slowdown, 0.2 for 20%%')
+    args = parser.parse_args()
+
+    stub_url = start_stub(args.stub_latency / 1000, args.stub_error_rate)
+    app = make_app(args, stub_url)
+    owned = seed(app, max(args.users, max(args.concurrency)), args.recipes)
+    base_url = serve(app)
+
+    results = {}
+    for concurrency in args.concurrency:
+        recorder, seconds = run_level(base_url, owned, concurrency,
+                                      args.iterations)
+        results[str(concurrency)] = summarize(recorder, seconds)
+        print_level(concurrency, results[str(concurrency)])
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f'\nbaseline saved to {args.save_baseline}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('\nregressions against the baseline:')
+            for regression in regressions:
+                print(f'  {regression}')
+            sys.exit(1)
+        print('\nno regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
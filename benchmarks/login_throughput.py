@@ -0,0 +1,68 @@
+"""Benchmark password checks (the CPU cost of a login) per core.
+
+Run it like:
+
+    python benchmarks/login_throughput.py --rounds 10 12 --workers 0 1 2 4
+
+Each run fires `--logins` password checks from `--concurrency` threads,
+standing in for request threads, through a PasswordHasher with the given
+pool size, and reports logins per second overall and per core used.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hashing import PasswordHasher, hash_password  # noqa: E402
+
+
+def run(rounds, workers, logins, concurrency):
+    """Return (seconds, logins per second) for one configuration."""
+
+    hasher = PasswordHasher(rounds=rounds, workers=workers,
+                            max_pending=concurrency, wait=60)
+    hashed = hash_password(b'password', rounds)
+
+    # warm the pool up so process start-up isn't timed
+    hasher.check(hashed, 'password')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as threads:
+        results = list(threads.map(
+            lambda _: hasher.check(hashed, 'password'), range(logins)))
+    seconds = time.perf_counter() - start
+
+    assert all(results)
+    return seconds, logins / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, nargs='+', default=[10, 12])
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    print(f'{cpus} cpus, {args.logins} logins, '
+          f'{args.concurrency} concurrent')
+    print(f'{"rounds":>6} {"workers":>7} {"seconds":>8} '
+          f'{"logins/s":>9} {"per core":>9}')
+
+    for rounds in args.rounds:
+        for workers in args.workers:
+            seconds, rate = run(rounds, workers, args.logins,
+                                args.concurrency)
+            # inline, every request thread may be hashing at once
+            cores = min(workers or args.concurrency, cpus)
+            print(f'{rounds:>6} {workers:>7} {seconds:>8.2f} '
+                  f'{rate:>9.1f} {rate / cores:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Circuit breaker for calls to a flaky upstream service."""
+
+import threading
+import time
+from collections import deque
+
+
+class CircuitBreaker:
+    """Trip on error rate or slow calls over a sliding window of calls.
+
+    While closed, every call is let through and its outcome recorded. Once
+    at least `min_calls` of the last `window_size` calls have been recorded
+    and the share of failed or slow calls reaches `failure_rate`, the
+    breaker opens and `allow()` returns False for `reset_timeout` seconds.
+    After that a single trial call is let through: success closes the
+    breaker, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_rate=0.5, slow_call_seconds=5.0,
+                 window_size=20, min_calls=5, reset_timeout=30,
+                 clock=time.monotonic):
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.rejected = 0
+        self._window = deque(maxlen=window_size)
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go upstream right now."""
+
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+
+            if self.state == self.HALF_OPEN:
+                if self._trial_running:
+                    self.rejected += 1
+                    return False
+                self._trial_running = True
+
+            return True
+
+    def record(self, seconds, ok):
+        """Record the outcome of a call that allow() let through."""
+
+        failed = not ok or seconds >= self.slow_call_seconds
+
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                    self._window.clear()
+                return
+
+            self._window.append(failed)
+            if (len(self._window) >= self.min_calls
+                    and sum(self._window) / len(self._window)
+                    >= self.failure_rate):
+                self._open()
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened_at = self.clock()
+        self._window.clear()
+
+    def stats(self):
+        """Return the breaker state and recent failure count."""
+
+        with self._lock:
+            return {
+                'state': self.state,
+                'recent_calls': len(self._window),
+                'recent_failures': sum(self._window),
+                'rejected': self.rejected,
+            }
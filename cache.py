@@ -0,0 +1,205 @@
+"""Response cache for Spoonacular lookups."""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+def normalize_tags(tags):
+    """Turn a tag string like 'Vegan, dessert ' into a stable cache key."""
+
+    parts = {tag.strip().lower() for tag in (tags or '').split(',')}
+    return ','.join(sorted(tag for tag in parts if tag))
+
+
+class MemoryBackend:
+    """In-process LRU store. Each gunicorn worker gets its own copy."""
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (value, stored_at) for key, or None."""
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, stored_at):
+        """Store value for key, evicting the least recently used entry."""
+
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend:
+    """LRU store in a SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path, max_size=512):
+        self.path = path
+        self.max_size = max_size
+        self._local = threading.local()
+
+    def _conn(self):
+        # sqlite connections can't cross threads or a fork, so keep one
+        # per thread and reopen after gunicorn forks a worker
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'stored_at REAL NOT NULL, used_at REAL NOT NULL)')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS cache_used_at ON cache (used_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Return (value, stored_at) for key, or None."""
+
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT value, stored_at FROM cache WHERE key = ?',
+            (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            'UPDATE cache SET used_at = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, stored_at):
+        """Store value for key, evicting the least recently used entries."""
+
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, stored_at, used_at) '
+            'VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), stored_at, time.time()))
+        conn.execute(
+            'DELETE FROM cache WHERE key NOT IN '
+            '(SELECT key FROM cache ORDER BY used_at DESC LIMIT ?)',
+            (self.max_size,))
+
+    def delete(self, key):
+        self._conn().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._conn().execute('DELETE FROM cache')
+
+
+class ResponseCache:
+    """TTL cache with stale-while-revalidate in front of a backend.
+
+    Entries younger than `ttl` are fresh. Entries up to `ttl + stale_ttl`
+    old are still served, while a background thread fetches a new value.
+    """
+
+    def __init__(self, backend, ttl=300, stale_ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_or_fetch(self, key, fetch, refresh=None):
+        """Return the cached value for key, calling fetch() on a miss.
+
+        A stale entry is refreshed in the background with refresh(), if
+        given, e.g. to fetch at a lower priority than a waiting user's.
+        """
+
+        entry = self.backend.get(key)
+        now = time.time()
+
+        if entry is not None:
+            value, stored_at = entry
+            age = now - stored_at
+            if age < self.ttl:
+                self.hits += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._revalidate(key, refresh or fetch)
+                return value
+
+        self.misses += 1
+        value = fetch()
+        self.backend.set(key, value, now)
+        return value
+
+    def peek(self, key):
+        """Return the cached value for key however old it is, or None."""
+
+        entry = self.backend.get(key)
+        return entry[0] if entry is not None else None
+
+    def _revalidate(self, key, fetch):
+        """Refresh key in the background, once per key at a time."""
+
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.backend.set(key, fetch(), time.time())
+            except Exception:
+                log.exception('Failed to revalidate cache entry %r', key)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def stats(self):
+        """Return hit/miss counters for this worker."""
+
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'refreshing': len(self._refreshing),
+        }
+
+
+def create_cache(config):
+    """Build a ResponseCache from app config."""
+
+    max_size = config['RECIPE_CACHE_MAX_SIZE']
+    if config['RECIPE_CACHE_BACKEND'] == 'sqlite':
+        backend = SQLiteBackend(config['RECIPE_CACHE_PATH'], max_size)
+    else:
+        backend = MemoryBackend(max_size)
+
+    return ResponseCache(
+        backend,
+        ttl=config['RECIPE_CACHE_TTL'],
+        stale_ttl=config['RECIPE_CACHE_STALE_TTL'])
@@ -0,0 +1,102 @@
+"""Local catalog of every recipe received from Spoonacular."""
+
+import datetime
+import logging
+
+from markupsafe import Markup
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import load_only
+
+from models import db, CatalogRecipe
+
+log = logging.getLogger(__name__)
+
+# Columns refreshed when Spoonacular sends a recipe we already have
+UPDATE_COLUMNS = ('title', 'source_url', 'image_url', 'ready_in_minutes',
+                  'servings', 'dish_types', 'diets', 'ingredients',
+                  'instructions', 'fetched_on')
+
+# Details a lighter response (e.g. /recipes/random) may leave out; every
+# list sharing the recipe reads them, so they're never cleared
+KEEP_COLUMNS = ('source_url', 'image_url', 'ingredients', 'instructions')
+
+
+def to_row(entry):
+    """Map a Spoonacular recipe object to a catalog_recipes row."""
+
+    ingredients = [item.get('original') or item.get('name', '')
+                   for item in entry.get('extendedIngredients') or []]
+
+    return {
+        'id': entry['id'],
+        'title': entry['title'],
+        'source_url': entry.get('sourceUrl'),
+        'image_url': entry.get('image'),
+        'ready_in_minutes': entry.get('readyInMinutes'),
+        'servings': entry.get('servings'),
+        'dish_types': ', '.join(entry.get('dishTypes') or []),
+        'diets': ', '.join(entry.get('diets') or []),
+        'ingredients': '\n'.join(ingredients) or None,
+        # Spoonacular sends instructions as HTML
+        'instructions': Markup(entry.get('instructions') or '').striptags()
+        or None,
+        'fetched_on': datetime.datetime.now(),
+    }
+
+
+def to_entry(recipe):
+    """Map a CatalogRecipe back to the Spoonacular shape templates use."""
+
+    return {
+        'id': recipe.id,
+        'title': recipe.title,
+        'image': recipe.image_url,
+        'sourceUrl': recipe.source_url,
+        'readyInMinutes': recipe.ready_in_minutes,
+        'servings': recipe.servings,
+    }
+
+
+def ingest(entries, engine=None):
+    """Upsert Spoonacular recipes into the catalog.
+
+    Runs on its own connection from engine (by default the current app's)
+    rather than the request's session, so it is safe from prefetch threads
+    too. Failures are logged, never raised: the catalog is a by-product of
+    serving the request.
+    """
+
+    rows = [to_row(entry) for entry in entries if entry.get('id')]
+    if not rows:
+        return
+
+    stmt = insert(CatalogRecipe.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['id'],
+        set_={column: (func.coalesce(stmt.excluded[column],
+                                     CatalogRecipe.__table__.c[column])
+                       if column in KEEP_COLUMNS else stmt.excluded[column])
+              for column in UPDATE_COLUMNS})
+
+    try:
+        with (engine or db.engine).begin() as conn:
+            conn.execute(stmt, rows)
+    except Exception:
+        log.exception('Failed to add %d recipes to the catalog', len(rows))
+
+
+def search(text, limit=20):
+    """Return catalog recipes matching text, best match first."""
+
+    query = func.websearch_to_tsquery('english', text)
+
+    return (CatalogRecipe
+            .query
+            .options(load_only('title', 'source_url', 'image_url',
+                               'ready_in_minutes', 'servings'))
+            .filter(CatalogRecipe.search_vector.op('@@')(query))
+            .order_by(func.ts_rank(CatalogRecipe.search_vector, query).desc(),
+                      CatalogRecipe.id)
+            .limit(limit)
+            .all())
@@ -0,0 +1,235 @@
+"""Configuration profiles for the app factory."""
+
+import os
+from dotenv import load_dotenv
+
+from spoonacular import API_BASE_URL
+
+load_dotenv()
+
+DEFAULT_USER_IMG = os.getenv('DEFAULT_USER_IMG')
+DEFAULT_RECIPE_IMG = os.getenv('DEFAULT_RECIPE_IMG')
+
+
+def database_url(default):
+    """Return DATABASE_URL in the form SQLAlchemy expects."""
+
+    uri = os.environ.get('DATABASE_URL', default)
+    if uri.startswith('postgres://'):
+        uri = uri.replace('postgres://', 'postgresql://', 1)
+    return uri
+
+
+class Config:
+    """Settings shared by every profile."""
+
+    API_KEY = os.getenv('API_KEY')
+
+    SQLALCHEMY_DATABASE_URI = database_url('postgresql:///nomnom')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+
+    # Database connections per gunicorn worker: at most POOL_SIZE +
+    # MAX_OVERFLOW, so keep workers * that under the plan's connection
+    # limit. Waiting longer than POOL_TIMEOUT seconds for one is an error.
+    # Set DATABASE_PGBOUNCER when connecting through PgBouncer, which
+    # pools for us. STATEMENT_TIMEOUT is in milliseconds, 0 for none.
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 2))
+    DATABASE_POOL_TIMEOUT = float(os.environ.get('DATABASE_POOL_TIMEOUT', 10))
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))
+    DATABASE_POOL_PRE_PING = os.environ.get(
+        'DATABASE_POOL_PRE_PING', '1') == '1'
+    DATABASE_STATEMENT_TIMEOUT = int(
+        os.environ.get('DATABASE_STATEMENT_TIMEOUT', 30000))
+    DATABASE_PGBOUNCER = os.environ.get('DATABASE_PGBOUNCER', '0') == '1'
+
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'secret_key')
+
+    # Flask-DebugToolbar is only imported and installed when this is set
+    DEBUG_TOOLBAR = False
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+    # Password hashing: bcrypt cost, and how many processes hash passwords
+    # (0 hashes inline). At most BCRYPT_MAX_PENDING hashes run or wait at
+    # once; callers give up after BCRYPT_WAIT seconds.
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    BCRYPT_POOL_SIZE = int(os.environ.get('BCRYPT_POOL_SIZE', 1))
+    BCRYPT_MAX_PENDING = int(os.environ.get('BCRYPT_MAX_PENDING', 4))
+    BCRYPT_WAIT = float(os.environ.get('BCRYPT_WAIT', 5))
+
+    # Logged-in user identity cache, per worker. An edit in one worker
+    # shows up in the others after at most USER_CACHE_TTL seconds.
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+    USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', 1024))
+
+    # Recipes shown per page of a user's list
+    RECIPES_PER_PAGE = int(os.environ.get('RECIPES_PER_PAGE', 50))
+
+    # Fingerprinted static assets built by assets.py (static/dist by
+    # default), and how long clients may keep them
+    ASSETS_DIR = os.environ.get('ASSETS_DIR')
+    ASSET_MAX_AGE = int(os.environ.get('ASSET_MAX_AGE', 365 * 24 * 3600))
+
+    # Image thumbnails: a directory shared by the workers on the host, kept
+    # under THUMBNAIL_CACHE_BYTES. Source images over
+    # THUMBNAIL_MAX_SOURCE_BYTES aren't fetched. Clients keep a thumbnail
+    # for THUMBNAIL_MAX_AGE seconds.
+    THUMBNAIL_DIR = os.environ.get('THUMBNAIL_DIR', '/tmp/nomnom-thumbnails')
+    THUMBNAIL_CACHE_BYTES = int(
+        os.environ.get('THUMBNAIL_CACHE_BYTES', 256 << 20))
+    THUMBNAIL_MAX_SOURCE_BYTES = int(
+        os.environ.get('THUMBNAIL_MAX_SOURCE_BYTES', 10 << 20))
+    THUMBNAIL_MAX_AGE = int(os.environ.get('THUMBNAIL_MAX_AGE', 30 * 24 * 3600))
+    THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY', 80))
+    # Only for tests against a local server
+    THUMBNAIL_ALLOW_PRIVATE_HOSTS = False
+
+    # Most recipes one batch done/undone/delete request may change
+    RECIPE_BATCH_MAX = int(os.environ.get('RECIPE_BATCH_MAX', 500))
+
+    # Recipes per Spoonacular call when enrich.py fills in details, at
+    # most what one call's background quota allows
+    RECIPE_ENRICH_BATCH = int(os.environ.get('RECIPE_ENRICH_BATCH', 100))
+
+    # Bulk import: recipes inserted per statement, and the largest upload
+    # in bytes
+    RECIPE_IMPORT_BATCH = int(os.environ.get('RECIPE_IMPORT_BATCH', 500))
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 16 << 20))
+
+    # Spoonacular HTTP client: timeouts are in seconds
+    SPOONACULAR_BASE_URL = os.environ.get(
+        'SPOONACULAR_BASE_URL', API_BASE_URL)
+    SPOONACULAR_CONNECT_TIMEOUT = float(
+        os.environ.get('SPOONACULAR_CONNECT_TIMEOUT', 3.05))
+    SPOONACULAR_READ_TIMEOUT = float(
+        os.environ.get('SPOONACULAR_READ_TIMEOUT', 10))
+    SPOONACULAR_RETRIES = int(os.environ.get('SPOONACULAR_RETRIES', 2))
+    SPOONACULAR_BACKOFF = float(os.environ.get('SPOONACULAR_BACKOFF', 0.3))
+    SPOONACULAR_POOL_SIZE = int(os.environ.get('SPOONACULAR_POOL_SIZE', 10))
+
+    # Circuit breaker: open when FAILURE_RATE of the last WINDOW calls (at
+    # least MIN_CALLS) failed or took over SLOW_CALL seconds; retry after
+    # RESET seconds
+    SPOONACULAR_BREAKER_FAILURE_RATE = float(
+        os.environ.get('SPOONACULAR_BREAKER_FAILURE_RATE', 0.5))
+    SPOONACULAR_BREAKER_SLOW_CALL = float(
+        os.environ.get('SPOONACULAR_BREAKER_SLOW_CALL', 5))
+    SPOONACULAR_BREAKER_WINDOW = int(
+        os.environ.get('SPOONACULAR_BREAKER_WINDOW', 20))
+    SPOONACULAR_BREAKER_MIN_CALLS = int(
+        os.environ.get('SPOONACULAR_BREAKER_MIN_CALLS', 5))
+    SPOONACULAR_BREAKER_RESET = float(
+        os.environ.get('SPOONACULAR_BREAKER_RESET', 30))
+
+    # Outbound point budget shared by all workers on the host. Background
+    # prefetching must leave BACKGROUND_RESERVE of each budget for users.
+    SPOONACULAR_QUOTA_PATH = os.environ.get(
+        'SPOONACULAR_QUOTA_PATH', '/tmp/nomnom-quota.sqlite3')
+    SPOONACULAR_QUOTA_PER_MINUTE = float(
+        os.environ.get('SPOONACULAR_QUOTA_PER_MINUTE', 60))
+    SPOONACULAR_QUOTA_PER_DAY = float(
+        os.environ.get('SPOONACULAR_QUOTA_PER_DAY', 150))
+    SPOONACULAR_QUOTA_BACKGROUND_RESERVE = float(
+        os.environ.get('SPOONACULAR_QUOTA_BACKGROUND_RESERVE', 0.2))
+
+    # Metrics: each worker writes its totals to METRICS_DIR every
+    # METRICS_FLUSH_INTERVAL seconds, and /metrics adds them up. Clear the
+    # directory when the app is deployed.
+    METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/nomnom-metrics')
+    METRICS_FLUSH_INTERVAL = float(
+        os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+    # Background jobs: a SQLite queue shared by every process on the host,
+    # worked by JOB_WORKER_THREADS threads in each web worker (and by
+    # `python jobs.py`). A job is tried JOB_MAX_ATTEMPTS times, backing off
+    # from JOB_RETRY_BACKOFF seconds; a worker holds a job for JOB_LEASE
+    # seconds before another may take it over. Jobs that failed for good
+    # are kept JOB_FAILED_RETENTION seconds for inspection.
+    JOB_QUEUE_PATH = os.environ.get(
+        'JOB_QUEUE_PATH', '/tmp/nomnom-jobs.sqlite3')
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 1))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF', 2))
+    JOB_LEASE = float(os.environ.get('JOB_LEASE', 60))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+    JOB_FAILED_RETENTION = float(
+        os.environ.get('JOB_FAILED_RETENTION', 7 * 24 * 60 * 60))
+
+    # How many local recipes to keep around for degraded mode
+    FALLBACK_RECIPES = int(os.environ.get('FALLBACK_RECIPES', 50))
+
+    # Spoonacular response cache: 'memory' is per worker, 'sqlite' is
+    # shared by all workers on the host
+    RECIPE_CACHE_BACKEND = os.environ.get('RECIPE_CACHE_BACKEND', 'memory')
+    RECIPE_CACHE_PATH = os.environ.get(
+        'RECIPE_CACHE_PATH', '/tmp/nomnom-cache.sqlite3')
+    RECIPE_CACHE_TTL = int(os.environ.get('RECIPE_CACHE_TTL', 300))
+    RECIPE_CACHE_STALE_TTL = int(
+        os.environ.get('RECIPE_CACHE_STALE_TTL', 3600))
+    RECIPE_CACHE_MAX_SIZE = int(os.environ.get('RECIPE_CACHE_MAX_SIZE', 512))
+    # How many random recipes to ask for per upstream call
+    RECIPE_CACHE_BATCH = int(os.environ.get('RECIPE_CACHE_BATCH', 10))
+
+    # Prefetch pool: refill a tag's buffer with RECIPE_POOL_BATCH recipes
+    # once it drops under RECIPE_POOL_LOW_WATER. Warm tag sets are ';'
+    # separated and fetched at startup.
+    RECIPE_POOL_BATCH = int(os.environ.get('RECIPE_POOL_BATCH', 50))
+    RECIPE_POOL_LOW_WATER = int(os.environ.get('RECIPE_POOL_LOW_WATER', 5))
+    RECIPE_POOL_MAX_KEYS = int(os.environ.get('RECIPE_POOL_MAX_KEYS', 128))
+    RECIPE_POOL_WARM_TAGS = os.environ.get(
+        'RECIPE_POOL_WARM_TAGS', 'vegetarian;vegan;dessert;keto;gluten free')
+
+
+class ProductionConfig(Config):
+    """Heroku: no SQL echo, no debug toolbar."""
+
+
+class DevelopmentConfig(Config):
+    """Local runs with `flask run`."""
+
+    SQLALCHEMY_ECHO = True
+    DEBUG_TOOLBAR = True
+
+
+class TestingConfig(Config):
+    """The test suite: its own database, cheap hashing, no background work."""
+
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'TEST_DATABASE_URL', 'postgresql:///nomnom_test')
+    WTF_CSRF_ENABLED = False
+
+    BCRYPT_LOG_ROUNDS = 4
+    BCRYPT_POOL_SIZE = 0
+    SPOONACULAR_QUOTA_PATH = '/tmp/nomnom-quota-test.sqlite3'
+    METRICS_DIR = '/tmp/nomnom-metrics-test'
+    THUMBNAIL_DIR = '/tmp/nomnom-thumbnails-test'
+    JOB_QUEUE_PATH = '/tmp/nomnom-jobs-test.sqlite3'
+    # tests run jobs themselves with run_once
+    JOB_WORKER_THREADS = 0
+    RECIPE_CACHE_BACKEND = 'memory'
+    RECIPE_POOL_WARM_TAGS = ''
+
+
+PROFILES = {
+    'production': ProductionConfig,
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+}
+
+
+def get_config(config=None):
+    """Return the config class for a profile name, class, or the environment.
+
+    Without an argument the profile comes from NOMNOM_CONFIG, then
+    FLASK_ENV, and defaults to production.
+    """
+
+    if config is None:
+        config = (os.environ.get('NOMNOM_CONFIG')
+                  or os.environ.get('FLASK_ENV')
+                  or 'production')
+    if isinstance(config, str):
+        return PROFILES[config]
+    return config
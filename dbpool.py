@@ -0,0 +1,138 @@
+"""Database connection pool settings and counters."""
+
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+class PoolMetrics:
+    """Checkout counters for one worker's pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def checked_out(self, seconds):
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def timed_out(self, seconds):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def stats(self):
+        with self._lock:
+            waits = self.checkouts + self.timeouts
+            return {
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': round(self.wait_seconds, 6),
+                'wait_seconds_avg': round(self.wait_seconds / waits, 6)
+                if waits else 0.0,
+                'wait_seconds_max': round(self.max_wait_seconds, 6),
+            }
+
+
+class MeteredPool:
+    """Pool mixin that times every checkout and counts connections in use.
+
+    The counters survive engine.dispose(), which swaps in a new pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeout:
+            self.metrics.timed_out(time.perf_counter() - start)
+            raise
+        self.metrics.checked_out(time.perf_counter() - start)
+        return conn
+
+    def _do_return_conn(self, conn):
+        self.metrics.checked_in()
+        super()._do_return_conn(conn)
+
+
+class MeteredQueuePool(MeteredPool, QueuePool):
+    """QueuePool with checkout metrics."""
+
+
+class MeteredNullPool(MeteredPool, NullPool):
+    """NullPool (a connection per checkout) with checkout metrics."""
+
+
+def engine_options(config):
+    """Return SQLALCHEMY_ENGINE_OPTIONS for the DATABASE_* settings.
+
+    Normally each worker keeps its own pool of DATABASE_POOL_SIZE
+    connections plus up to DATABASE_MAX_OVERFLOW more under load. With
+    DATABASE_PGBOUNCER set, PgBouncer does the pooling: the worker opens a
+    connection per checkout and sends no startup options, which PgBouncer
+    rejects, so the statement timeout has to be set on the database role.
+    """
+
+    if config['DATABASE_PGBOUNCER']:
+        return {'poolclass': MeteredNullPool}
+
+    options = {
+        'poolclass': MeteredQueuePool,
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+    }
+
+    timeout = config['DATABASE_STATEMENT_TIMEOUT']
+    if timeout:
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={timeout}'}
+
+    return options
+
+
+def pool_stats(engine):
+    """Return pool settings and counters for engine's pool."""
+
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'idle': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': pool._max_overflow,
+        })
+
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is not None:
+        stats.update(metrics.stats())
+
+    return stats
@@ -0,0 +1,195 @@
+"""Fill in missing ingredients and instructions from Spoonacular, in bulk.
+
+Canonical recipes on anyone's list that lack details are fetched
+batch_size at a time from /recipes/informationBulk, and each batch is
+written back with one catalog upsert. Every user's copy reads from
+there, so the work scales with unique recipes, not with adds. Backfill
+the existing table with
+
+    python enrich.py
+
+Recipes saved from Spoonacular before we kept its ids are first linked
+to the catalog, by the recipe id in their Spoonacular image URL or else
+by source URL. Recipes users typed in are never linked; those still
+missing details are counted as unlinked.
+"""
+
+import argparse
+import logging
+
+from sqlalchemy import and_, case, exists, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+
+import catalog
+from models import db, Recipe, CatalogRecipe
+from quota import BACKGROUND
+from spoonacular import SpoonacularError
+
+log = logging.getLogger(__name__)
+
+# Spoonacular serves a recipe's image as recipeImages/<id>-<size>.<ext>
+IMAGE_ID = r'^https?://[a-z.]*spoonacular\.com/recipeImages/([0-9]+)-'
+# an image Spoonacular hosts, which a recipe typed in by hand won't have
+SPOONACULAR_IMAGE = r'^https?://[a-z.]*spoonacular\.com/'
+
+
+def missing(column):
+    return func.coalesce(column, '') == ''
+
+
+def link_catalog():
+    """Point recipes saved from Spoonacular before we kept ids at the
+    catalog.
+
+    The id is read from the recipe's Spoonacular image URL, adding a
+    catalog row from the title, URL and image it was saved with if
+    there's none; else the source URL is looked up in the catalog.
+    Details that match the catalog's, or are empty, are cleared so the
+    recipe reads the shared copy; the user's edits stay. Returns how
+    many recipes were linked. Doesn't commit.
+    """
+
+    recipes = Recipe.__table__
+    canonical = CatalogRecipe.__table__
+    image_id = func.substring(recipes.c.image_url, IMAGE_ID).cast(db.Integer)
+    legacy = and_(recipes.c.spoonacular_id.is_(None),
+                  recipes.c.image_url.op('~')(SPOONACULAR_IMAGE))
+
+    found = (select(image_id, recipes.c.title, recipes.c.source_url,
+                    recipes.c.image_url, func.now())
+             .where(legacy, recipes.c.image_url.op('~')(IMAGE_ID))
+             .distinct(image_id)
+             .order_by(image_id, recipes.c.id))
+    db.session.execute(
+        insert(canonical)
+        .from_select(['id', 'title', 'source_url', 'image_url',
+                      'fetched_on'], found)
+        .on_conflict_do_nothing(index_elements=['id']))
+
+    def fold(column):
+        own = recipes.c[column]
+        return case((or_(missing(own), own == canonical.c[column]), None),
+                    else_=own)
+
+    values = {column: fold(column) for column in Recipe.SHARED_COLUMNS}
+    linked = 0
+    for match in (canonical.c.id == image_id,
+                  and_(recipes.c.source_url == canonical.c.source_url,
+                       recipes.c.source_url != '')):
+        stmt = (recipes.update()
+                .where(legacy, match)
+                .values(spoonacular_id=canonical.c.id, **values))
+        linked += db.session.execute(stmt).rowcount
+    return linked
+
+
+def unlinked_count():
+    """Count recipes without a Spoonacular id that are missing details,
+    which enrichment can't fill in."""
+
+    return (Recipe.query
+            .filter(Recipe.spoonacular_id.is_(None),
+                    or_(missing(Recipe.own_ingredients),
+                        missing(Recipe.own_instructions)))
+            .count())
+
+
+def pending_ids(after=0, limit=100):
+    """Return ids over after of listed catalog recipes missing details."""
+
+    recipes = Recipe.__table__
+    canonical = CatalogRecipe.__table__
+    stmt = (select(canonical.c.id)
+            .where(canonical.c.id > after,
+                   or_(missing(canonical.c.ingredients),
+                       missing(canonical.c.instructions)),
+                   exists().where(recipes.c.spoonacular_id
+                                  == canonical.c.id))
+            .order_by(canonical.c.id)
+            .limit(limit))
+    return db.session.execute(stmt).scalars().all()
+
+
+def fetch_details(client, ids):
+    """Fetch ids from Spoonacular into the catalog in one call and one
+    upsert. Returns how many recipes came back."""
+
+    entries = client.information_bulk(ids, priority=BACKGROUND)
+    catalog.ingest(entries)
+    return len(entries)
+
+
+def enrich(client, batch_size=100, limit=None):
+    """Enrich every listed recipe missing details, batch_size at a time.
+
+    Batches are capped at what one call's background quota allows.
+    Stops early after limit ids, or when Spoonacular fails or the quota
+    runs out; run it again later to carry on. Returns counts of what was
+    done, and the error it stopped on if any.
+    """
+
+    # a bigger batch than the background quota allows is always denied
+    most = client.bulk_limit(BACKGROUND)
+    if most is not None:
+        batch_size = min(batch_size, most)
+
+    stats = {'linked': link_catalog(), 'unlinked': unlinked_count(),
+             'batches': 0, 'fetched': 0, 'error': None}
+    db.session.commit()
+    if stats['unlinked']:
+        log.warning('%d recipes without a Spoonacular id are missing '
+                    'details and were skipped', stats['unlinked'])
+
+    after = 0
+    seen = 0
+    while limit is None or seen < limit:
+        size = batch_size if limit is None else min(batch_size, limit - seen)
+        ids = pending_ids(after, size)
+        # nothing else to read in this transaction
+        db.session.commit()
+        if not ids:
+            break
+
+        try:
+            stats['fetched'] += fetch_details(client, ids)
+        except SpoonacularError as exc:
+            stats['error'] = str(exc)
+            break
+
+        stats['batches'] += 1
+        # ids Spoonacular had nothing for stay missing; move past them
+        after = ids[-1]
+        seen += len(ids)
+
+    return stats
+
+
+def main():
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', help='config profile (default: from '
+                        'NOMNOM_CONFIG or FLASK_ENV, else production)')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='recipes per Spoonacular call '
+                        '(default: RECIPE_ENRICH_BATCH)')
+    parser.add_argument('--limit', type=int,
+                        help='stop after this many Spoonacular ids')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    app = create_app(args.config)
+    with app.app_context():
+        stats = enrich(app.extensions['recipe_source'].client,
+                       batch_size=(args.batch_size
+                                   or app.config['RECIPE_ENRICH_BATCH']),
+                       limit=args.limit)
+
+    print(f"{stats['fetched']} recipes enriched in {stats['batches']} "
+          f"batches ({stats['linked']} linked, {stats['unlinked']} "
+          f"without a Spoonacular id skipped)"
+          + (f"; stopped: {stats['error']}" if stats['error'] else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,9 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, PasswordField, TextAreaField
 from wtforms.fields.html5 import EmailField, URLField
 from wtforms.validators import InputRequired, Length, Optional, URL, Email
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-DEFAULT_USER_IMG = os.getenv('DEFAULT_USER_IMG')
-DEFAULT_RECIPE_IMG = os.getenv('DEFAULT_RECIPE_IMG')
+from config import DEFAULT_USER_IMG, DEFAULT_RECIPE_IMG
 
 class RegisterForm(FlaskForm):
     """Form for user sign up"""
@@ -19,6 +14,12 @@ class RegisterForm(FlaskForm):
     password = PasswordField('New Password', validators=[InputRequired(), Length(min=6)])
     
 
+class UserEditForm(RegisterForm):
+    """Form for editing a user's profile"""
+
+    image_url = URLField('Image URL', validators=[Optional(), URL()], default=DEFAULT_USER_IMG)
+
+
 class LoginForm(FlaskForm):
     """Form for user login"""
 
@@ -29,8 +30,14 @@ class LoginForm(FlaskForm):
 class RecipeForm(FlaskForm):
     """Form for adding a recipe"""
 
-    title = StringField('Title (Required)', validators=[InputRequired()])
+    title = StringField('Title (Required)', validators=[InputRequired(), Length(max=100)])
     source_url = URLField('Source URL', validators=[Optional(), URL()])
     ingredients = TextAreaField('Ingredients', validators=[Optional()])
     instructions = TextAreaField('Intructions/Notes', validators=[Optional()])
     image_url = URLField('Image URL', validators=[Optional(), URL()], default=DEFAULT_RECIPE_IMG)
+
+
+class RecipeImportForm(FlaskForm):
+    """Form for importing recipes from an export file"""
+
+    file = FileField('CSV or NDJSON file', validators=[FileRequired(), FileAllowed(['csv', 'ndjson', 'jsonl', 'json'])])
@@ -0,0 +1,108 @@
+"""Password hashing, kept off the request worker's CPU."""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+
+class HashingBusy(Exception):
+    """Too many passwords are waiting to be hashed; try again shortly."""
+
+
+def hash_password(password, rounds):
+    """Return the bcrypt hash of password as a str."""
+
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf8')
+
+
+def check_password(hashed, password):
+    """Return True if password matches the bcrypt hash."""
+
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_rounds(hashed):
+    """Return the cost factor of a bcrypt hash like '$2b$12$...'."""
+
+    return int(hashed.split('$')[2])
+
+
+class PasswordHasher:
+    """bcrypt in a bounded process pool with backpressure.
+
+    With `workers` set, hashing runs in that many child processes and at
+    most `max_pending` hashes may be running or queued at once. A caller
+    that can't get a slot within `wait` seconds gets HashingBusy instead of
+    piling onto an overloaded pool. With `workers` at 0, hashing runs
+    inline.
+    """
+
+    def __init__(self, rounds=12, workers=0, max_pending=None, wait=5):
+        self.configure(rounds, workers, max_pending, wait)
+
+    def init_app(self, app):
+        """Configure from BCRYPT_* app config."""
+
+        self.configure(app.config.get('BCRYPT_LOG_ROUNDS', 12),
+                       app.config.get('BCRYPT_POOL_SIZE', 0),
+                       app.config.get('BCRYPT_MAX_PENDING'),
+                       app.config.get('BCRYPT_WAIT', 5))
+
+    def configure(self, rounds, workers, max_pending=None, wait=5):
+        """Set the cost and pool size, replacing any running pool."""
+
+        old = getattr(self, '_executor', None)
+        if old is not None:
+            old.shutdown(wait=False)
+
+        self.rounds = rounds
+        self.workers = workers
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(
+            max_pending or max(workers, 1) * 4)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # a pool doesn't survive a fork, so make one per gunicorn worker
+        with self._lock:
+            if self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(self.workers)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        if not self._slots.acquire(timeout=self.wait):
+            raise HashingBusy()
+        try:
+            return self._pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Return the bcrypt hash of password at the configured cost."""
+
+        if not password:
+            raise ValueError('Password must be non-empty.')
+
+        return self._run(hash_password, password.encode('utf8'), self.rounds)
+
+    def check(self, hashed, password):
+        """Return True if password matches hashed."""
+
+        if not password:
+            return False
+
+        return self._run(check_password, hashed.encode('utf8'),
+                         password.encode('utf8'))
+
+    def needs_rehash(self, hashed):
+        """Return True if hashed was made at a different cost."""
+
+        return hash_rounds(hashed) != self.rounds
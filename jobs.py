@@ -0,0 +1,247 @@
+"""Background jobs in a SQLite queue shared by every process on the host.
+
+Requests enqueue() work and return at once. Worker threads in each
+gunicorn worker (JOB_WORKER_THREADS), or a standalone process started
+with
+
+    python jobs.py
+
+claim jobs one at a time, run them in the app context and retry
+failures with jittered exponential backoff. A job whose worker died is
+claimed again once its lease runs out, so handlers must be safe to run
+twice.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+
+log = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FAILED = 'failed'
+
+Job = namedtuple('Job', 'id kind payload attempts')
+
+
+class JobQueue:
+    """Jobs kept in a SQLite file, with their handlers.
+
+    Register a handler for each kind of job; it is called with the
+    job's payload as keyword arguments. After max_attempts failures the
+    job's on_failure handler, if any, is called the same way and the job
+    is kept as failed for failed_retention seconds.
+    """
+
+    def __init__(self, path, max_attempts=5, backoff=2, lease=60,
+                 poll_interval=1, failed_retention=7 * 24 * 60 * 60,
+                 clock=time.time):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.failed_retention = failed_retention
+        self.clock = clock
+        self.handlers = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._workers_pid = None
+
+    def _conn(self):
+        # one connection per thread, reopened after gunicorn forks
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'kind TEXT NOT NULL, payload TEXT NOT NULL, '
+                'status TEXT NOT NULL, attempts INTEGER NOT NULL, '
+                'run_at REAL NOT NULL, created_at REAL NOT NULL, error TEXT)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at '
+                         'ON jobs (status, run_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def register(self, kind, handler, on_failure=None):
+        """Run handler(**payload) for jobs of kind."""
+
+        self.handlers[kind] = (handler, on_failure)
+
+    def enqueue(self, kind, **payload):
+        """Queue a job to run as soon as a worker is free; return its id."""
+
+        now = self.clock()
+        cursor = self._conn().execute(
+            'INSERT INTO jobs (kind, payload, status, attempts, run_at, '
+            'created_at) VALUES (?, ?, ?, 0, ?, ?)',
+            (kind, json.dumps(payload), QUEUED, now, now))
+        return cursor.lastrowid
+
+    def claim(self):
+        """Lease the next job that is due, or return None."""
+
+        now = self.clock()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # a running job past its lease belongs to a worker that died
+            row = conn.execute(
+                'SELECT id, kind, payload, attempts FROM jobs '
+                'WHERE status IN (?, ?) AND run_at <= ? '
+                'ORDER BY run_at, id LIMIT 1',
+                (QUEUED, RUNNING, now)).fetchone()
+            if row is not None:
+                conn.execute(
+                    'UPDATE jobs SET status = ?, attempts = attempts + 1, '
+                    'run_at = ? WHERE id = ?',
+                    (RUNNING, now + self.lease, row[0]))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        if row is None:
+            return None
+        job_id, kind, payload, attempts = row
+        return Job(job_id, kind, json.loads(payload), attempts + 1)
+
+    def complete(self, job):
+        self._conn().execute('DELETE FROM jobs WHERE id = ?', (job.id,))
+
+    def retry(self, job, error):
+        """Queue job again after a backoff; return False once it's given up."""
+
+        if job.attempts >= self.max_attempts:
+            # a failed job's run_at is when it failed; each new failure
+            # drops those past their retention
+            now = self.clock()
+            conn = self._conn()
+            conn.execute(
+                'UPDATE jobs SET status = ?, run_at = ?, error = ? '
+                'WHERE id = ?', (FAILED, now, error, job.id))
+            conn.execute('DELETE FROM jobs WHERE status = ? AND run_at < ?',
+                         (FAILED, now - self.failed_retention))
+            return False
+
+        # full jitter keeps retrying workers from moving in step
+        delay = random.uniform(0, self.backoff * 2 ** job.attempts)
+        self._conn().execute(
+            'UPDATE jobs SET status = ?, run_at = ?, error = ? WHERE id = ?',
+            (QUEUED, self.clock() + delay, error, job.id))
+        return True
+
+    def run_once(self, app):
+        """Run the next due job inside app's context; return False if none."""
+
+        job = self.claim()
+        if job is None:
+            return False
+
+        handler, on_failure = self.handlers.get(job.kind, (None, None))
+        try:
+            if handler is None:
+                raise LookupError(f'no handler for {job.kind!r} jobs')
+            with app.app_context():
+                handler(**job.payload)
+        except Exception as exc:
+            log.warning('Job %d (%s) attempt %d failed: %s', job.id,
+                        job.kind, job.attempts, exc)
+            if not self.retry(job, f'{type(exc).__name__}: {exc}'):
+                log.error('Job %d (%s) failed for good', job.id, job.kind)
+                if on_failure is not None:
+                    with app.app_context():
+                        on_failure(**job.payload)
+        else:
+            self.complete(job)
+        return True
+
+    def run(self, app, stop=None):
+        """Run jobs until stop is set, polling when the queue is empty."""
+
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                ran = self.run_once(app)
+            except Exception:
+                log.exception('Job worker error')
+                ran = False
+            if not ran:
+                stop.wait(self.poll_interval)
+
+    def start_workers(self, app, threads):
+        """Start worker threads in this process, once per process."""
+
+        # threads don't survive a fork, so start them per gunicorn worker
+        with self._lock:
+            if threads < 1 or self._workers_pid == os.getpid():
+                return
+            self._workers_pid = os.getpid()
+
+        for _ in range(threads):
+            threading.Thread(target=self.run, args=(app,), daemon=True).start()
+
+    def stats(self):
+        """Return job counts by status and the oldest due job's wait."""
+
+        conn = self._conn()
+        counts = dict(conn.execute(
+            'SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        oldest = conn.execute(
+            'SELECT MIN(run_at) FROM jobs WHERE status = ?',
+            (QUEUED,)).fetchone()[0]
+        return {
+            'queued': counts.get(QUEUED, 0),
+            'running': counts.get(RUNNING, 0),
+            'failed': counts.get(FAILED, 0),
+            'oldest_wait': (round(max(0, self.clock() - oldest), 2)
+                            if oldest is not None else 0),
+        }
+
+
+def create_queue(app):
+    """Build app's job queue from its config."""
+
+    config = app.config
+    return JobQueue(
+        config['JOB_QUEUE_PATH'],
+        max_attempts=config['JOB_MAX_ATTEMPTS'],
+        backoff=config['JOB_RETRY_BACKOFF'],
+        lease=config['JOB_LEASE'],
+        poll_interval=config['JOB_POLL_INTERVAL'],
+        failed_retention=config['JOB_FAILED_RETENTION'])
+
+
+def get_job_queue():
+    """Return the current app's JobQueue."""
+
+    return current_app.extensions['jobs']
+
+
+def main():
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description='Run background jobs.')
+    parser.add_argument('--config', help='config profile (default: from '
+                        'NOMNOM_CONFIG or FLASK_ENV, else production)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    app = create_app(args.config)
+    app.extensions['jobs'].run(app)
+
+
+if __name__ == '__main__':
+    main()
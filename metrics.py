@@ -0,0 +1,377 @@
+"""Request, SQL and Spoonacular metrics in the Prometheus text format.
+
+Each gunicorn worker counts in memory and writes its totals to its own
+file in a shared directory every few seconds. /metrics adds up every
+file, so a scrape that lands on any worker sees the whole host. Counts
+of workers that have exited are kept in one exited.json file.
+"""
+
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+
+from models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# name: (type, help)
+METRICS = {
+    'nomnom_requests_total': (
+        'counter', 'Requests by route, method and status.'),
+    'nomnom_request_seconds': (
+        'histogram', 'Request latency by route and method.'),
+    'nomnom_request_sql_queries': (
+        'histogram', 'SQL statements per request by route.'),
+    'nomnom_request_sql_seconds': (
+        'histogram', 'Time in SQL per request by route.'),
+    'nomnom_spoonacular_requests_total': (
+        'counter', 'Spoonacular attempts by path and status.'),
+    'nomnom_spoonacular_errors_total': (
+        'counter', 'Spoonacular attempts that failed or got an error status.'),
+    'nomnom_spoonacular_request_seconds': (
+        'histogram', 'Spoonacular attempt latency by path.'),
+}
+
+BUCKETS = {
+    'nomnom_request_seconds': LATENCY_BUCKETS,
+    'nomnom_request_sql_queries': QUERY_BUCKETS,
+    'nomnom_request_sql_seconds': LATENCY_BUCKETS,
+    'nomnom_spoonacular_request_seconds': LATENCY_BUCKETS,
+}
+
+
+def label_key(labels):
+    """Return labels as a hashable, JSON-friendly sorted list of pairs."""
+
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def pid_alive(pid):
+    """Return True if a process with pid is running on this host."""
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # someone else's process
+        return True
+    return True
+
+
+def read_json(path):
+    """Return a metrics file's contents, or None if it's missing or torn."""
+
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def add_up(counters, histograms, data):
+    """Add a snapshot() dict's counts into counters and histograms."""
+
+    if data is None:
+        return
+    for name, labels, value in data['counters']:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, counts in data['histograms']:
+        key = (name, tuple(map(tuple, labels)))
+        total = histograms.setdefault(key, [0] * len(counts))
+        for i, count in enumerate(counts):
+            total[i] += count
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = [(k, v.replace('\\', r'\\').replace('"', r'\"')
+                .replace('\n', r'\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metrics:
+    """One worker's counters and histograms, shared through files.
+
+    Counts made before a fork stay with the parent: a worker starts from
+    zero the first time it records anything.
+    """
+
+    def __init__(self, directory, flush_interval=5):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        self.counters = {}
+        # key: [count per bucket..., +Inf count, sum]
+        self.histograms = {}
+        self._pid = os.getpid()
+        self._flusher = None
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def inc(self, name, labels, value=1):
+        """Add value to a counter."""
+
+        with self._lock:
+            self._check_pid()
+            key = (name, label_key(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+        self._ensure_flusher()
+
+    def observe(self, name, labels, value):
+        """Record value in a histogram."""
+
+        buckets = BUCKETS[name]
+        with self._lock:
+            self._check_pid()
+            key = (name, label_key(labels))
+            counts = self.histograms.get(key)
+            if counts is None:
+                counts = self.histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+        self._ensure_flusher()
+
+    ################################################################
+    # Sharing between workers
+
+    def path(self):
+        # one file per process, and per app in case a process has several
+        return os.path.join(self.directory,
+                            f'worker-{os.getpid()}-{id(self):x}.json')
+
+    def snapshot(self):
+        """Return this worker's totals as JSON-friendly lists."""
+
+        with self._lock:
+            self._check_pid()
+            return {
+                'counters': [[name, labels, value] for (name, labels), value
+                             in self.counters.items()],
+                'histograms': [[name, labels, list(counts)]
+                               for (name, labels), counts
+                               in self.histograms.items()],
+            }
+
+    def flush(self):
+        """Write this worker's totals to its file."""
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path()
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        # readers never see a half-written file
+        os.replace(tmp, path)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_forever,
+                                             daemon=True)
+            self._flusher.start()
+
+    def _flush_forever(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def collect(self):
+        """Return (counters, histograms) summed over every worker's file.
+
+        An exited worker's file is folded into the exited-workers totals
+        rather than dropped, so counters never go backwards when gunicorn
+        replaces a worker.
+        """
+
+        self.flush()
+
+        counters = {}
+        histograms = {}
+        # one collector at a time, so a retiring file is counted once
+        with open(os.path.join(self.directory, 'exited.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            for path in glob.glob(os.path.join(self.directory, 'worker-*')):
+                # worker-<pid>-<id>.json, or .json.tmp mid-write
+                try:
+                    pid = int(os.path.basename(path).split('-')[1])
+                except (IndexError, ValueError):
+                    continue
+                if not pid_alive(pid):
+                    self._retire(path)
+                    continue
+                if path.endswith('.json'):
+                    add_up(counters, histograms, read_json(path))
+
+            add_up(counters, histograms, read_json(self._exited_path()))
+
+        return counters, histograms
+
+    def _exited_path(self):
+        return os.path.join(self.directory, 'exited.json')
+
+    def _retire(self, path):
+        """Add an exited worker's file to the exited totals and delete it.
+
+        Called with the collect lock held.
+        """
+
+        if path.endswith('.json'):
+            data = read_json(path)
+            if data is not None:
+                counters = {}
+                histograms = {}
+                add_up(counters, histograms, read_json(self._exited_path()))
+                add_up(counters, histograms, data)
+
+                exited = self._exited_path()
+                tmp = f'{exited}.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump({
+                        'counters': [[name, labels, value]
+                                     for (name, labels), value
+                                     in counters.items()],
+                        'histograms': [[name, labels, counts]
+                                       for (name, labels), counts
+                                       in histograms.items()],
+                    }, f)
+                os.replace(tmp, exited)
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def render(self):
+        """Return every worker's metrics in the Prometheus text format."""
+
+        counters, histograms = self.collect()
+        lines = []
+
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{format_labels(labels)} '
+                                     f'{format_value(value)}')
+                continue
+
+            for (metric, labels), counts in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(BUCKETS[name], counts):
+                    le = labels + (('le', format_value(bound)),)
+                    lines.append(f'{name}_bucket{format_labels(le)} {count}')
+                le = labels + (('le', '+Inf'),)
+                lines.append(f'{name}_bucket{format_labels(le)} {counts[-2]}')
+                lines.append(f'{name}_count{format_labels(labels)} '
+                             f'{counts[-2]}')
+                lines.append(f'{name}_sum{format_labels(labels)} '
+                             f'{format_value(counts[-1])}')
+
+        return '\n'.join(lines) + '\n'
+
+    ################################################################
+    # Instrumentation
+
+    def init_app(self, app):
+        """Time every request of app and the SQL it runs."""
+
+        engine = db.get_engine(app)
+        event.listen(engine, 'before_cursor_execute', self._before_sql)
+        event.listen(engine, 'after_cursor_execute', self._after_sql)
+        event.listen(engine, 'handle_error', self._sql_error)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['metrics'] = self
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+
+    def _after_request(self, response):
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.inc('nomnom_requests_total', {
+            'route': route, 'method': request.method,
+            'status': response.status_code})
+        self.observe('nomnom_request_seconds',
+                     {'route': route, 'method': request.method},
+                     time.perf_counter() - start)
+        self.observe('nomnom_request_sql_queries', {'route': route},
+                     g.sql_queries)
+        self.observe('nomnom_request_sql_seconds', {'route': route},
+                     g.sql_seconds)
+        return response
+
+    def _before_sql(self, conn, cursor, statement, parameters, context,
+                    executemany):
+        # by statement, so one that fails can't leave a start time behind
+        # for the next one on this pooled connection to pick up
+        conn.info.setdefault('metrics_start', {})[
+            id(context if context is not None else cursor)] = (
+            time.perf_counter())
+
+    def _after_sql(self, conn, cursor, statement, parameters, context,
+                   executemany):
+        start = conn.info.get('metrics_start', {}).pop(
+            id(context if context is not None else cursor), None)
+        # background threads (prefetch refills) belong to no request
+        if start is not None and has_app_context() and 'sql_queries' in g:
+            g.sql_queries += 1
+            g.sql_seconds += time.perf_counter() - start
+
+    def _sql_error(self, context):
+        # a failed statement never reaches after_cursor_execute
+        if (context.connection is not None
+                and context.execution_context is not None):
+            context.connection.info.get('metrics_start', {}).pop(
+                id(context.execution_context), None)
+
+    def record_spoonacular(self, path, seconds, status, error):
+        """SpoonacularClient listener: count and time every attempt."""
+
+        self.inc('nomnom_spoonacular_requests_total',
+                 {'path': path, 'status': status or 'error'})
+        self.observe('nomnom_spoonacular_request_seconds', {'path': path},
+                     seconds)
+        if error is not None or status >= 400:
+            self.inc('nomnom_spoonacular_errors_total', {'path': path})
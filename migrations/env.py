@@ -74,6 +74,10 @@ def run_migrations_online():
     connectable = current_app.extensions['migrate'].db.get_engine()
 
     with connectable.connect() as connection:
+        # the app's statement_timeout would cancel long index builds and
+        # backfills partway, leaving invalid indexes behind
+        connection.exec_driver_sql('SET statement_timeout = 0')
+
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
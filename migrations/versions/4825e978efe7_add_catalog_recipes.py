@@ -0,0 +1,54 @@
+"""Add catalog_recipes with a full-text search index.
+
+Revision ID: 4825e978efe7
+Revises: fc1e566daf55
+Create Date: 2026-10-18 10:02:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '4825e978efe7'
+down_revision = 'fc1e566daf55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'catalog_recipes',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('title', sa.Text(), nullable=False),
+        sa.Column('source_url', sa.Text(), nullable=True),
+        sa.Column('image_url', sa.Text(), nullable=True),
+        sa.Column('ready_in_minutes', sa.Integer(), nullable=True),
+        sa.Column('servings', sa.Integer(), nullable=True),
+        sa.Column('dish_types', sa.Text(), nullable=True),
+        sa.Column('diets', sa.Text(), nullable=True),
+        sa.Column('ingredients', sa.Text(), nullable=True),
+        sa.Column('instructions', sa.Text(), nullable=True),
+        sa.Column('fetched_on', sa.DateTime(), nullable=False),
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector('english', coalesce(dish_types, '') "
+                "|| ' ' || coalesce(diets, '')), 'B') || "
+                "setweight(to_tsvector('english', coalesce(ingredients, '')), 'C')",
+                persisted=True),
+            nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_catalog_recipes_search_vector', 'catalog_recipes',
+                    ['search_vector'], unique=False,
+                    postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_catalog_recipes_search_vector',
+                  table_name='catalog_recipes')
+    op.drop_table('catalog_recipes')
@@ -0,0 +1,41 @@
+"""Add indexes for per-user recipe lists.
+
+Revision ID: 7fa0716abf75
+Revises: 4825e978efe7
+Create Date: 2026-10-18 10:41:07.530612
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7fa0716abf75'
+down_revision = '4825e978efe7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # rows from before done had a default would slip past the pending index
+    op.execute('UPDATE recipes SET done = false WHERE done IS NULL')
+
+    # build without locking writes on a live table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_recipes_user_id_created_on', 'recipes',
+            ['user_id', sa.text('created_on DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True)
+        op.create_index(
+            'ix_recipes_user_id_created_on_pending', 'recipes',
+            ['user_id', sa.text('created_on DESC'), sa.text('id DESC')],
+            postgresql_where=sa.text('NOT done'),
+            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_recipes_user_id_created_on_pending',
+                      table_name='recipes', postgresql_concurrently=True)
+        op.drop_index('ix_recipes_user_id_created_on',
+                      table_name='recipes', postgresql_concurrently=True)
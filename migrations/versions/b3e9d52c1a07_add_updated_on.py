@@ -0,0 +1,30 @@
+"""Add updated_on to users and recipes.
+
+Revision ID: b3e9d52c1a07
+Revises: 7fa0716abf75
+Create Date: 2026-10-18 21:12:44.190321
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e9d52c1a07'
+down_revision = '7fa0716abf75'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('users', 'recipes'):
+        # existing rows count as changed now; the app sets it from here on
+        op.add_column(table, sa.Column('updated_on', sa.DateTime(),
+                                       nullable=False,
+                                       server_default=sa.func.now()))
+        op.alter_column(table, 'updated_on', server_default=None)
+
+
+def downgrade():
+    op.drop_column('recipes', 'updated_on')
+    op.drop_column('users', 'updated_on')
@@ -0,0 +1,27 @@
+"""Delete a user's recipes in the database when the user is deleted.
+
+Revision ID: d81f4a7e2c95
+Revises: b3e9d52c1a07
+Create Date: 2026-10-18 23:40:12.518204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81f4a7e2c95'
+down_revision = 'b3e9d52c1a07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint('recipes_user_id_fkey', 'recipes', type_='foreignkey')
+    op.create_foreign_key('recipes_user_id_fkey', 'recipes', 'users',
+                          ['user_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('recipes_user_id_fkey', 'recipes', type_='foreignkey')
+    op.create_foreign_key('recipes_user_id_fkey', 'recipes', 'users',
+                          ['user_id'], ['id'])
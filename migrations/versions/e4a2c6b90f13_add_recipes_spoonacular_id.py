@@ -0,0 +1,28 @@
+"""Add the Spoonacular id to recipes.
+
+Revision ID: e4a2c6b90f13
+Revises: d81f4a7e2c95
+Create Date: 2026-10-19 01:05:37.402116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a2c6b90f13'
+down_revision = 'd81f4a7e2c95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('recipes', sa.Column('spoonacular_id', sa.Integer(),
+                                       nullable=True))
+    op.create_index('ix_recipes_spoonacular_id', 'recipes',
+                    ['spoonacular_id'])
+
+
+def downgrade():
+    op.drop_index('ix_recipes_spoonacular_id', table_name='recipes')
+    op.drop_column('recipes', 'spoonacular_id')
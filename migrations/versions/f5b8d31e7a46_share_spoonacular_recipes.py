@@ -0,0 +1,118 @@
+"""Store Spoonacular recipes once, in catalog_recipes, for every user.
+
+A user's recipe from Spoonacular keeps its own state and edits; its
+details are read from catalog_recipes, so copies that match it are
+cleared.
+
+Recipes added by the random recipe button before we kept Spoonacular
+ids are recognised by their image, which Spoonacular serves as
+recipeImages/<id>-<size>.<ext>; each user's copy of the same recipe is
+folded into one shared row, from only the title, URL and image
+Spoonacular sent. Recipes users typed in themselves are never linked,
+and legacy rows without a Spoonacular image stay as they are.
+
+Revision ID: f5b8d31e7a46
+Revises: e4a2c6b90f13
+Create Date: 2026-10-19 02:26:51.730458
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5b8d31e7a46'
+down_revision = 'e4a2c6b90f13'
+branch_labels = None
+depends_on = None
+
+SHARED_COLUMNS = ('source_url', 'image_url', 'ingredients', 'instructions')
+
+# the recipe id in a Spoonacular image URL
+SPOONACULAR_IMAGE = (r'^https?://([a-z]+\.)?spoonacular\.com/recipeImages/'
+                     r'([0-9]+)-')
+# any image Spoonacular hosts, which a recipe typed in by hand won't have
+SPOONACULAR_HOST = r'^https?://([a-z0-9-]+\.)?spoonacular\.com/'
+
+
+def upgrade():
+    # Spoonacular recipes we only know from users' lists; the most
+    # complete copy becomes the canonical one
+    op.execute("""
+        INSERT INTO catalog_recipes
+            (id, title, source_url, image_url, ingredients, instructions,
+             fetched_on)
+        SELECT DISTINCT ON (spoonacular_id)
+               spoonacular_id, title, source_url, image_url, ingredients,
+               instructions, now()
+        FROM recipes
+        WHERE spoonacular_id IS NOT NULL
+        ORDER BY spoonacular_id,
+                 coalesce(ingredients, '') = '',
+                 coalesce(instructions, '') = '',
+                 id
+        ON CONFLICT (id) DO NOTHING
+    """)
+
+    # recipes saved from Spoonacular before we kept its id carry it in
+    # their image URL
+    op.execute(f"""
+        UPDATE recipes
+        SET spoonacular_id = (regexp_match(image_url,
+                                           '{SPOONACULAR_IMAGE}'))[2]
+                             ::integer
+        WHERE spoonacular_id IS NULL
+          AND image_url ~ '{SPOONACULAR_IMAGE}'
+    """)
+
+    # those saved only what Spoonacular sent: title, URL and image; any
+    # ingredients or instructions are the user's own and stay theirs
+    op.execute("""
+        INSERT INTO catalog_recipes (id, title, source_url, image_url,
+                                     fetched_on)
+        SELECT DISTINCT ON (spoonacular_id)
+               spoonacular_id, title, source_url, image_url, now()
+        FROM recipes
+        WHERE spoonacular_id IS NOT NULL
+        ORDER BY spoonacular_id, id
+        ON CONFLICT (id) DO NOTHING
+    """)
+
+    # the rest by source URL, if Spoonacular hosts their image
+    op.execute(f"""
+        UPDATE recipes
+        SET spoonacular_id = c.id
+        FROM catalog_recipes c
+        WHERE recipes.spoonacular_id IS NULL
+          AND recipes.image_url ~ '{SPOONACULAR_HOST}'
+          AND recipes.source_url <> ''
+          AND recipes.source_url = c.source_url
+    """)
+
+    # fold copies into the canonical recipe, keeping users' edits
+    folds = ', '.join(
+        f"{column} = CASE WHEN coalesce(r.{column}, '') = '' "
+        f"OR r.{column} = c.{column} THEN NULL ELSE r.{column} END"
+        for column in SHARED_COLUMNS)
+    op.execute(f"""
+        UPDATE recipes r
+        SET {folds}
+        FROM catalog_recipes c
+        WHERE r.spoonacular_id = c.id
+    """)
+
+    op.create_foreign_key('recipes_spoonacular_id_fkey', 'recipes',
+                          'catalog_recipes', ['spoonacular_id'], ['id'])
+
+
+def downgrade():
+    op.drop_constraint('recipes_spoonacular_id_fkey', 'recipes',
+                       type_='foreignkey')
+
+    copies = ', '.join(f'{column} = coalesce(r.{column}, c.{column})'
+                       for column in SHARED_COLUMNS)
+    op.execute(f"""
+        UPDATE recipes r
+        SET {copies}
+        FROM catalog_recipes c
+        WHERE r.spoonacular_id = c.id
+    """)
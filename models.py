@@ -2,24 +2,25 @@
 
 import datetime
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
-import os
-from dotenv import load_dotenv
+from hashing import PasswordHasher
+from dbpool import engine_options
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import make_transient_to_detached
+from config import DEFAULT_USER_IMG, DEFAULT_RECIPE_IMG
 
 db = SQLAlchemy()
-bcrypt = Bcrypt()
+hasher = PasswordHasher()
 
 
 def connect_db(app):
     """Connect to database."""
 
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                          engine_options(app.config))
     db.app = app
     db.init_app(app)
-
-load_dotenv()
-
-DEFAULT_USER_IMG = os.getenv('DEFAULT_USER_IMG')
-DEFAULT_RECIPE_IMG = os.getenv('DEFAULT_RECIPE_IMG')
+    hasher.init_app(app)
 
 
 class User(db.Model):
@@ -33,11 +34,19 @@ class User(db.Model):
     email = db.Column(db.String(100), unique=True, nullable=False)
     password = db.Column(db.String(100), nullable=False)
     image_url = db.Column(db.Text, default=DEFAULT_USER_IMG)
+    updated_on = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.datetime.now,
+        onupdate=datetime.datetime.now
+    )
 
+    # the database deletes a user's recipes with the user
     recipes = db.relationship(
         'Recipe',
         backref='user',
-        cascade='all, delete-orphan')
+        cascade='all, delete-orphan',
+        passive_deletes=True)
 
     @property
     def full_name(self):
@@ -45,54 +54,264 @@ class User(db.Model):
 
         return f'{self.first_name} {self.last_name}'
 
+    # columns safe to cache for the logged-in user; password stays out
+    IDENTITY_COLUMNS = ('id', 'first_name', 'last_name', 'email', 'image_url',
+                        'updated_on')
+
+    def identity(self):
+        """Return the cacheable columns of user as a dict."""
+
+        return {column: getattr(self, column)
+                for column in self.IDENTITY_COLUMNS}
+
+    @classmethod
+    def from_identity(cls, identity):
+        """Return the user for an identity() dict without a query.
+
+        The user is attached to the session as if it had been loaded, so it
+        can be updated or deleted. Columns left out of the identity are
+        loaded on first access.
+        """
+
+        user = cls(**identity)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    @classmethod
+    def touch(cls, user_id):
+        """Move a user's updated_on to now. Doesn't commit.
+
+        For changes to their list that no remaining recipe's updated_on
+        shows, such as a delete, so the list's Last-Modified moves too.
+        """
+
+        table = cls.__table__
+        db.session.execute(db.update(table)
+                           .where(table.c.id == user_id)
+                           .values(updated_on=datetime.datetime.now()))
+
     @classmethod
     def register(cls, first_name, last_name, email, pwd):
         """Register user with hashed password & return user."""
 
-        hashed = bcrypt.generate_password_hash(pwd)
-        # turn bytestring into normal (unicode utf8) string
-        hashed_utf8 = hashed.decode('utf8')
+        hashed = hasher.hash(pwd)
 
         # return instance of user with email & hashed pwd
         return cls(
             first_name=first_name,
             last_name=last_name,
             email=email,
-            password=hashed_utf8,
+            password=hashed,
             )
 
     @classmethod
     def authenticate(cls, email, pwd):
         """Validate that user exists & password is correct.
     
-        Return user if valid; else return False.
+        Return user if valid; else return False. Passwords hashed at an
+        old cost are rehashed at the current one.
         """
 
         u = User.query.filter_by(email=email).first()
 
-        if u and bcrypt.check_password_hash(u.password, pwd):
+        if u and hasher.check(u.password, pwd):
+            if hasher.needs_rehash(u.password):
+                u.password = hasher.hash(pwd)
+                db.session.commit()
             # return user instance
             return u
         else:
             return False
 
 
+def shared_column(name):
+    """Recipe attribute read from the canonical recipe unless overridden.
+
+    The recipe's own column holds the user's edits. Setting the
+    canonical value clears it again, so an edit that changes nothing
+    stores nothing.
+    """
+
+    own = f'own_{name}'
+
+    def fget(self):
+        value = getattr(self, own)
+        if value is None and self.canonical is not None:
+            return getattr(self.canonical, name)
+        return value
+
+    def fset(self, value):
+        if (self.canonical is not None
+                and value == getattr(self.canonical, name)):
+            value = None
+        setattr(self, own, value)
+
+    def expr(cls):
+        canonical = CatalogRecipe.__table__
+        return db.func.coalesce(
+            getattr(cls, own),
+            db.select(canonical.c[name])
+            .where(canonical.c.id == cls.spoonacular_id)
+            .scalar_subquery())
+
+    return hybrid_property(fget, fset, expr=expr)
+
+
 class Recipe(db.Model):
-    """Recipe input from user."""
+    """A recipe on a user's list.
+
+    Recipes from Spoonacular point at their canonical CatalogRecipe,
+    stored once for every user, and keep only the user's own state and
+    edits here. Recipes users write themselves keep everything here.
+    """
 
     __tablename__ = 'recipes'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    # stays here for every recipe: the list shows it without a join
     title = db.Column(db.String(100), nullable=False)
+    own_source_url = db.Column('source_url', db.Text)
+    own_ingredients = db.Column('ingredients', db.Text)
+    own_instructions = db.Column('instructions', db.Text)
+    own_image_url = db.Column('image_url', db.Text,
+                              default=DEFAULT_RECIPE_IMG)
+    created_on = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.datetime.now
+    )
+    done = db.Column(db.Boolean, default=False)
+    done_on = db.Column(db.DateTime)
+    updated_on = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.datetime.now,
+        onupdate=datetime.datetime.now
+    )
+
+    user_id = db.Column(db.Integer,
+                        db.ForeignKey('users.id', ondelete='CASCADE'),
+                        nullable=False)
+    # Spoonacular's id, when the recipe came from there
+    spoonacular_id = db.Column(db.Integer,
+                               db.ForeignKey('catalog_recipes.id'),
+                               index=True)
+
+    canonical = db.relationship('CatalogRecipe')
+
+    # columns read from the canonical recipe when not set here
+    SHARED_COLUMNS = ('source_url', 'image_url', 'ingredients',
+                      'instructions')
+
+    source_url = shared_column('source_url')
+    image_url = shared_column('image_url')
+    ingredients = shared_column('ingredients')
+    instructions = shared_column('instructions')
+
+    __table_args__ = (
+        # a user's list, newest first, paged by (created_on, id)
+        db.Index('ix_recipes_user_id_created_on',
+                 user_id, created_on.desc(), id.desc()),
+        # the same for recipes not cooked yet
+        db.Index('ix_recipes_user_id_created_on_pending',
+                 user_id, created_on.desc(), id.desc(),
+                 postgresql_where=db.not_(done)),
+    )
+
+    @classmethod
+    def toggle_done(cls, recipe_id, user_id):
+        """Flip a user's recipe between cooked and not in one UPDATE.
+
+        Returns the new (id, done, done_on), or None if the user has no such
+        recipe. Doesn't commit.
+        """
+
+        table = cls.__table__
+        was_done = db.func.coalesce(table.c.done, False)
+        now = datetime.datetime.now()
+
+        # SET reads the old row, so concurrent clicks can't both see it
+        # undone
+        stmt = (db.update(table)
+                .where(table.c.id == recipe_id, table.c.user_id == user_id)
+                .values(done=db.not_(was_done),
+                        done_on=db.case((was_done, db.null()), else_=now),
+                        updated_on=now)
+                .returning(table.c.id, table.c.done, table.c.done_on))
+        return db.session.execute(stmt).first()
+
+    @classmethod
+    def set_done(cls, recipe_ids, user_id, done):
+        """Mark a user's recipes cooked or not in one UPDATE.
+
+        Recipes already cooked keep their done_on. Returns the ids
+        updated; ids the user doesn't own are left alone. Doesn't commit.
+        """
+
+        table = cls.__table__
+        now = datetime.datetime.now()
+        done_on = (db.case((db.func.coalesce(table.c.done, False),
+                            table.c.done_on), else_=now)
+                   if done else db.null())
+
+        stmt = (db.update(table)
+                .where(table.c.user_id == user_id,
+                       table.c.id.in_(recipe_ids))
+                .values(done=done, done_on=done_on, updated_on=now)
+                .returning(table.c.id))
+        return [row.id for row in db.session.execute(stmt)]
+
+    @classmethod
+    def delete_many(cls, recipe_ids, user_id):
+        """Delete a user's recipes in one DELETE and return their ids.
+
+        Ids the user doesn't own are left alone. Touches the user when
+        any go. Doesn't commit.
+        """
+
+        table = cls.__table__
+        stmt = (db.delete(table)
+                .where(table.c.user_id == user_id,
+                       table.c.id.in_(recipe_ids))
+                .returning(table.c.id))
+        deleted = [row.id for row in db.session.execute(stmt)]
+        if deleted:
+            User.touch(user_id)
+        return deleted
+
+
+class CatalogRecipe(db.Model):
+    """Recipe received from Spoonacular, kept for local search."""
+
+    __tablename__ = 'catalog_recipes'
+
+    # Spoonacular's recipe id
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.Text, nullable=False)
     source_url = db.Column(db.Text)
+    image_url = db.Column(db.Text)
+    ready_in_minutes = db.Column(db.Integer)
+    servings = db.Column(db.Integer)
+    dish_types = db.Column(db.Text)
+    diets = db.Column(db.Text)
     ingredients = db.Column(db.Text)
     instructions = db.Column(db.Text)
-    image_url = db.Column(db.Text, default=DEFAULT_RECIPE_IMG)
-    created_on = db.Column(
+    fetched_on = db.Column(
         db.DateTime,
         nullable=False,
         default=datetime.datetime.now
     )
-    done = db.Column(db.Boolean, default=False)
 
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    search_vector = db.Column(
+        TSVECTOR,
+        db.Computed(
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(dish_types, '') "
+            "|| ' ' || coalesce(diets, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(ingredients, '')), 'C')",
+            persisted=True))
+
+    __table_args__ = (
+        db.Index('ix_catalog_recipes_search_vector', search_vector,
+                 postgresql_using='gin'),
+    )
@@ -0,0 +1,116 @@
+"""Background prefetch pool of random Spoonacular recipes."""
+
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict, deque
+
+from cache import normalize_tags
+
+log = logging.getLogger(__name__)
+
+
+class RecipePool:
+    """Per-tag buffers of prefetched random recipes.
+
+    Requests pop recipes from local memory. When a buffer drops under
+    `low_water`, a background thread asks upstream for `batch_size` more.
+    Each recipe is handed out once, so results stay random.
+    """
+
+    def __init__(self, fetch, batch_size=50, low_water=5, max_keys=128):
+        self.fetch = fetch
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self.max_keys = max_keys
+        self.hits = 0
+        self.misses = 0
+        self._buffers = OrderedDict()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker_pid = None
+
+    def pop(self, tags):
+        """Return a prefetched recipe for tags, or None if the buffer is dry."""
+
+        key = normalize_tags(tags)
+
+        with self._lock:
+            buffer = self._buffers.get(key)
+            recipe = buffer.popleft() if buffer else None
+            remaining = len(buffer) if buffer else 0
+            if recipe is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._buffers.move_to_end(key)
+
+        if remaining < self.low_water:
+            self.request_refill(key)
+
+        return recipe
+
+    def request_refill(self, tags):
+        """Queue a background refill for tags unless one is already pending."""
+
+        key = normalize_tags(tags)
+
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+
+        self._ensure_worker()
+        self._queue.put(key)
+
+    def warm(self, tag_sets):
+        """Queue a refill for each tag set, e.g. popular tags at startup."""
+
+        for tags in tag_sets:
+            self.request_refill(tags)
+
+    def refill(self, key):
+        """Fetch a batch for key and add it to its buffer."""
+
+        try:
+            recipes = self.fetch(key, self.batch_size)
+        except Exception:
+            log.exception('Failed to prefetch recipes for %r', key)
+            recipes = []
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+        with self._lock:
+            buffer = self._buffers.setdefault(key, deque())
+            buffer.extend(recipes)
+            self._buffers.move_to_end(key)
+            while len(self._buffers) > self.max_keys:
+                self._buffers.popitem(last=False)
+
+    def _ensure_worker(self):
+        # threads don't survive a fork, so start one per gunicorn worker
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._worker_pid = os.getpid()
+
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.refill(self._queue.get())
+
+    def stats(self):
+        """Return buffer sizes and hit/miss counters for this worker."""
+
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'buffered': {key: len(buf)
+                             for key, buf in self._buffers.items()},
+                'pending': len(self._pending),
+            }
@@ -0,0 +1,127 @@
+"""Outbound Spoonacular quota, shared by every worker on the host."""
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+USER = 'user'
+BACKGROUND = 'background'
+
+
+class QuotaLimiter:
+    """Token bucket per minute plus a daily budget, kept in a SQLite file.
+
+    Spoonacular bills in points and resets the daily count at midnight UTC.
+    User-initiated calls may spend the whole budget. Background calls
+    (prefetching) must leave `background_reserve` of both budgets unspent,
+    so they can never starve a user waiting on a page.
+    """
+
+    def __init__(self, path, per_minute=60, per_day=150,
+                 background_reserve=0.2, clock=time.time):
+        self.path = path
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.background_reserve = background_reserve
+        self.clock = clock
+        self.denied = 0
+        self._local = threading.local()
+
+    def _conn(self):
+        # one connection per thread, reopened after gunicorn forks
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS quota ('
+                'id INTEGER PRIMARY KEY CHECK (id = 1), '
+                'tokens REAL NOT NULL, updated_at REAL NOT NULL, '
+                'day TEXT NOT NULL, used_today REAL NOT NULL)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _update(self, change):
+        """Apply change(tokens, used_today) -> (tokens, used_today, result)
+        to the refilled bucket inside one write transaction."""
+
+        now = self.clock()
+        today = datetime.datetime.fromtimestamp(
+            now, datetime.timezone.utc).date().isoformat()
+
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at, day, used_today FROM quota').fetchone()
+            if row is None:
+                tokens, used_today = self.per_minute, 0
+            else:
+                tokens, updated_at, day, used_today = row
+                tokens = min(self.per_minute, tokens
+                             + (now - updated_at) * self.per_minute / 60)
+                if day != today:
+                    used_today = 0
+
+            tokens, used_today, result = change(tokens, used_today)
+
+            conn.execute(
+                'INSERT OR REPLACE INTO quota '
+                '(id, tokens, updated_at, day, used_today) '
+                'VALUES (1, ?, ?, ?, ?)',
+                (tokens, now, today, used_today))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        return result
+
+    def acquire(self, cost=1, priority=USER):
+        """Spend cost points if the budget allows; return True if spent."""
+
+        reserve = self.background_reserve if priority == BACKGROUND else 0
+
+        def change(tokens, used_today):
+            if (tokens - cost < self.per_minute * reserve
+                    or self.per_day - used_today - cost
+                    < self.per_day * reserve):
+                return tokens, used_today, False
+            return tokens - cost, used_today + cost, True
+
+        acquired = self._update(change)
+        if not acquired:
+            self.denied += 1
+        return acquired
+
+    def largest(self, priority=USER):
+        """Return the most points one call at priority can ever spend."""
+
+        reserve = self.background_reserve if priority == BACKGROUND else 0
+        return min(self.per_minute - self.per_minute * reserve,
+                   self.per_day - self.per_day * reserve)
+
+    def release(self, cost=1):
+        """Give back points for a call that never went out."""
+
+        self._update(lambda tokens, used_today: (
+            min(self.per_minute, tokens + cost),
+            max(0, used_today - cost),
+            None))
+
+    def remaining(self):
+        """Return the points left this minute and today."""
+
+        tokens, used_today = self._update(
+            lambda tokens, used_today: (tokens, used_today,
+                                        (tokens, used_today)))
+        return {
+            'minute': round(tokens, 2),
+            'day': round(self.per_day - used_today, 2),
+            'per_minute': self.per_minute,
+            'per_day': self.per_day,
+            'denied': self.denied,
+        }
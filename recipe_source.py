@@ -0,0 +1,213 @@
+"""Random recipes from Spoonacular, with everything that sits in front."""
+
+import logging
+import random
+
+from flask import current_app, flash
+
+import catalog
+from breaker import CircuitBreaker
+from cache import create_cache, normalize_tags, ResponseCache, MemoryBackend
+from config import DEFAULT_RECIPE_IMG
+from models import db, Recipe, CatalogRecipe
+from prefetch import RecipePool
+from quota import QuotaLimiter, USER, BACKGROUND
+from spoonacular import SpoonacularClient, SpoonacularError
+
+log = logging.getLogger(__name__)
+
+# Title of a recipe added to a list before the job filling it in has run
+PLACEHOLDER_TITLE = 'Finding a recipe...'
+
+
+class RecipeSource:
+    """One app's Spoonacular client, breaker, quota, cache and prefetch pool.
+
+    Built by the app factory and kept in app.extensions['recipe_source'].
+    """
+
+    def __init__(self, app):
+        config = app.config
+        self.app = app
+        self.cache_batch = config['RECIPE_CACHE_BATCH']
+        self.fallback_size = config['FALLBACK_RECIPES']
+
+        self.breaker = CircuitBreaker(
+            failure_rate=config['SPOONACULAR_BREAKER_FAILURE_RATE'],
+            slow_call_seconds=config['SPOONACULAR_BREAKER_SLOW_CALL'],
+            window_size=config['SPOONACULAR_BREAKER_WINDOW'],
+            min_calls=config['SPOONACULAR_BREAKER_MIN_CALLS'],
+            reset_timeout=config['SPOONACULAR_BREAKER_RESET'])
+
+        self.quota = QuotaLimiter(
+            config['SPOONACULAR_QUOTA_PATH'],
+            per_minute=config['SPOONACULAR_QUOTA_PER_MINUTE'],
+            per_day=config['SPOONACULAR_QUOTA_PER_DAY'],
+            background_reserve=config['SPOONACULAR_QUOTA_BACKGROUND_RESERVE'])
+
+        self.client = SpoonacularClient(
+            config['API_KEY'],
+            base_url=config['SPOONACULAR_BASE_URL'],
+            connect_timeout=config['SPOONACULAR_CONNECT_TIMEOUT'],
+            read_timeout=config['SPOONACULAR_READ_TIMEOUT'],
+            retries=config['SPOONACULAR_RETRIES'],
+            backoff=config['SPOONACULAR_BACKOFF'],
+            pool_size=config['SPOONACULAR_POOL_SIZE'],
+            breaker=self.breaker,
+            quota=self.quota)
+
+        self.cache = create_cache(config)
+
+        # Local recipes for degraded mode. No stale window, so a refresh
+        # never runs on a background thread outside the app context.
+        self.fallback_cache = ResponseCache(MemoryBackend(max_size=1),
+                                            ttl=config['RECIPE_CACHE_TTL'],
+                                            stale_ttl=0)
+
+        self.pool = RecipePool(
+            self.prefetch,
+            batch_size=config['RECIPE_POOL_BATCH'],
+            low_water=config['RECIPE_POOL_LOW_WATER'],
+            max_keys=config['RECIPE_POOL_MAX_KEYS'])
+
+    def fetch(self, tags, number, priority=USER):
+        """Ask Spoonacular for a batch of random recipes matching tags."""
+
+        recipes = self.client.random_recipes(tags, number, priority)
+        # own connection from this app's engine, safe from any thread
+        catalog.ingest(recipes, engine=db.get_engine(self.app))
+        return recipes
+
+    def prefetch(self, tags, number):
+        """Like fetch, at background quota priority."""
+
+        return self.fetch(tags, number, priority=BACKGROUND)
+
+    def warm(self):
+        """Start filling the pool for the configured popular tag sets."""
+
+        tag_sets = [tags for tags
+                    in self.app.config['RECIPE_POOL_WARM_TAGS'].split(';')
+                    if tags]
+        if self.app.config['API_KEY'] and tag_sets:
+            self.pool.warm(tag_sets)
+
+    def random_recipe(self, tags):
+        """Return one random recipe matching tags.
+
+        Served from the prefetch pool when it has one buffered, else from
+        the response cache. If Spoonacular is failing, falls back to a
+        recipe we already know. Raises IndexError when nothing matches.
+        """
+
+        key = normalize_tags(tags)
+
+        recipe = self.pool.pop(key)
+        if recipe is not None:
+            return recipe
+
+        try:
+            recipes = self.cache.get_or_fetch(
+                key, lambda: self.fetch(key, self.cache_batch),
+                refresh=lambda: self.prefetch(key, self.cache_batch))
+        except SpoonacularError as exc:
+            log.warning('Serving degraded recipe: %s', exc)
+            flash('Recipe search is running in limited mode right now.',
+                  'warning')
+            recipes = self.degraded_recipes(key)
+
+        return random.choice(recipes)
+
+    def degraded_recipes(self, key):
+        """Return recipes we already know for normalized tags key."""
+
+        return (self.cache.peek(key)
+                or [catalog.to_entry(recipe) for recipe
+                    in catalog.search(key.replace(',', ' '))]
+                or self.fallback_recipes())
+
+    def fill_random_recipe(self, recipe_id, tags):
+        """Job: fill in placeholder recipe_id with a random recipe for tags.
+
+        Raises SpoonacularError while Spoonacular is failing, so the job
+        is retried. Deletes the placeholder if nothing matches tags.
+        """
+
+        key = normalize_tags(tags)
+        recipe = Recipe.query.get(recipe_id)
+        # deleted meanwhile, or filled by an earlier run of the job
+        if recipe is None or recipe.title != PLACEHOLDER_TITLE:
+            return
+
+        entry = self.pool.pop(key)
+        if entry is None:
+            recipes = self.cache.get_or_fetch(
+                key, lambda: self.fetch(key, self.cache_batch),
+                refresh=lambda: self.prefetch(key, self.cache_batch))
+            entry = random.choice(recipes) if recipes else None
+
+        fill_placeholder(recipe, entry)
+
+    def fill_degraded_recipe(self, recipe_id, tags):
+        """Job failure handler: fill recipe_id from recipes we know."""
+
+        recipe = Recipe.query.get(recipe_id)
+        if recipe is None or recipe.title != PLACEHOLDER_TITLE:
+            return
+
+        recipes = self.degraded_recipes(normalize_tags(tags))
+        fill_placeholder(recipe, random.choice(recipes) if recipes else None)
+
+    def fallback_recipes(self):
+        """Return locally known recipes shaped like Spoonacular results.
+
+        Drawn from the catalog of what Spoonacular has sent us, never from
+        recipes users typed in, which are theirs alone. Cached, so a
+        Spoonacular outage costs one query per cache TTL per worker rather
+        than one per request.
+        """
+
+        def load():
+            recipes = (CatalogRecipe
+                       .query
+                       .filter(CatalogRecipe.source_url.isnot(None),
+                               CatalogRecipe.source_url != '')
+                       .order_by(CatalogRecipe.fetched_on.desc())
+                       .limit(self.fallback_size)
+                       .all())
+
+            return [catalog.to_entry(recipe) for recipe in recipes]
+
+        return self.fallback_cache.get_or_fetch('recipes', load)
+
+
+def fill_placeholder(recipe, entry):
+    """Copy a Spoonacular recipe into recipe and commit, or delete recipe
+    if there is none."""
+
+    if entry is None:
+        db.session.delete(recipe)
+        db.session.commit()
+        return
+
+    row = catalog.to_row({'id': None, **entry})
+    recipe.title = row['title'][:100]
+
+    # fetches add what they get to the catalog; point at it there
+    canonical = CatalogRecipe.query.get(row['id']) if row['id'] else None
+    if canonical is not None:
+        recipe.canonical = canonical
+        for column in Recipe.SHARED_COLUMNS:
+            setattr(recipe, f'own_{column}', None)
+    else:
+        recipe.source_url = row['source_url']
+        recipe.image_url = row['image_url'] or DEFAULT_RECIPE_IMG
+        recipe.ingredients = row['ingredients']
+        recipe.instructions = row['instructions']
+    db.session.commit()
+
+
+def get_recipe_source():
+    """Return the current app's RecipeSource."""
+
+    return current_app.extensions['recipe_source']
@@ -1,7 +1,9 @@
 """Seed file to make sample data for db."""
 
 from models import db 
-from app import app
+from app import create_app
+
+app = create_app()
 
 # Create all tables
 db.drop_all()
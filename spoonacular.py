@@ -0,0 +1,179 @@
+"""HTTP client for the Spoonacular API."""
+
+import logging
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from quota import USER
+
+API_BASE_URL = 'https://api.spoonacular.com'
+
+# Statuses worth another try; anything else is returned or raised as is
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Statuses that count against the circuit breaker besides 5xx. 402 means
+# the daily points are spent, which won't fix itself on the next call.
+BREAKER_STATUSES = {402, 429}
+
+log = logging.getLogger(__name__)
+
+
+class SpoonacularError(Exception):
+    """Spoonacular could not be reached or returned an error."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class QuotaExceeded(SpoonacularError):
+    """The outbound point budget is spent for now."""
+
+
+class SpoonacularClient:
+    """Pooled, timeout-bounded access to Spoonacular.
+
+    One keep-alive session is shared by every call in the worker. Each call
+    gets connect and read timeouts and up to `retries` extra attempts with
+    jittered exponential backoff. Listeners added to `listeners` are called
+    as listener(path, seconds, status, error) after every attempt.
+
+    With a `breaker`, calls fail fast with SpoonacularError while it is
+    open, and each call's total time and outcome are recorded on it. With a
+    `quota`, each call first spends its point cost there and fails fast
+    with QuotaExceeded when the budget is gone.
+    """
+
+    def __init__(self, api_key, base_url=API_BASE_URL, connect_timeout=3.05,
+                 read_timeout=10, retries=2, backoff=0.3, pool_size=10,
+                 breaker=None, quota=None):
+        self.api_key = api_key
+        self.breaker = breaker
+        self.quota = quota
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.listeners = []
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, path, params, cost=1, priority=USER):
+        """GET path and return the decoded JSON body.
+
+        `cost` is the call's price in Spoonacular points and `priority`
+        either quota.USER or quota.BACKGROUND. Every attempt is billed, so
+        each retry spends cost again, and retries stop once the quota
+        denies one. Raises SpoonacularError once all attempts have failed,
+        or right away while the circuit breaker is open or the quota is
+        spent.
+        """
+
+        if self.quota is not None and not self.quota.acquire(cost, priority):
+            raise QuotaExceeded(f'{path}: quota exceeded')
+
+        if self.breaker is None:
+            return self._get(path, params, cost, priority)
+
+        if not self.breaker.allow():
+            if self.quota is not None:
+                self.quota.release(cost)
+            raise SpoonacularError(f'{path}: circuit open')
+
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = self._get(path, params, cost, priority)
+            ok = True
+            return result
+        except SpoonacularError as exc:
+            ok = (exc.status is not None and exc.status < 500
+                  and exc.status not in BREAKER_STATUSES)
+            raise
+        finally:
+            self.breaker.record(time.perf_counter() - start, ok)
+
+    def _get(self, path, params, cost, priority):
+        params = dict(params, apiKey=self.api_key)
+        url = f'{self.base_url}{path}'
+
+        for attempt in range(self.retries + 1):
+            # the first attempt was paid for by get()
+            if (attempt and self.quota is not None
+                    and not self.quota.acquire(cost, priority)):
+                break
+
+            start = time.perf_counter()
+            try:
+                res = self.session.get(url, params=params,
+                                       timeout=self.timeout)
+            except requests.RequestException as exc:
+                self._report(path, start, None, exc)
+                error = SpoonacularError(f'{path}: {exc}')
+            else:
+                self._report(path, start, res.status_code, None)
+                if res.ok:
+                    try:
+                        return res.json()
+                    except ValueError:
+                        # an HTML page from a proxy or captive portal
+                        error = SpoonacularError(f'{path}: response is not '
+                                                 'JSON')
+                else:
+                    error = SpoonacularError(
+                        f'{path}: HTTP {res.status_code}', res.status_code)
+                    if res.status_code not in RETRY_STATUSES:
+                        raise error
+
+            if attempt < self.retries:
+                # full jitter keeps retrying workers from moving in step
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+        raise error
+
+    def random_recipes(self, tags, number, priority=USER):
+        """Return up to `number` random recipes matching tags."""
+
+        # 1 point per call plus 0.01 per recipe returned
+        data = self.get('/recipes/random', {'tags': tags, 'number': number},
+                        cost=1 + 0.01 * number, priority=priority)
+        recipes = data.get('recipes') if isinstance(data, dict) else None
+        if not isinstance(recipes, list):
+            raise SpoonacularError('/recipes/random: unexpected response')
+        return recipes
+
+    def bulk_limit(self, priority=USER):
+        """Return the most ids one information_bulk call at priority can
+        ask for within the quota, or None without a quota."""
+
+        if self.quota is None:
+            return None
+        return max(1, int((self.quota.largest(priority) - 0.5) / 0.5))
+
+    def information_bulk(self, ids, priority=USER):
+        """Return full details, ingredients and instructions included, for
+        several recipes in one call."""
+
+        if not ids:
+            return []
+        # 1 point for the first recipe plus 0.5 per additional one
+        recipes = self.get('/recipes/informationBulk',
+                           {'ids': ','.join(map(str, ids))},
+                           cost=0.5 + 0.5 * len(ids), priority=priority)
+        if not isinstance(recipes, list):
+            raise SpoonacularError('/recipes/informationBulk: unexpected '
+                                   'response')
+        return recipes
+
+    def _report(self, path, start, status, error):
+        seconds = time.perf_counter() - start
+        log.debug('spoonacular %s %s %.3fs', path, status or error, seconds)
+        for listener in self.listeners:
+            listener(path, seconds, status, error)
@@ -13,3 +13,44 @@ function confirmDelete() {
         return;
     }
 }
+
+// Mark a recipe cooked or not without reloading the list
+$('#recipe-list').on('click', '.toggle-done', async function (evt) {
+    evt.preventDefault();
+    let $link = $(this);
+
+    try {
+        let res = await axios.post($link.attr('href'), {});
+        $link.closest('li').toggleClass('recipe-done', res.data.done);
+        $link.find('i')
+            .toggleClass('far fa-circle', !res.data.done)
+            .toggleClass('fas fa-check-circle', res.data.done);
+    } catch (err) {
+        // fall back to the page that does the same
+        window.location = $link.attr('href');
+    }
+});
+
+// Apply an action to every checked recipe in one request
+$('#batch-actions').on('click', 'button', async function () {
+    let action = $(this).data('action');
+    let ids = $('.batch-select:checked').map((i, box) => +box.value).get();
+
+    if (!ids.length) return;
+    if (action == 'delete' && !confirm(`Delete ${ids.length} recipes?`)) return;
+
+    let res = await axios.post('/recipes/batch', { action, ids });
+    for (let id of res.data.ids) {
+        let $item = $(`li[data-recipe-id="${id}"]`);
+        if (action == 'delete') {
+            $item.closest('ul').remove();
+            continue;
+        }
+        let done = action == 'done';
+        $item.toggleClass('recipe-done', done);
+        $item.find('.toggle-done i')
+            .toggleClass('far fa-circle', !done)
+            .toggleClass('fas fa-check-circle', done);
+        $item.find('.batch-select').prop('checked', false);
+    }
+});
@@ -0,0 +1,52 @@
+"""Count the SQL statements a request runs, for per-route query budgets.
+
+Use it from a TestCase like:
+
+    with count_queries(app) as queries:
+        client.get('/about')
+    self.assertLessEqual(len(queries), 1)
+
+or mix QueryBudgetMixin into the TestCase and call assertQueryBudget.
+"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db
+
+
+@contextmanager
+def count_queries(app):
+    """Collect every statement app's engine runs inside the block."""
+
+    statements = []
+
+    def capture(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db.get_engine(app)
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+
+class QueryBudgetMixin:
+    """TestCase mixin checking requests against query budgets.
+
+    Needs self.app and self.client.
+    """
+
+    def assertQueryBudget(self, budget, method, url, **kwargs):
+        """Request url and fail if it ran more than budget statements."""
+
+        with count_queries(self.app) as statements:
+            res = self.client.open(url, method=method, **kwargs)
+
+        if len(statements) > budget:
+            self.fail(f'{method} {url} ran {len(statements)} SQL statements, '
+                      f'over its budget of {budget}:\n\n'
+                      + '\n\n'.join(statements))
+        return res
@@ -0,0 +1,133 @@
+"""Static asset pipeline tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_assets.py
+
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipIf
+
+import assets
+from app import create_app
+from config import TestingConfig
+
+CSS = b'body { color: #333; }\n' * 50
+
+
+class AssetBuildTestCase(TestCase):
+    """Build a small static folder and serve it."""
+
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp()
+        self.dist_dir = os.path.join(self.static_dir, 'dist')
+        os.makedirs(os.path.join(self.static_dir, 'images'))
+        with open(os.path.join(self.static_dir, 'style.css'), 'wb') as f:
+            f.write(CSS)
+        shutil.copyfile(os.path.join(assets.STATIC_DIR, 'images/logo.png'),
+                        os.path.join(self.static_dir, 'images/logo.png'))
+
+        self.manifest = assets.build(self.static_dir, self.dist_dir)
+
+        class AssetsConfig(TestingConfig):
+            ASSETS_DIR = self.dist_dir
+
+        self.app = create_app(AssetsConfig)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.static_dir)
+
+    def test_build(self):
+        css = self.manifest['style.css']
+        self.assertRegex(css, r'^style\.[0-9a-f]{12}\.css$')
+        self.assertRegex(self.manifest['images/logo.png'],
+                         r'^images/logo\.[0-9a-f]{12}\.png$')
+
+        with gzip.open(os.path.join(self.dist_dir, css + '.gz')) as f:
+            self.assertEqual(f.read(), CSS)
+        # PNGs are compressed already
+        self.assertFalse(os.path.exists(os.path.join(
+            self.dist_dir, self.manifest['images/logo.png'] + '.gz')))
+
+    def test_optimize_png(self):
+        source = os.path.join(self.static_dir, 'images/logo.png')
+        built = os.path.join(self.dist_dir, self.manifest['images/logo.png'])
+
+        with open(built, 'rb') as f:
+            self.assertEqual(f.read(8), b'\x89PNG\r\n\x1a\n')
+        self.assertLessEqual(os.path.getsize(built), os.path.getsize(source))
+
+    @skipIf(assets.Image is None, 'Pillow not installed')
+    def test_resave_png(self):
+        source = os.path.join(self.static_dir, 'images/logo.png')
+        target = os.path.join(self.static_dir, 'resaved.png')
+        shutil.copyfile(source, target)
+
+        self.assertTrue(assets.resave_png(target))
+
+        self.assertLess(os.path.getsize(target), os.path.getsize(source))
+        self.assertFalse(os.path.exists(target + '.tmp'))
+        with assets.Image.open(source) as before, \
+                assets.Image.open(target) as after:
+            self.assertEqual(after.mode, before.mode)
+            self.assertEqual(after.tobytes(), before.tobytes())
+
+    def test_optimize_png_warns_without_optimizer(self):
+        path = os.path.join(self.static_dir, 'images/logo.png')
+        which, image = assets.shutil.which, assets.Image
+        assets.shutil.which = lambda name: None
+        assets.Image = None
+        try:
+            with self.assertLogs('assets', 'WARNING'):
+                self.assertFalse(assets.optimize_png(path))
+        finally:
+            assets.shutil.which, assets.Image = which, image
+
+    def test_rebuild_skips_dist(self):
+        manifest = assets.build(self.static_dir, self.dist_dir)
+
+        self.assertEqual(manifest, self.manifest)
+
+    def test_asset_url(self):
+        with self.app.test_request_context():
+            self.assertEqual(assets.asset_url('style.css'),
+                             f'/assets/{self.manifest["style.css"]}')
+            # not built: plain static URL
+            self.assertEqual(assets.asset_url('new.js'), '/static/new.js')
+
+        res = self.client.get('/about')
+        self.assertIn(f'/assets/{self.manifest["style.css"]}',
+                      res.data.decode())
+
+    def test_serve_gzip(self):
+        url = f'/assets/{self.manifest["style.css"]}'
+
+        res = self.client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/css')
+        self.assertEqual(res.headers['Content-Encoding'],
+                         'br' if assets.brotli else 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertIn('immutable', res.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', res.headers['Cache-Control'])
+
+        res = self.client.get(url, headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.data, CSS)
+
+    @skipIf(assets.brotli is None, 'brotli is not installed')
+    def test_serve_brotli(self):
+        res = self.client.get(f'/assets/{self.manifest["style.css"]}',
+                              headers={'Accept-Encoding': 'gzip, br'})
+
+        self.assertEqual(res.headers['Content-Encoding'], 'br')
+        self.assertEqual(assets.brotli.decompress(res.data), CSS)
+
+    def test_serve_missing(self):
+        self.assertEqual(self.client.get('/assets/style.css').status_code,
+                         404)
+        self.assertEqual(self.client.get('/assets/manifest.json').status_code,
+                         404)
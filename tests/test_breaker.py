@@ -0,0 +1,69 @@
+"""Circuit breaker tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_breaker.py
+
+from unittest import TestCase
+
+from breaker import CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTestCase(TestCase):
+    """Test breaker state changes."""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            failure_rate=0.5, slow_call_seconds=2, window_size=4,
+            min_calls=4, reset_timeout=10, clock=self.clock)
+
+    def test_opens_on_error_rate(self):
+        for ok in (True, False, True, False):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record(0.1, ok)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()['rejected'], 1)
+
+    def test_opens_on_slow_calls(self):
+        for seconds in (0.1, 3, 0.1, 5):
+            self.breaker.allow()
+            self.breaker.record(seconds, True)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_stays_closed_under_min_calls(self):
+        for _ in range(3):
+            self.breaker.allow()
+            self.breaker.record(0.1, False)
+
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_trial(self):
+        for _ in range(4):
+            self.breaker.allow()
+            self.breaker.record(0.1, False)
+
+        self.clock.now = 11
+        self.assertTrue(self.breaker.allow())
+        # only one trial call at a time
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record(0.1, False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.clock.now = 22
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(0.1, True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
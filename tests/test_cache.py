@@ -0,0 +1,121 @@
+"""Response cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_cache.py
+
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from cache import (MemoryBackend, SQLiteBackend, ResponseCache,
+                   normalize_tags)
+
+
+class NormalizeTagsTestCase(TestCase):
+    """Test cache key normalization."""
+
+    def test_normalize_tags(self):
+        self.assertEqual(normalize_tags('Vegan, dessert '), 'dessert,vegan')
+        self.assertEqual(normalize_tags('dessert,VEGAN,,vegan'),
+                         'dessert,vegan')
+        self.assertEqual(normalize_tags(''), '')
+
+
+class MemoryBackendTestCase(TestCase):
+    """Test in-process LRU backend."""
+
+    def test_evicts_least_recently_used(self):
+        backend = MemoryBackend(max_size=2)
+        backend.set('a', 1, 0)
+        backend.set('b', 2, 0)
+        backend.get('a')
+        backend.set('c', 3, 0)
+
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('a'), (1, 0))
+        self.assertEqual(backend.get('c'), (3, 0))
+
+
+class SQLiteBackendTestCase(TestCase):
+    """Test shared SQLite backend."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_round_trip_and_eviction(self):
+        backend = SQLiteBackend(self.path, max_size=2)
+        backend.set('a', [{'title': 'Pie'}], 10.0)
+        backend.set('b', [], 11.0)
+        backend.set('c', [], 12.0)
+
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(backend.get('b'), ([], 11.0))
+
+        # a second backend on the same file sees the same entries
+        other = SQLiteBackend(self.path, max_size=2)
+        self.assertEqual(other.get('c'), ([], 12.0))
+
+
+class ResponseCacheTestCase(TestCase):
+    """Test TTL and stale-while-revalidate behaviour."""
+
+    def test_hit_and_miss(self):
+        cache = ResponseCache(MemoryBackend(), ttl=60, stale_ttl=60)
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return ['recipe']
+
+        self.assertEqual(cache.get_or_fetch('vegan', fetch), ['recipe'])
+        self.assertEqual(cache.get_or_fetch('vegan', fetch), ['recipe'])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_stale_while_revalidate(self):
+        backend = MemoryBackend()
+        cache = ResponseCache(backend, ttl=1, stale_ttl=60)
+        backend.set('vegan', ['old'], time.time() - 10)
+
+        self.assertEqual(cache.get_or_fetch('vegan', lambda: ['new']),
+                         ['old'])
+        self.assertEqual(cache.stats()['stale_hits'], 1)
+
+        for _ in range(50):
+            if backend.get('vegan')[0] == ['new']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(backend.get('vegan')[0], ['new'])
+
+    def test_stale_entry_uses_refresh(self):
+        backend = MemoryBackend()
+        cache = ResponseCache(backend, ttl=1, stale_ttl=60)
+        backend.set('vegan', ['old'], time.time() - 10)
+
+        self.assertEqual(cache.get_or_fetch('vegan', lambda: ['user'],
+                                            refresh=lambda: ['background']),
+                         ['old'])
+
+        for _ in range(50):
+            if backend.get('vegan')[0] != ['old']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(backend.get('vegan')[0], ['background'])
+
+    def test_expired_entry_is_refetched(self):
+        backend = MemoryBackend()
+        cache = ResponseCache(backend, ttl=1, stale_ttl=1)
+        backend.set('vegan', ['old'], time.time() - 10)
+
+        self.assertEqual(cache.get_or_fetch('vegan', lambda: ['new']),
+                         ['new'])
+        self.assertEqual(cache.stats()['misses'], 1)
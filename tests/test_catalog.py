@@ -0,0 +1,96 @@
+"""Recipe catalog tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_catalog.py
+
+from unittest import TestCase
+from app import create_app
+
+import catalog
+from models import db, CatalogRecipe
+
+app = create_app('testing')
+db.create_all()
+
+ENTRIES = [
+    {
+        'id': 101,
+        'title': 'Vegan Lentil Soup',
+        'sourceUrl': 'https://example.com/soup',
+        'image': 'https://example.com/soup.jpg',
+        'readyInMinutes': 45,
+        'servings': 4,
+        'dishTypes': ['soup', 'lunch'],
+        'diets': ['vegan', 'gluten free'],
+        'extendedIngredients': [{'original': '1 cup red lentils'},
+                                {'original': '2 carrots'}],
+        'instructions': 'Simmer everything.',
+    },
+    {
+        'id': 202,
+        'title': 'Chocolate Cake',
+        'sourceUrl': 'https://example.com/cake',
+        'dishTypes': ['dessert'],
+        'diets': [],
+        'extendedIngredients': [{'name': 'cocoa'}],
+    },
+]
+
+
+class CatalogTestCase(TestCase):
+    """Test catalog ingestion and search."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_ingest(self):
+        catalog.ingest(ENTRIES)
+
+        soup = CatalogRecipe.query.get(101)
+        self.assertEqual(soup.title, 'Vegan Lentil Soup')
+        self.assertEqual(soup.diets, 'vegan, gluten free')
+        self.assertEqual(soup.ingredients, '1 cup red lentils\n2 carrots')
+        self.assertEqual(CatalogRecipe.query.count(), 2)
+
+    def test_ingest_updates_existing(self):
+        catalog.ingest(ENTRIES)
+        catalog.ingest([dict(ENTRIES[1], title='Dark Chocolate Cake')])
+
+        self.assertEqual(CatalogRecipe.query.count(), 2)
+        self.assertEqual(CatalogRecipe.query.get(202).title,
+                         'Dark Chocolate Cake')
+
+    def test_ingest_keeps_details(self):
+        catalog.ingest(ENTRIES)
+        # /recipes/random without ingredients or instructions
+        catalog.ingest([{'id': 101, 'title': 'Lentil Soup'}])
+
+        soup = CatalogRecipe.query.get(101)
+        self.assertEqual(soup.title, 'Lentil Soup')
+        self.assertEqual(soup.ingredients, '1 cup red lentils\n2 carrots')
+        self.assertEqual(soup.instructions, 'Simmer everything.')
+
+    def test_search(self):
+        catalog.ingest(ENTRIES)
+
+        self.assertEqual([r.id for r in catalog.search('lentils')], [101])
+        self.assertEqual([r.id for r in catalog.search('vegan soup')], [101])
+        self.assertEqual([r.id for r in catalog.search('dessert')], [202])
+        self.assertEqual(catalog.search('pizza'), [])
+
+    def test_search_view(self):
+        catalog.ingest(ENTRIES)
+
+        with self.client as c:
+            res = c.get('/recipes/search?q=carrots')
+
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('Vegan Lentil Soup', str(res.data))
+            self.assertNotIn('Chocolate Cake', str(res.data))
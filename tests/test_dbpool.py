@@ -0,0 +1,110 @@
+"""Database pool tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_dbpool.py
+
+from unittest import TestCase
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+
+from app import create_app
+from config import TestingConfig
+from dbpool import (engine_options, pool_stats, MeteredQueuePool,
+                    MeteredNullPool)
+from models import db
+
+app = create_app('testing')
+db.create_all()
+
+
+class EngineOptionsTestCase(TestCase):
+    """Test engine options built from config."""
+
+    def setUp(self):
+        self.config = {key: getattr(TestingConfig, key)
+                       for key in dir(TestingConfig) if key.isupper()}
+
+    def test_pooled(self):
+        self.config.update(DATABASE_POOL_SIZE=3, DATABASE_MAX_OVERFLOW=1,
+                           DATABASE_STATEMENT_TIMEOUT=5000)
+        options = engine_options(self.config)
+
+        self.assertIs(options['poolclass'], MeteredQueuePool)
+        self.assertEqual(options['pool_size'], 3)
+        self.assertEqual(options['max_overflow'], 1)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'],
+                         {'options': '-c statement_timeout=5000'})
+
+    def test_no_statement_timeout(self):
+        self.config['DATABASE_STATEMENT_TIMEOUT'] = 0
+
+        self.assertNotIn('connect_args', engine_options(self.config))
+
+    def test_pgbouncer(self):
+        self.config['DATABASE_PGBOUNCER'] = True
+
+        self.assertEqual(engine_options(self.config),
+                         {'poolclass': MeteredNullPool})
+
+
+class PoolMetricsTestCase(TestCase):
+    """Test checkout counters."""
+
+    def test_checkouts(self):
+        engine = create_engine('sqlite://', poolclass=MeteredQueuePool,
+                               pool_size=1, max_overflow=1, pool_timeout=0.1)
+
+        first = engine.connect()
+        second = engine.connect()
+        stats = pool_stats(engine)
+        self.assertEqual(stats['in_use'], 2)
+        self.assertEqual(stats['overflow'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+
+        with self.assertRaises(PoolTimeout):
+            engine.connect()
+        stats = pool_stats(engine)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['wait_seconds_max'], 0.1)
+
+        first.close()
+        second.close()
+        stats = pool_stats(engine)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['idle'], 1)
+
+    def test_survives_dispose(self):
+        engine = create_engine('sqlite://', poolclass=MeteredQueuePool)
+        engine.connect().close()
+        engine.dispose()
+
+        self.assertEqual(pool_stats(engine)['checkouts'], 1)
+
+    def test_null_pool(self):
+        engine = create_engine('sqlite://', poolclass=MeteredNullPool)
+
+        with engine.connect():
+            self.assertEqual(pool_stats(engine)['in_use'], 1)
+        self.assertEqual(pool_stats(engine)['in_use'], 0)
+
+
+class DatabasePoolTestCase(TestCase):
+    """Test the app's engine."""
+
+    def test_statement_timeout(self):
+        with db.get_engine(app).connect() as conn:
+            timeout = conn.exec_driver_sql('SHOW statement_timeout').scalar()
+
+        self.assertEqual(timeout, '30s')
+
+    def test_status(self):
+        res = app.test_client().get('/status/db')
+        stats = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(stats['pool'], 'MeteredQueuePool')
+        self.assertEqual(stats['size'], 5)
+        self.assertIn('wait_seconds_avg', stats)
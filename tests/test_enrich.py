@@ -0,0 +1,199 @@
+"""Bulk recipe enrichment tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_enrich.py
+
+import os
+import tempfile
+from unittest import TestCase
+from app import create_app
+
+import catalog
+import enrich
+from models import db, User, Recipe, CatalogRecipe
+from quota import QuotaLimiter
+from spoonacular import QuotaExceeded, SpoonacularClient
+from tests.querycount import count_queries
+
+app = create_app('testing')
+db.create_all()
+
+
+def details(recipe_id):
+    return {
+        'id': recipe_id,
+        'title': f'Recipe {recipe_id}',
+        'sourceUrl': f'https://example.com/{recipe_id}',
+        'extendedIngredients': [{'original': f'{recipe_id} g flour'}],
+        'instructions': f'<p>Bake {recipe_id}.</p>',
+    }
+
+
+class FakeClient:
+    """Answers informationBulk for every id but 404."""
+
+    def __init__(self, fail_after=None):
+        self.calls = []
+        self.fail_after = fail_after
+
+    def bulk_limit(self, priority=None):
+        return None
+
+    def information_bulk(self, ids, priority=None):
+        if self.fail_after is not None and len(self.calls) >= self.fail_after:
+            raise QuotaExceeded('/recipes/informationBulk: quota exceeded')
+        self.calls.append(list(ids))
+        return [details(i) for i in ids if i != 404]
+
+
+class EnrichTestCase(TestCase):
+    """Fill in shared recipe details in batches."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        for user_id in (1, 2):
+            user = User.register('Enrich', str(user_id),
+                                 f'enrich{user_id}@test.com', 'password')
+            user.id = user_id
+            db.session.add(user)
+        db.session.commit()
+
+        # from /recipes/random, without details: 1-5 on both lists, 404
+        # unknown upstream and 8 on nobody's list; 6 and 7 complete
+        catalog.ingest([{'id': i, 'title': f'Recipe {i}',
+                         'sourceUrl': f'https://example.com/{i}'}
+                        for i in (1, 2, 3, 4, 5, 404, 8)])
+        catalog.ingest([details(6), details(7)])
+
+        for user_id in (1, 2):
+            for spoonacular_id in (1, 2, 3, 4, 5, 404):
+                db.session.add(Recipe(title=f'Saved {spoonacular_id}',
+                                      spoonacular_id=spoonacular_id,
+                                      user_id=user_id))
+        db.session.add(Recipe(title='Done', spoonacular_id=6, user_id=1))
+        # saved before we kept ids: one with an edit of its own, one not
+        # in the catalog yet, one whose image has no id
+        db.session.add(Recipe(
+            title='Old', user_id=2, source_url='https://example.com/7',
+            image_url='https://spoonacular.com/recipeImages/7-556x370.jpg',
+            instructions='My way.'))
+        db.session.add(Recipe(
+            title='Older', user_id=1, source_url='https://example.com/9',
+            image_url='https://spoonacular.com/recipeImages/9-312x231.jpg'))
+        db.session.add(Recipe(
+            title='Listed', user_id=1, source_url='https://example.com/8',
+            image_url='https://spoonacular.com/recipeImages/soup.jpg'))
+        # typed in by a user, at a URL the catalog knows
+        db.session.add(Recipe(title='Typed', user_id=1,
+                              source_url='https://example.com/7'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_enrich(self):
+        client = FakeClient()
+
+        with app.app_context(), count_queries(app) as statements:
+            # a session bound to this app's engine
+            db.session.remove()
+            stats = enrich.enrich(client, batch_size=4)
+
+        # once per recipe however many lists it's on; 6 needed nothing
+        self.assertEqual(client.calls, [[1, 2, 3, 4], [5, 8, 9, 404]])
+        self.assertEqual(stats, {'linked': 3, 'unlinked': 1, 'batches': 2,
+                                 'fetched': 7, 'error': None})
+        upserts = [s for s in statements
+                   if s.startswith('INSERT INTO catalog_recipes')]
+        # one for recipes saved before we kept ids, then one per batch
+        self.assertEqual(len(upserts), 3)
+
+        for recipe in Recipe.query.filter(Recipe.spoonacular_id != 404):
+            with self.subTest(recipe=recipe.title):
+                self.assertTrue(recipe.ingredients)
+                self.assertTrue(recipe.instructions)
+                self.assertIsNone(recipe.own_ingredients)
+        self.assertEqual(Recipe.query.filter_by(
+            user_id=2, spoonacular_id=3).one().instructions, 'Bake 3.')
+
+        old = Recipe.query.filter_by(title='Old').one()
+        self.assertEqual(old.spoonacular_id, 7)
+        self.assertIsNone(old.own_source_url)
+        self.assertEqual(old.ingredients, '7 g flour')
+        self.assertEqual(old.own_instructions, 'My way.')
+        self.assertEqual(
+            Recipe.query.filter_by(title='Older').one().spoonacular_id, 9)
+        self.assertEqual(CatalogRecipe.query.get(9).ingredients, '9 g flour')
+        self.assertEqual(
+            Recipe.query.filter_by(title='Listed').one().spoonacular_id, 8)
+
+        typed = Recipe.query.filter_by(title='Typed').one()
+        self.assertIsNone(typed.spoonacular_id)
+        self.assertIsNone(typed.ingredients)
+
+    def test_enrich_stops_on_quota(self):
+        stats = enrich.enrich(FakeClient(fail_after=1), batch_size=2)
+
+        self.assertEqual(stats['batches'], 1)
+        self.assertIn('quota exceeded', stats['error'])
+        self.assertEqual(Recipe.query.filter(
+            Recipe.ingredients.isnot(None)).count(), 6)
+
+        # a second run carries on where the first stopped
+        client = FakeClient()
+        enrich.enrich(client, batch_size=2)
+        self.assertEqual(client.calls, [[3, 4], [5, 8], [9, 404]])
+
+
+class EnrichQuotaTestCase(TestCase):
+    """Batches fit the background quota of the default config."""
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+
+        user = User.register('Enrich', 'Quota', 'quota@test.com', 'password')
+        db.session.add(user)
+        db.session.commit()
+
+        ids = range(1, 121)
+        catalog.ingest([{'id': i, 'title': f'Recipe {i}'} for i in ids])
+        db.session.add_all(Recipe(title=f'Recipe {i}', spoonacular_id=i,
+                                  user_id=user.id) for i in ids)
+        db.session.commit()
+
+        self.directory = tempfile.TemporaryDirectory()
+        config = app.config
+        quota = QuotaLimiter(
+            os.path.join(self.directory.name, 'quota.sqlite3'),
+            per_minute=config['SPOONACULAR_QUOTA_PER_MINUTE'],
+            per_day=config['SPOONACULAR_QUOTA_PER_DAY'],
+            background_reserve=config['SPOONACULAR_QUOTA_BACKGROUND_RESERVE'])
+        self.client = SpoonacularClient('key', quota=quota)
+        self.calls = []
+
+        def get(path, params, cost, priority):
+            ids = [int(i) for i in params['ids'].split(',')]
+            self.calls.append(ids)
+            return [details(i) for i in ids]
+
+        self.client._get = get
+
+    def tearDown(self):
+        self.directory.cleanup()
+        db.session.rollback()
+
+    def test_default_batch_fits_quota(self):
+        stats = enrich.enrich(self.client,
+                              batch_size=app.config['RECIPE_ENRICH_BATCH'])
+
+        # the first batch goes out; the next waits for the bucket to refill
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(stats['fetched'], len(self.calls[0]))
+        self.assertGreater(stats['fetched'], 0)
+        self.assertIn('quota exceeded', stats['error'])
+        self.assertEqual(CatalogRecipe.query.filter(
+            CatalogRecipe.ingredients.isnot(None)).count(), stats['fetched'])
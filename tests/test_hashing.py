@@ -0,0 +1,52 @@
+"""Password hashing tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_hashing.py
+
+from unittest import TestCase
+
+from hashing import PasswordHasher, HashingBusy, hash_rounds
+
+
+class PasswordHasherTestCase(TestCase):
+    """Test hashing inline and in a process pool."""
+
+    def test_inline(self):
+        hasher = PasswordHasher(rounds=4)
+        hashed = hasher.hash('password')
+
+        self.assertTrue(hashed.startswith('$2b$04$'))
+        self.assertTrue(hasher.check(hashed, 'password'))
+        self.assertFalse(hasher.check(hashed, 'wrong'))
+        self.assertFalse(hasher.check(hashed, ''))
+
+    def test_empty_password(self):
+        hasher = PasswordHasher(rounds=4)
+
+        with self.assertRaises(ValueError):
+            hasher.hash('')
+        with self.assertRaises(ValueError):
+            hasher.hash(None)
+
+    def test_pool(self):
+        hasher = PasswordHasher(rounds=4, workers=1)
+        hashed = hasher.hash('password')
+
+        self.assertTrue(hasher.check(hashed, 'password'))
+
+    def test_backpressure(self):
+        hasher = PasswordHasher(rounds=4, workers=1, max_pending=1, wait=0.1)
+        hasher._slots.acquire()
+        try:
+            with self.assertRaises(HashingBusy):
+                hasher.hash('password')
+        finally:
+            hasher._slots.release()
+
+    def test_needs_rehash(self):
+        old = PasswordHasher(rounds=4).hash('password')
+
+        self.assertEqual(hash_rounds(old), 4)
+        self.assertFalse(PasswordHasher(rounds=4).needs_rehash(old))
+        self.assertTrue(PasswordHasher(rounds=5).needs_rehash(old))
@@ -0,0 +1,266 @@
+"""Background job queue tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_jobs.py
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from flask import Flask
+
+import catalog
+from app import create_app, CURR_USER_KEY
+from config import TestingConfig
+from jobs import JobQueue
+from models import db, User, Recipe, CatalogRecipe
+from recipe_source import PLACEHOLDER_TITLE, RecipeSource
+from spoonacular import SpoonacularError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class JobQueueTestCase(TestCase):
+    """Test claiming, retrying and failing jobs."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        self.queue = JobQueue(os.path.join(self.directory, 'jobs.sqlite3'),
+                              max_attempts=3, backoff=1, lease=30,
+                              clock=self.clock)
+        self.app = Flask(__name__)
+        self.calls = []
+        self.failures = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_run_once(self):
+        self.queue.register('note', lambda text: self.calls.append(text))
+        self.queue.enqueue('note', text='hello')
+
+        self.assertTrue(self.queue.run_once(self.app))
+        self.assertFalse(self.queue.run_once(self.app))
+        self.assertEqual(self.calls, ['hello'])
+        self.assertEqual(self.queue.stats()['queued'], 0)
+
+    def test_retry_then_fail(self):
+        def flaky(n):
+            self.calls.append(n)
+            raise SpoonacularError('down')
+
+        self.queue.register('flaky', flaky,
+                            on_failure=lambda n: self.failures.append(n))
+        self.queue.enqueue('flaky', n=1)
+
+        for attempt in range(1, 4):
+            self.assertTrue(self.queue.run_once(self.app))
+            self.assertEqual(len(self.calls), attempt)
+            # not due again until its backoff has passed
+            self.clock.now += 2 ** attempt
+
+        self.assertFalse(self.queue.run_once(self.app))
+        self.assertEqual(self.failures, [1])
+        self.assertEqual(self.queue.stats()['failed'], 1)
+
+    def test_failed_jobs_expire(self):
+        def broken(n):
+            raise SpoonacularError('down')
+
+        self.queue.failed_retention = 100
+        self.queue.register('broken', broken)
+
+        for n in range(2):
+            self.queue.enqueue('broken', n=n)
+            for attempt in range(1, 4):
+                self.assertTrue(self.queue.run_once(self.app))
+                self.clock.now += 2 ** attempt
+            self.assertEqual(self.queue.stats()['failed'], 1 + n)
+
+        # a failure after their retention has passed drops them
+        self.clock.now += 100
+        self.queue.enqueue('broken', n=2)
+        for attempt in range(1, 4):
+            self.assertTrue(self.queue.run_once(self.app))
+            self.clock.now += 2 ** attempt
+
+        self.assertEqual(self.queue.stats()['failed'], 1)
+
+    def test_lease_expires(self):
+        self.queue.enqueue('note', text='hello')
+
+        job = self.queue.claim()
+        self.assertIsNone(self.queue.claim())
+
+        # the first worker died; another takes over after the lease
+        self.clock.now += 31
+        again = self.queue.claim()
+        self.assertEqual(again.id, job.id)
+        self.assertEqual(again.attempts, 2)
+        self.assertEqual(self.queue.stats()['running'], 1)
+
+    def test_unknown_kind(self):
+        self.queue.enqueue('mystery')
+
+        self.assertTrue(self.queue.run_once(self.app))
+        self.assertEqual(self.queue.stats()['queued'], 1)
+
+
+class BackgroundStartTestCase(TestCase):
+    """Only the web server starts workers and warms the pool."""
+
+    def setUp(self):
+        self.started = []
+        self.start_workers = JobQueue.start_workers
+        self.warm = RecipeSource.warm
+        JobQueue.start_workers = (
+            lambda queue, app, threads: self.started.append('workers'))
+        RecipeSource.warm = lambda source: self.started.append('warm')
+
+    def tearDown(self):
+        JobQueue.start_workers = self.start_workers
+        RecipeSource.warm = self.warm
+
+    def test_factory_starts_nothing(self):
+        # as scripts, migrations and the shell build it
+        create_app('testing')
+        self.assertEqual(self.started, [])
+
+        create_app('testing', start_background=True)
+        self.assertEqual(self.started, ['warm', 'workers'])
+
+
+class RandomRecipeJobTestCase(TestCase):
+    """Add a placeholder recipe and fill it in from a job."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+
+        class JobsConfig(TestingConfig):
+            JOB_QUEUE_PATH = os.path.join(cls.directory, 'jobs.sqlite3')
+            JOB_MAX_ATTEMPTS = 2
+            JOB_RETRY_BACKOFF = 0
+
+        cls.app = create_app(JobsConfig)
+        cls.queue = cls.app.extensions['jobs']
+        cls.source = cls.app.extensions['recipe_source']
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        user = User.register('Job', 'User', 'job@test.com', 'password')
+        user.id = 1
+        db.session.add(user)
+        db.session.commit()
+
+        self.source.cache.backend.clear()
+        self.fetch = self.source.fetch
+        self.pool_fetch = self.source.pool.fetch
+        self.source.pool.fetch = lambda tags, number: []
+
+    def tearDown(self):
+        self.source.fetch = self.fetch
+        self.source.pool.fetch = self.pool_fetch
+        self.source.cache.backend.clear()
+        db.session.rollback()
+
+    def add_random(self, tags):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+            res = c.get(f'/users/1/recipes/random?tags={tags}')
+        self.assertEqual(res.status_code, 302)
+        return Recipe.query.filter_by(user_id=1).one()
+
+    def test_fill_in(self):
+        self.source.fetch = lambda tags, number, priority=None: [{
+            'id': 7, 'title': 'Lentil Soup',
+            'sourceUrl': 'https://example.com/soup',
+            'image': 'https://example.com/soup.jpg',
+            'extendedIngredients': [{'original': '1 cup lentils'},
+                                    {'original': '2 cups water'}],
+            'instructions': '<ol><li>Simmer.</li></ol>'}]
+
+        recipe = self.add_random('soup')
+        self.assertEqual(recipe.title, PLACEHOLDER_TITLE)
+        recipe_id = recipe.id
+        db.session.rollback()
+
+        self.assertTrue(self.queue.run_once(self.app))
+        recipe = Recipe.query.get(recipe_id)
+        self.assertEqual(recipe.title, 'Lentil Soup')
+        self.assertEqual(recipe.ingredients, '1 cup lentils\n2 cups water')
+        self.assertEqual(recipe.instructions, 'Simmer.')
+
+    def test_fill_in_shares_catalog_copy(self):
+        soup = {'id': 7, 'title': 'Lentil Soup',
+                'sourceUrl': 'https://example.com/soup',
+                'extendedIngredients': [{'original': '1 cup lentils'}],
+                'instructions': 'Simmer.'}
+
+        def fetch(tags, number, priority=None):
+            catalog.ingest([soup])
+            return [soup]
+
+        self.source.fetch = fetch
+        for _ in range(2):
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = 1
+                c.get('/users/1/recipes/random?tags=soup')
+            self.assertTrue(self.queue.run_once(self.app))
+
+        # both point at the one stored copy and keep nothing of their own
+        recipes = Recipe.query.filter_by(user_id=1).all()
+        self.assertEqual([r.spoonacular_id for r in recipes], [7, 7])
+        for recipe in recipes:
+            self.assertIsNone(recipe.own_ingredients)
+            self.assertEqual(recipe.ingredients, '1 cup lentils')
+        self.assertEqual(CatalogRecipe.query.count(), 1)
+
+    def test_fill_in_degraded(self):
+        def fail(tags, number, priority=None):
+            raise SpoonacularError('down')
+
+        self.source.fetch = fail
+        self.source.fallback_cache.backend.clear()
+        db.session.add(CatalogRecipe(id=9, title='Known Stew',
+                                     source_url='https://example.com/stew'))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+            c.get('/users/1/recipes/random?tags=stew')
+
+        # the last attempt falls back to recipes we know
+        self.assertTrue(self.queue.run_once(self.app))
+        self.assertTrue(self.queue.run_once(self.app))
+        recipe = Recipe.query.filter_by(user_id=1).one()
+        self.assertEqual(recipe.title, 'Known Stew')
+        self.assertEqual(recipe.spoonacular_id, 9)
+
+    def test_no_match_removes_placeholder(self):
+        self.source.fetch = lambda tags, number, priority=None: []
+
+        self.add_random('nothing')
+        db.session.rollback()
+
+        self.assertTrue(self.queue.run_once(self.app))
+        self.assertEqual(Recipe.query.count(), 0)
@@ -0,0 +1,144 @@
+"""Metrics tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_metrics.py
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from sqlalchemy.exc import DBAPIError
+
+from app import create_app
+from metrics import Metrics
+from models import db
+
+app = create_app('testing')
+db.create_all()
+
+
+class MetricsTestCase(TestCase):
+    """Test counting, rendering and adding up workers."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.metrics = Metrics(self.directory, flush_interval=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_render(self):
+        self.metrics.inc('nomnom_spoonacular_requests_total',
+                         {'path': '/recipes/random', 'status': 200})
+        self.metrics.observe('nomnom_request_seconds',
+                             {'route': '/', 'method': 'GET'}, 0.03)
+        self.metrics.observe('nomnom_request_seconds',
+                             {'route': '/', 'method': 'GET'}, 20)
+
+        text = self.metrics.render()
+
+        self.assertIn('# TYPE nomnom_request_seconds histogram', text)
+        self.assertIn('nomnom_spoonacular_requests_total'
+                      '{path="/recipes/random",status="200"} 1', text)
+        self.assertIn('nomnom_request_seconds_bucket'
+                      '{method="GET",route="/",le="0.025"} 0', text)
+        self.assertIn('nomnom_request_seconds_bucket'
+                      '{method="GET",route="/",le="0.05"} 1', text)
+        self.assertIn('nomnom_request_seconds_bucket'
+                      '{method="GET",route="/",le="+Inf"} 2', text)
+        self.assertIn('nomnom_request_seconds_count'
+                      '{method="GET",route="/"} 2', text)
+        self.assertIn('nomnom_request_seconds_sum'
+                      '{method="GET",route="/"} 20.03', text)
+
+    def test_adds_up_workers(self):
+        labels = {'path': '/recipes/random'}
+        self.metrics.inc('nomnom_spoonacular_errors_total', labels)
+
+        # another worker's file
+        other = {'counters': [['nomnom_spoonacular_errors_total',
+                               [['path', '/recipes/random']], 2]],
+                 'histograms': []}
+        with open(os.path.join(self.directory, 'worker-1-0.json'), 'w') as f:
+            json.dump(other, f)
+
+        self.assertIn('nomnom_spoonacular_errors_total'
+                      '{path="/recipes/random"} 3', self.metrics.render())
+
+    def test_keeps_exited_workers(self):
+        labels = {'path': '/recipes/random'}
+        self.metrics.inc('nomnom_spoonacular_errors_total', labels)
+
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        path = os.path.join(self.directory, f'worker-{exited.pid}-0.json')
+        with open(path, 'w') as f:
+            json.dump({'counters': [['nomnom_spoonacular_errors_total',
+                                     [['path', '/recipes/random']], 2]],
+                       'histograms': []}, f)
+
+        # counters never go backwards when a worker is replaced
+        for _ in range(2):
+            self.assertIn('nomnom_spoonacular_errors_total'
+                          '{path="/recipes/random"} 3', self.metrics.render())
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, 'exited.json')))
+
+    def test_spoonacular_listener(self):
+        self.metrics.record_spoonacular('/recipes/random', 0.2, 200, None)
+        self.metrics.record_spoonacular('/recipes/random', 0.1, 503, None)
+        self.metrics.record_spoonacular('/recipes/random', 3.05, None,
+                                        TimeoutError())
+
+        text = self.metrics.render()
+
+        self.assertIn('nomnom_spoonacular_errors_total'
+                      '{path="/recipes/random"} 2', text)
+        self.assertIn('nomnom_spoonacular_requests_total'
+                      '{path="/recipes/random",status="error"} 1', text)
+        self.assertIn('nomnom_spoonacular_request_seconds_count'
+                      '{path="/recipes/random"} 3', text)
+
+
+class MetricsViewTestCase(TestCase):
+    """Test the instrumented app."""
+
+    def test_metrics(self):
+        client = app.test_client()
+        client.get('/about')
+        client.get('/recipes/search?q=soup')
+
+        res = client.get('/metrics')
+        text = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('nomnom_requests_total'
+                      '{method="GET",route="/about",status="200"}', text)
+        self.assertIn('nomnom_request_seconds_count'
+                      '{method="GET",route="/recipes/search"}', text)
+        # the catalog search ran one query
+        self.assertIn('nomnom_request_sql_queries_bucket'
+                      '{route="/recipes/search",le="1"}', text)
+        self.assertNotIn('nomnom_request_sql_queries_bucket'
+                         '{route="/recipes/search",le="0"} 1', text)
+
+    def test_failed_statement_forgotten(self):
+        with db.get_engine(app).connect() as conn:
+            with self.assertRaises(DBAPIError):
+                conn.exec_driver_sql('SELECT * FROM no_such_table')
+            self.assertEqual(conn.info['metrics_start'], {})
+
+            conn.exec_driver_sql('SELECT 1')
+            self.assertEqual(conn.info['metrics_start'], {})
+
+    def test_spoonacular_wired(self):
+        metrics = app.extensions['metrics']
+        client = app.extensions['recipe_source'].client
+
+        self.assertIn(metrics.record_spoonacular, client.listeners)
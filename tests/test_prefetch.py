@@ -0,0 +1,55 @@
+"""Prefetch pool tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_prefetch.py
+
+import time
+from unittest import TestCase
+
+from prefetch import RecipePool
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class RecipePoolTestCase(TestCase):
+    """Test per-tag recipe buffers."""
+
+    def setUp(self):
+        self.calls = []
+
+        def fetch(tags, number):
+            self.calls.append((tags, number))
+            return [{'id': i, 'tags': tags} for i in range(number)]
+
+        self.pool = RecipePool(fetch, batch_size=10, low_water=3)
+
+    def test_empty_buffer_schedules_refill(self):
+        self.assertIsNone(self.pool.pop('Vegan'))
+        self.assertTrue(wait_for(lambda: self.pool.stats()['buffered']))
+
+        self.assertEqual(self.calls, [('vegan', 10)])
+        self.assertEqual(self.pool.pop('vegan')['id'], 0)
+        self.assertEqual(self.pool.stats()['hits'], 1)
+        self.assertEqual(self.pool.stats()['misses'], 1)
+
+    def test_low_water_triggers_one_refill(self):
+        self.pool.refill('dessert')
+
+        for _ in range(8):
+            self.assertIsNotNone(self.pool.pop('dessert'))
+
+        self.assertTrue(wait_for(
+            lambda: self.pool.stats()['buffered']['dessert'] > 2))
+        self.assertEqual(self.calls, [('dessert', 10), ('dessert', 10)])
+
+    def test_warm(self):
+        self.pool.warm(['vegan', 'keto'])
+
+        self.assertTrue(wait_for(lambda: len(self.calls) == 2))
+        self.assertEqual(sorted(self.calls), [('keto', 10), ('vegan', 10)])
@@ -0,0 +1,135 @@
+"""Query plan regression tests for the recipes hot paths."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_query_plans.py
+
+import datetime
+import json
+from unittest import TestCase
+
+from sqlalchemy import event
+from app import create_app, CURR_USER_KEY
+
+from models import db, User, Recipe
+
+app = create_app('testing')
+db.create_all()
+
+USERS = 200
+RECIPES_PER_USER = 100
+
+
+def walk(plan):
+    """Yield every node of a JSON EXPLAIN plan."""
+
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk(child)
+
+
+class QueryPlanTestCase(TestCase):
+    """Fail if a recipes route falls back to a seq scan on a large table."""
+
+    @classmethod
+    def setUpClass(cls):
+        db.drop_all()
+        db.create_all()
+
+        db.session.execute(User.__table__.insert(), [
+            {'id': uid, 'first_name': 'Test', 'last_name': f'User{uid}',
+             'email': f'user{uid}@test.com', 'password': 'HASHED_PASSWORD'}
+            for uid in range(1, USERS + 1)])
+
+        base = datetime.datetime(2026, 1, 1)
+        db.session.execute(Recipe.__table__.insert(), [
+            {'title': f'Recipe {uid}-{i}', 'user_id': uid,
+             'done': i % 3 == 0,
+             'created_on': base + datetime.timedelta(minutes=i)}
+            for uid in range(1, USERS + 1)
+            for i in range(RECIPES_PER_USER)])
+        db.session.commit()
+
+        with db.engine.connect() as conn:
+            conn.execute(db.text('ANALYZE'))
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.statements = []
+
+    def capture(self, conn, cursor, statement, parameters, context,
+                executemany):
+        if not executemany and 'recipes' in statement:
+            self.statements.append((statement, parameters))
+
+    def assert_no_seq_scan(self, method, url, user_id=42):
+        """Request url as user_id and EXPLAIN every recipes statement it ran."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = user_id
+
+            event.listen(db.get_engine(app), 'before_cursor_execute', self.capture)
+            try:
+                res = c.open(url, method=method)
+            finally:
+                event.remove(db.get_engine(app), 'before_cursor_execute', self.capture)
+
+        self.assertLess(res.status_code, 400)
+        self.assertTrue(self.statements, f'{url} ran no recipes queries')
+        self.assert_plans_use_indexes(url)
+
+    def assert_plans_use_indexes(self, url):
+        """EXPLAIN the captured statements; fail on a recipes seq scan."""
+
+        # a fresh connection, outside the request's transaction
+        raw = db.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            for statement, parameters in self.statements:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + statement,
+                               parameters)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                for node in walk(plan[0]['Plan']):
+                    self.assertFalse(
+                        node['Node Type'] == 'Seq Scan'
+                        and node.get('Relation Name') == 'recipes',
+                        f'{url} seq scans recipes:\n{statement}')
+            raw.rollback()
+        finally:
+            raw.close()
+
+    def test_list_recipes(self):
+        self.assert_no_seq_scan('GET', '/users/42/recipes')
+
+    def test_list_recipes_next_page(self):
+        self.assert_no_seq_scan(
+            'GET', '/users/42/recipes?after=2026-01-01T00:50:00_999999')
+
+    def test_list_pending_recipes(self):
+        self.assert_no_seq_scan('GET', '/users/42/recipes?show=pending')
+
+    def test_show_recipe(self):
+        recipe = Recipe.query.filter_by(user_id=42).first()
+        self.assert_no_seq_scan('GET', f'/recipes/{recipe.id}')
+
+    def test_delete_user(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 7
+            self.assertLess(c.post('/users/delete').status_code, 400)
+        self.assertEqual(Recipe.query.filter_by(user_id=7).count(), 0)
+
+        # ON DELETE CASCADE finds the user's recipes by user_id inside the
+        # database, where we can't capture it; check the same lookup
+        self.statements = [('DELETE FROM recipes WHERE user_id = %(user_id)s',
+                            {'user_id': 8})]
+        self.assert_plans_use_indexes('/users/delete')
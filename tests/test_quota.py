@@ -0,0 +1,75 @@
+"""Outbound quota tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_quota.py
+
+import os
+import tempfile
+from unittest import TestCase
+
+from quota import QuotaLimiter, USER, BACKGROUND
+
+
+class FakeClock:
+    def __init__(self):
+        # 2026-01-01 12:00 UTC
+        self.now = 1767268800
+
+    def __call__(self):
+        return self.now
+
+
+class QuotaLimiterTestCase(TestCase):
+    """Test token bucket, daily budget and priorities."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        self.clock = FakeClock()
+        self.quota = QuotaLimiter(self.path, per_minute=10, per_day=20,
+                                  background_reserve=0.5, clock=self.clock)
+
+    def tearDown(self):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def test_minute_bucket_refills(self):
+        for _ in range(10):
+            self.assertTrue(self.quota.acquire(1, USER))
+        self.assertFalse(self.quota.acquire(1, USER))
+
+        self.clock.now += 6
+        self.assertTrue(self.quota.acquire(1, USER))
+        self.assertEqual(self.quota.remaining()['day'], 9)
+
+    def test_daily_budget(self):
+        for _ in range(2):
+            self.assertTrue(self.quota.acquire(10, USER))
+            self.clock.now += 60
+        self.assertFalse(self.quota.acquire(1, USER))
+
+        # next UTC day
+        self.clock.now += 24 * 60 * 60
+        self.assertTrue(self.quota.acquire(1, USER))
+
+    def test_background_leaves_reserve_for_users(self):
+        self.assertTrue(self.quota.acquire(5, BACKGROUND))
+        self.assertFalse(self.quota.acquire(1, BACKGROUND))
+        self.assertTrue(self.quota.acquire(5, USER))
+        self.assertEqual(self.quota.remaining()['denied'], 1)
+
+    def test_shared_between_instances(self):
+        other = QuotaLimiter(self.path, per_minute=10, per_day=20,
+                             clock=self.clock)
+        self.quota.acquire(4, USER)
+
+        self.assertEqual(other.remaining()['minute'], 6)
+
+    def test_release(self):
+        self.quota.acquire(4, USER)
+        self.quota.release(4)
+
+        self.assertEqual(self.quota.remaining()['minute'], 10)
+        self.assertEqual(self.quota.remaining()['day'], 20)
@@ -4,16 +4,11 @@
 #
 #    python -m unittest tests/test_recipe_model.py
 
-from app import app, CURR_USER_KEY
+from app import create_app, CURR_USER_KEY
 from unittest import TestCase
 from models import db, Recipe, User
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///nomnom_test'
-app.config['SQLALCHEMY_ECHO'] = False
-
-# Make Flask errors be real errors, rather than HTML pages with error info
-app.config['TESTING'] = True
-
+app = create_app('testing')
 db.create_all()
 
 
@@ -2,25 +2,25 @@
 
 # run these tests like:
 #
-#    FLASK_ENV=production python -m unittest tests/test_recipe_views.py
+#    python -m unittest tests/test_recipe_views.py
 
 
+import csv
+import datetime
+import io
+import json
+import re
 from unittest import TestCase
-from app import app, CURR_USER_KEY
+from app import create_app, CURR_USER_KEY
 
-from models import db, User, Recipe
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///nomnom_test'
-app.config['SQLALCHEMY_ECHO'] = False
-
-# Make Flask errors be real errors, rather than HTML pages with error info
-app.config['TESTING'] = True
+from models import db, User, Recipe, CatalogRecipe
+from tests.querycount import count_queries, QueryBudgetMixin
 
+app = create_app('testing')
+recipe_source = app.extensions['recipe_source']
+user_cache = app.extensions['user_cache']
 db.create_all()
 
-# Don't have WTForms use CSRF to test
-app.config['WTF_CSRF_ENABLED'] = False
-
 
 class RecipeViewTestCase(TestCase):
     """Test views for recipes."""
@@ -30,6 +30,7 @@ class RecipeViewTestCase(TestCase):
 
         db.drop_all()
         db.create_all()
+        user_cache.backend.clear()
 
         self.client = app.test_client()
 
@@ -44,6 +45,9 @@ class RecipeViewTestCase(TestCase):
         db.session.add(self.testuser)
         db.session.commit()
 
+    def tearDown(self):
+        db.session.rollback()
+
     def test_add_recipe(self):
         """Test to add a new recipe."""
 
@@ -184,3 +188,495 @@ class RecipeViewTestCase(TestCase):
 
             r = Recipe.query.get(1234)
             self.assertIsNotNone(r)
+
+    def test_search_degraded_mode(self):
+        """Serve a known Spoonacular recipe while the breaker is open."""
+
+        db.session.add(CatalogRecipe(
+            id=1, title='Local Lasagna',
+            source_url='https://example.com/lasagna'))
+        # typed in by a user, so never shown to anyone else
+        db.session.add(Recipe(
+            title='Private Pie',
+            source_url='https://example.com/private',
+            user_id=self.testuser_id
+        ))
+        db.session.commit()
+
+        recipe_source.fallback_cache.backend.clear()
+        fetch = recipe_source.pool.fetch
+        recipe_source.pool.fetch = lambda tags, number: []
+        recipe_source.breaker._open()
+        try:
+            with self.client as c:
+                res = c.get('/recipes?tags=degraded-test')
+
+                self.assertEqual(res.status_code, 200)
+                self.assertIn('Local Lasagna', str(res.data))
+                self.assertNotIn('Private Pie', str(res.data))
+                self.assertIn('limited mode', str(res.data))
+        finally:
+            recipe_source.breaker.state = recipe_source.breaker.CLOSED
+            recipe_source.pool.fetch = fetch
+            recipe_source.fallback_cache.backend.clear()
+
+    def test_list_pagination(self):
+        """Walk a user's list a page at a time, newest first."""
+
+        base = datetime.datetime(2026, 1, 1)
+        for i in range(5):
+            db.session.add(Recipe(
+                id=100 + i,
+                title=f'Recipe {i}',
+                created_on=base + datetime.timedelta(days=i),
+                user_id=self.testuser_id
+            ))
+        db.session.commit()
+
+        app.config['RECIPES_PER_PAGE'] = 2
+        try:
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.testuser_id
+
+                url = f'/users/{self.testuser_id}/recipes'
+                seen = []
+                while url:
+                    res = c.get(url)
+                    self.assertEqual(res.status_code, 200)
+                    html = res.data.decode()
+                    seen += re.findall(r'>(Recipe \d)<', html)
+                    match = re.search(r'href="([^"]*\?after=[^"]*)"', html)
+                    url = match and match.group(1)
+
+                self.assertEqual(seen, [f'Recipe {i}' for i in range(4, -1, -1)])
+        finally:
+            app.config['RECIPES_PER_PAGE'] = 50
+
+    def test_export_recipes(self):
+        """Export a user's recipes as NDJSON and CSV, oldest first."""
+
+        base = datetime.datetime(2026, 1, 1)
+        for i in range(3):
+            db.session.add(Recipe(
+                title=f'Recipe {i}',
+                created_on=base + datetime.timedelta(days=i),
+                done=i == 0,
+                user_id=self.testuser_id
+            ))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            res = c.get(f'/users/{self.testuser_id}/recipes/export')
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.mimetype, 'application/x-ndjson')
+            rows = [json.loads(line) for line in res.data.splitlines()]
+            self.assertEqual([row['title'] for row in rows],
+                             ['Recipe 0', 'Recipe 1', 'Recipe 2'])
+            self.assertTrue(rows[0]['done'])
+            self.assertEqual(rows[0]['created_on'], '2026-01-01T00:00:00')
+
+            res = c.get(f'/users/{self.testuser_id}/recipes/export?format=csv')
+            self.assertEqual(res.mimetype, 'text/csv')
+            rows = list(csv.DictReader(io.StringIO(res.data.decode())))
+            self.assertEqual(len(rows), 3)
+            self.assertEqual(rows[2]['title'], 'Recipe 2')
+
+    def test_export_other_user(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            res = c.get('/users/1/recipes/export', follow_redirects=True)
+            self.assertIn('Access unauthorized.', str(res.data))
+
+    def test_import_recipes(self):
+        """Import valid rows in batches and report the rest."""
+
+        lines = [json.dumps({'title': f'Imported {i}'}) for i in range(7)]
+        lines += [
+            json.dumps({'title': ''}),
+            json.dumps({'title': 'Bad URL', 'source_url': 'not a url'}),
+            'not json',
+            json.dumps({'title': 'Cooked', 'done': True,
+                        'created_on': '2025-05-01T12:00:00'}),
+        ]
+        data = '\n'.join(lines).encode()
+
+        batch = app.config['RECIPE_IMPORT_BATCH']
+        app.config['RECIPE_IMPORT_BATCH'] = 3
+        try:
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.testuser_id
+
+                res = c.post(f'/users/{self.testuser_id}/recipes/import',
+                             data={'file': (io.BytesIO(data), 'recipes.ndjson')},
+                             follow_redirects=True)
+                html = res.data.decode()
+                self.assertIn('8 recipes imported.', html)
+                self.assertIn('3 rows skipped.', html)
+                self.assertIn('line 10: not valid JSON', html)
+        finally:
+            app.config['RECIPE_IMPORT_BATCH'] = batch
+
+        cooked = Recipe.query.filter_by(title='Cooked').one()
+        self.assertTrue(cooked.done)
+        self.assertEqual(cooked.created_on, datetime.datetime(2025, 5, 1, 12))
+        self.assertEqual(Recipe.query.filter_by(
+            user_id=self.testuser_id).count(), 8)
+
+    def test_import_not_utf8(self):
+        """Report rows that aren't UTF-8 instead of failing the upload."""
+
+        data = ('title,ingredients\r\n'
+                'Soup,lentils\r\n'
+                'Cr\u00e8me br\u00fbl\u00e9e,"cream\r\nsugar"\r\n'
+                'Stew,beans\r\n').encode('cp1252')
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            res = c.post(f'/users/{self.testuser_id}/recipes/import',
+                         data={'file': (io.BytesIO(data), 'recipes.csv')},
+                         follow_redirects=True)
+            html = res.data.decode()
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('2 recipes imported.', html)
+            self.assertIn('line 4: not valid UTF-8', html)
+
+        self.assertEqual(sorted(r.title for r in Recipe.query.filter_by(
+            user_id=self.testuser_id)), ['Soup', 'Stew'])
+
+    def test_import_export_round_trip(self):
+        db.session.add(Recipe(title='Soup', source_url='https://soup.com',
+                              ingredients='water\nsalt',
+                              user_id=self.testuser_id))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            exported = c.get(
+                f'/users/{self.testuser_id}/recipes/export?format=csv').data
+            c.post(f'/users/{self.testuser_id}/recipes/import',
+                   data={'file': (io.BytesIO(exported), 'recipes.csv')})
+
+        soups = Recipe.query.filter_by(title='Soup').order_by(Recipe.id).all()
+        self.assertEqual(len(soups), 2)
+        self.assertEqual(soups[1].ingredients, 'water\nsalt')
+        self.assertEqual(soups[1].source_url, 'https://soup.com')
+
+    def test_show_recipe_not_modified(self):
+        """Answer 304 until the recipe changes."""
+
+        recipe = Recipe(title='Soup', user_id=self.testuser_id)
+        db.session.add(recipe)
+        db.session.commit()
+        url = f'/recipes/{recipe.id}'
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            res = c.get(url)
+            etag = res.headers['ETag']
+            last_modified = res.headers['Last-Modified']
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('no-cache', res.headers['Cache-Control'])
+
+            res = c.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 304)
+            self.assertEqual(res.data, b'')
+
+            res = c.get(url, headers={'If-Modified-Since': last_modified})
+            self.assertEqual(res.status_code, 304)
+
+            c.post(f'{url}/edit', data={'title': 'Better Soup'})
+            # the edit's flash message is shown, not a 304
+            res = c.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('Better Soup updated.', str(res.data))
+            self.assertNotEqual(res.headers['ETag'], etag)
+
+    def test_list_not_modified(self):
+        """Answer 304 for the list until a recipe is added or changed."""
+
+        db.session.add(Recipe(title='Soup', user_id=self.testuser_id))
+        db.session.commit()
+        url = f'/users/{self.testuser_id}/recipes'
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            etag = c.get(url).headers['ETag']
+            with count_queries(app) as statements:
+                res = c.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 304)
+            # the ETag check, and no list query
+            self.assertEqual(len(statements), 1)
+
+            res = c.get(f'{url}?show=pending',
+                        headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 200)
+
+            db.session.add(Recipe(title='Stew', user_id=self.testuser_id))
+            db.session.commit()
+            res = c.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('Stew', str(res.data))
+
+    def test_list_modified_by_delete(self):
+        """Deletes move the list's Last-Modified."""
+
+        hour_ago = datetime.datetime.now() - datetime.timedelta(hours=1)
+        db.session.add_all([
+            Recipe(id=1, title='Soup', user_id=self.testuser_id,
+                   updated_on=hour_ago),
+            Recipe(id=2, title='Stew', user_id=self.testuser_id,
+                   updated_on=hour_ago),
+        ])
+        db.session.commit()
+        url = f'/users/{self.testuser_id}/recipes'
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            for delete in (lambda: c.post('/recipes/1/delete'),
+                           lambda: c.post('/recipes/batch',
+                                          json={'action': 'delete',
+                                                'ids': [2]})):
+                # Last-Modified has whole seconds
+                User.query.filter_by(id=self.testuser_id).update(
+                    {'updated_on': hour_ago})
+                db.session.commit()
+                user_cache.backend.clear()
+
+                since = c.get(url).headers['Last-Modified']
+                res = c.get(url, headers={'If-Modified-Since': since})
+                self.assertEqual(res.status_code, 304)
+
+                delete()
+                # read past the delete's flash message
+                c.get('/about')
+                res = c.get(url, headers={'If-Modified-Since': since})
+                self.assertEqual(res.status_code, 200)
+            self.assertNotIn('Stew', str(res.data))
+
+    def test_toggle_done(self):
+        """Mark a recipe cooked and back, recording when."""
+
+        db.session.add(Recipe(id=1234, title='Soup', user_id=self.testuser_id))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            res = c.get('/recipes/1234/done')
+            self.assertEqual(res.status_code, 302)
+            recipe = Recipe.query.get(1234)
+            self.assertTrue(recipe.done)
+            self.assertIsNotNone(recipe.done_on)
+            db.session.rollback()
+
+            with count_queries(app) as statements:
+                res = c.post('/recipes/1234/done', json={})
+            self.assertEqual(res.json, {'id': 1234, 'done': False,
+                                        'done_on': None})
+            # the user is cached by now: just the UPDATE
+            self.assertEqual(len(statements), 1)
+            self.assertFalse(Recipe.query.get(1234).done)
+
+            # a plain form post isn't accepted
+            res = c.post('/recipes/1234/done')
+            self.assertEqual(res.status_code, 415)
+
+    def test_toggle_done_other_user(self):
+        """A user can't mark someone else's recipe."""
+
+        other = User.register(first_name='Other', last_name='User',
+                              email='other@test.com', pwd='password')
+        db.session.add(other)
+        db.session.commit()
+        db.session.add(Recipe(id=1234, title='Soup', user_id=other.id))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            self.assertEqual(c.get('/recipes/1234/done').status_code, 404)
+            res = c.post('/recipes/1234/done', json={})
+            self.assertEqual(res.status_code, 404)
+            self.assertFalse(Recipe.query.get(1234).done)
+
+        res = app.test_client().post('/recipes/1234/done', json={})
+        self.assertEqual(res.status_code, 401)
+
+    def test_batch_recipes(self):
+        """Mark and delete many recipes, only the user's, in one statement."""
+
+        other = User.register(first_name='Other', last_name='User',
+                              email='other@test.com', pwd='password')
+        db.session.add(other)
+        db.session.commit()
+        cooked_on = datetime.datetime(2026, 1, 1)
+        db.session.add_all([
+            Recipe(id=1, title='Soup', user_id=self.testuser_id),
+            Recipe(id=2, title='Stew', user_id=self.testuser_id,
+                   done=True, done_on=cooked_on),
+            Recipe(id=3, title='Pie', user_id=self.testuser_id),
+            Recipe(id=4, title='Theirs', user_id=other.id),
+        ])
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+            c.get('/about')
+
+            with count_queries(app) as statements:
+                res = c.post('/recipes/batch',
+                             json={'action': 'done', 'ids': [1, 2, 4, 5]})
+            self.assertEqual(res.json, {'action': 'done', 'ids': [1, 2],
+                                        'missing': [4, 5]})
+            self.assertEqual(len(statements), 1)
+            self.assertEqual(Recipe.query.get(2).done_on, cooked_on)
+            self.assertIsNotNone(Recipe.query.get(1).done_on)
+            self.assertFalse(Recipe.query.get(4).done)
+            db.session.rollback()
+
+            res = c.post('/recipes/batch',
+                         json={'action': 'undone', 'ids': [1]})
+            self.assertEqual(res.json['ids'], [1])
+            self.assertIsNone(Recipe.query.get(1).done_on)
+            db.session.rollback()
+
+            res = c.post('/recipes/batch',
+                         json={'action': 'delete', 'ids': [1, 3, 4]})
+            self.assertEqual(res.json, {'action': 'delete', 'ids': [1, 3],
+                                        'missing': [4]})
+            self.assertEqual(
+                sorted(r.id for r in Recipe.query.all()), [2, 4])
+            db.session.rollback()
+
+            for body in ({'action': 'burn', 'ids': [2]},
+                         {'action': 'done', 'ids': '2'},
+                         {'action': 'done', 'ids': [True]}):
+                res = c.post('/recipes/batch', json=body)
+                self.assertEqual(res.status_code, 400)
+
+    def test_edit_shared_recipe(self):
+        """Keep only what the user changed from the shared copy."""
+
+        db.session.add(CatalogRecipe(id=7, title='Soup',
+                                     source_url='https://example.com/soup',
+                                     image_url='https://example.com/soup.jpg',
+                                     ingredients='lentils',
+                                     instructions='Simmer.'))
+        db.session.add(Recipe(id=1, title='Soup', spoonacular_id=7,
+                              user_id=self.testuser_id, image_url=None))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+            c.post('/recipes/1/edit', data={
+                'title': 'My Soup',
+                'source_url': 'https://example.com/soup',
+                'image_url': 'https://example.com/soup.jpg',
+                'ingredients': 'lentils',
+                'instructions': 'Simmer, then salt.'})
+
+        recipe = Recipe.query.get(1)
+        self.assertEqual(recipe.title, 'My Soup')
+        self.assertEqual(recipe.ingredients, 'lentils')
+        self.assertIsNone(recipe.own_ingredients)
+        self.assertIsNone(recipe.own_image_url)
+        self.assertEqual(recipe.own_instructions, 'Simmer, then salt.')
+        self.assertEqual(
+            Recipe.query.filter(Recipe.instructions == 'Simmer, then salt.')
+            .count(), 1)
+
+
+# SQL statements each route may run for a logged-in user whose identity
+# isn't cached yet, against the seeded lists below. {id} is one of the
+# user's recipes. Lists spend one on their ETag.
+QUERY_BUDGETS = {
+    ('GET', '/users/{user_id}/recipes'): 3,
+    ('GET', '/users/{user_id}/recipes?show=pending'): 3,
+    ('GET', '/users/{user_id}/recipes?after={cursor}'): 3,
+    ('GET', '/users/{user_id}/recipes/export'): 2,
+    ('GET', '/recipes/{id}'): 2,
+    ('GET', '/recipes/{id}/edit'): 2,
+    ('POST', '/recipes/{id}/edit'): 4,
+    ('GET', '/recipes/{id}/done'): 2,
+    ('POST', '/recipes/{id}/delete'): 4,
+    ('GET', '/recipes/new'): 1,
+    ('POST', '/recipes/new'): 3,
+    ('GET', '/recipes/search?q=soup'): 2,
+    ('GET', '/users/{user_id}/recipes/random?tags=soup'): 2,
+}
+
+
+class RecipeQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Keep recipe routes within their query budgets."""
+
+    app = app
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+        user_cache.backend.clear()
+
+        self.client = app.test_client()
+
+        base = datetime.datetime(2026, 1, 1)
+        for user_id in (1, 2):
+            user = User.register(first_name='Budget', last_name=str(user_id),
+                                 email=f'budget{user_id}@test.com',
+                                 pwd='password')
+            user.id = user_id
+            db.session.add(user)
+            for i in range(120):
+                db.session.add(Recipe(
+                    title=f'Recipe {user_id}-{i}',
+                    source_url='https://example.com',
+                    ingredients='flour',
+                    created_on=base + datetime.timedelta(hours=i),
+                    done=i % 2 == 0,
+                    user_id=user_id
+                ))
+        db.session.commit()
+
+        self.recipe_ids = [recipe.id for recipe
+                           in Recipe.query.filter_by(user_id=1)]
+        db.session.rollback()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_query_budgets(self):
+        cursor = f'2026-01-03T00:00:00_{self.recipe_ids[60]}'
+
+        for (method, url), budget in QUERY_BUDGETS.items():
+            url = url.format(user_id=1, id=self.recipe_ids.pop(),
+                             cursor=cursor)
+            with self.subTest(route=f'{method} {url}'):
+                user_cache.backend.clear()
+                with self.client as c:
+                    with c.session_transaction() as sess:
+                        sess[CURR_USER_KEY] = 1
+
+                    res = self.assertQueryBudget(
+                        budget, method, url,
+                        data={'title': 'Budget Recipe'})
+                    self.assertLess(res.status_code, 400)
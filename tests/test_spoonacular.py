@@ -0,0 +1,174 @@
+"""Spoonacular client tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_spoonacular.py
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from urllib.parse import urlparse, parse_qs
+
+from spoonacular import SpoonacularClient, SpoonacularError, QuotaExceeded
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answer from the server's queue of (status, delay[, body])
+    responses."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        status, delay, *body = (server.responses.pop(0) if server.responses
+                                else (200, 0))
+        time.sleep(delay)
+
+        query = parse_qs(urlparse(self.path).query)
+        number = int(query.get('number', ['1'])[0])
+        body = body[0] if body else json.dumps(
+            {'recipes': [{'id': i, 'title': f'Recipe {i}'}
+                         for i in range(number)]})
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class SpoonacularClientTestCase(TestCase):
+    """Test the client against a local stub server."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.daemon_threads = True
+        self.server.requests = []
+        self.server.responses = []
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+        host, port = self.server.server_address
+        self.client = SpoonacularClient(
+            'test-key', base_url=f'http://{host}:{port}',
+            read_timeout=0.5, retries=2, backoff=0.01)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.client.session.close()
+
+    def test_random_recipes(self):
+        recipes = self.client.random_recipes('vegan', 3)
+
+        self.assertEqual(len(recipes), 3)
+        self.assertIn('apiKey=test-key', self.server.requests[0])
+        self.assertIn('tags=vegan', self.server.requests[0])
+
+    def test_retries_server_errors(self):
+        self.server.responses = [(503, 0), (500, 0)]
+
+        self.assertEqual(len(self.client.random_recipes('vegan', 1)), 1)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_gives_up_after_retries(self):
+        self.server.responses = [(503, 0)] * 3
+
+        with self.assertRaises(SpoonacularError) as context:
+            self.client.random_recipes('vegan', 1)
+
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.server.responses = [(402, 0)]
+
+        with self.assertRaises(SpoonacularError):
+            self.client.random_recipes('vegan', 1)
+
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_body_not_json(self):
+        self.server.responses = [(200, 0, '<html>Sign in to Wi-Fi</html>'),
+                                 (200, 0, '')] + [(200, 0, '<html>')] * 2
+
+        with self.assertRaises(SpoonacularError):
+            self.client.random_recipes('vegan', 1)
+        self.assertEqual(len(self.server.requests), 3)
+
+        # one bad page among good ones is retried away
+        self.assertEqual(len(self.client.random_recipes('vegan', 1)), 1)
+
+    def test_unexpected_body(self):
+        for body in ('[]', '{"recipes": null}', '"recipes"'):
+            with self.subTest(body=body):
+                self.server.responses = [(200, 0, body)]
+                with self.assertRaises(SpoonacularError):
+                    self.client.random_recipes('vegan', 1)
+
+    def test_read_timeout(self):
+        self.server.responses = [(200, 1)] * 3
+
+        start = time.perf_counter()
+        with self.assertRaises(SpoonacularError):
+            self.client.random_recipes('vegan', 1)
+
+        self.assertLess(time.perf_counter() - start, 2.5)
+
+    def test_latency_listener(self):
+        calls = []
+        self.client.listeners.append(
+            lambda *args: calls.append(args))
+
+        self.client.random_recipes('vegan', 1)
+
+        path, seconds, status, error = calls[0]
+        self.assertEqual(path, '/recipes/random')
+        self.assertEqual(status, 200)
+        self.assertIsNone(error)
+        self.assertGreater(seconds, 0)
+
+    def test_quota_exceeded_skips_request(self):
+        class NoQuota:
+            def acquire(self, cost, priority):
+                return False
+
+        self.client.quota = NoQuota()
+
+        with self.assertRaises(QuotaExceeded):
+            self.client.random_recipes('vegan', 1)
+
+        self.assertEqual(self.server.requests, [])
+
+    def test_retries_are_charged(self):
+        class CountingQuota:
+            def __init__(self, allow):
+                self.allow = allow
+                self.calls = []
+
+            def acquire(self, cost, priority):
+                self.calls.append((cost, priority))
+                return len(self.calls) <= self.allow
+
+        self.server.responses = [(503, 0)] * 3
+        self.client.quota = CountingQuota(allow=3)
+
+        with self.assertRaises(SpoonacularError):
+            self.client.random_recipes('vegan', 1)
+
+        self.assertEqual(len(self.client.quota.calls), 3)
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.server.requests = []
+        self.server.responses = [(503, 0)] * 3
+        self.client.quota = CountingQuota(allow=2)
+
+        with self.assertRaises(SpoonacularError) as context:
+            self.client.random_recipes('vegan', 1)
+
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(len(self.server.requests), 2)
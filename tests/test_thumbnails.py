@@ -0,0 +1,207 @@
+"""Image thumbnail tests."""
+
+# run these tests like:
+#
+#    python -m unittest tests/test_thumbnails.py
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, skipIf
+
+import thumbnails
+from app import create_app
+from config import TestingConfig
+from thumbnails import ThumbnailCache, ThumbnailError
+
+
+def make_png(width=800, height=400):
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 80, 40)).save(out, 'PNG')
+    return out.getvalue()
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serves /<name>.png, /text and /moved, and counts requests."""
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        if self.path == '/moved':
+            self.send_response(302)
+            self.send_header('Location', '/food.png')
+            self.end_headers()
+            return
+
+        if self.path.endswith('.png'):
+            body, kind = self.server.png, 'image/png'
+        elif self.path == '/text':
+            body, kind = b'not an image', 'text/plain'
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', kind)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@skipIf(thumbnails.Image is None, 'Pillow is not installed')
+class ThumbnailTestCase(TestCase):
+    """Make thumbnails of images from a local server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+        cls.server.png = make_png()
+        cls.server.hits = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.hits.clear()
+        self.directory = tempfile.mkdtemp()
+        self.cache = ThumbnailCache(self.directory, allow_private=True)
+
+        class ThumbnailConfig(TestingConfig):
+            THUMBNAIL_DIR = self.directory
+            THUMBNAIL_ALLOW_PRIVATE_HOSTS = True
+
+        self.app = create_app(ThumbnailConfig)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_fetch_once(self):
+        from PIL import Image
+
+        path = self.cache.get(f'{self.base}/food.png', 'card')
+        again = self.cache.get(f'{self.base}/food.png', 'card')
+
+        self.assertEqual(path, again)
+        self.assertEqual(self.server.hits, ['/food.png'])
+        with Image.open(path) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, thumbnails.SIZES['card'])
+
+    def test_sizes_cached_apart(self):
+        card = self.cache.get(f'{self.base}/food.png', 'card')
+        avatar = self.cache.get(f'{self.base}/food.png', 'avatar')
+
+        self.assertNotEqual(card, avatar)
+        self.assertEqual(len(self.server.hits), 2)
+
+    def test_redirect(self):
+        path = self.cache.get(f'{self.base}/moved', 'card')
+
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(self.server.hits, ['/moved', '/food.png'])
+
+    def test_failures(self):
+        with self.assertRaises(ThumbnailError):
+            self.cache.get(f'{self.base}/text', 'card')
+        with self.assertRaises(ThumbnailError):
+            self.cache.get(f'{self.base}/missing', 'card')
+        # remembered, not fetched again
+        with self.assertRaises(ThumbnailError):
+            self.cache.get(f'{self.base}/text', 'card')
+        self.assertEqual(self.server.hits, ['/text', '/missing'])
+
+        small = ThumbnailCache(self.directory, max_source_bytes=100,
+                               allow_private=True)
+        with self.assertRaisesRegex(ThumbnailError, 'too large'):
+            small.get(f'{self.base}/big.png', 'card')
+
+    def test_private_hosts(self):
+        cache = ThumbnailCache(self.directory)
+
+        for url in (f'{self.base}/food.png', 'http://localhost/food.png',
+                    'http://10.0.0.1/food.png', 'file:///etc/passwd'):
+            with self.assertRaises(ThumbnailError):
+                cache.get(url, 'card')
+        self.assertEqual(self.server.hits, [])
+
+    def test_private_peer(self):
+        # DNS said public when checked, then answered 127.0.0.1 (rebinding)
+        is_public_host = thumbnails.is_public_host
+        thumbnails.is_public_host = lambda host: True
+        try:
+            with self.assertRaises(ThumbnailError):
+                ThumbnailCache(self.directory).get(
+                    f'{self.base}/food.png', 'card')
+        finally:
+            thumbnails.is_public_host = is_public_host
+        self.assertEqual(self.server.hits, [])
+
+    def test_evict_stale_files(self):
+        failed = os.path.join(self.directory, 'old.failed')
+        recent = os.path.join(self.directory, 'new.failed')
+        orphan = os.path.join(self.directory, 'dead.tmp')
+        writing = os.path.join(self.directory, 'live.tmp')
+        for path in (failed, recent, orphan, writing):
+            open(path, 'w').close()
+        os.utime(failed, (0, os.path.getmtime(failed) - 601))
+        os.utime(orphan, (0, os.path.getmtime(orphan)
+                          - thumbnails.TMP_MAX_AGE))
+
+        self.cache.evict()
+
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['live.tmp', 'new.failed'])
+
+    def test_evict_least_recently_used(self):
+        paths = [self.cache.get(f'{self.base}/{name}.png', 'card')
+                 for name in ('a', 'b', 'c')]
+        for age, path in zip((300, 200, 100), paths):
+            os.utime(path, (0, os.path.getmtime(path) - age))
+        # a hit makes 'a' the most recently used
+        self.cache.get(f'{self.base}/a.png', 'card')
+
+        self.cache.max_bytes = sum(os.path.getsize(path)
+                                   for path in paths) - 1
+        self.cache.evict()
+
+        self.assertEqual([os.path.exists(path) for path in paths],
+                         [True, False, True])
+
+    def test_route(self):
+        url = f'{self.base}/food.png'
+        with self.app.test_request_context():
+            thumbnail = thumbnails.thumbnail_url(url)
+            # only remote images are proxied
+            self.assertEqual(thumbnails.thumbnail_url('/static/x.png'),
+                             '/static/x.png')
+            self.assertIsNone(thumbnails.thumbnail_url(None))
+
+        res = self.client.get(thumbnail)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'image/webp')
+        self.assertIn('max-age=2592000', res.headers['Cache-Control'])
+        res.close()
+
+        tampered = thumbnail.replace('food.png', 'other.png')
+        self.assertEqual(self.client.get(tampered).status_code, 404)
+
+    def test_route_falls_back_to_original(self):
+        url = f'{self.base}/text'
+        with self.app.test_request_context():
+            thumbnail = thumbnails.thumbnail_url(url)
+
+        res = self.client.get(thumbnail)
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(res.location, url)
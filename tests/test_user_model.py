@@ -4,17 +4,13 @@
 #
 #    python -m unittest tests/test_user_model.py
 
-from app import app
+from app import create_app
 from unittest import TestCase
 from sqlalchemy import exc
-from models import db, User
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///nomnom_test'
-app.config['SQLALCHEMY_ECHO'] = False
-
-# Make Flask errors be real errors, rather than HTML pages with error info
-app.config['TESTING'] = True
+from models import db, User, hasher
+from hashing import hash_rounds
 
+app = create_app('testing')
 db.create_all()
 
 
@@ -131,3 +127,20 @@ class UserModelTestCase(TestCase):
 
     def test_wrong_password(self):
         self.assertFalse(User.authenticate('email1@email.com', 'badpassword'))
+
+    def test_rehash_on_login(self):
+        u = User.register('Re', 'Hash', 'rehash@test.com', 'password')
+        db.session.add(u)
+        db.session.commit()
+
+        rounds = hasher.rounds
+        self.assertEqual(hash_rounds(u.password), rounds)
+
+        hasher.rounds = rounds + 1
+        try:
+            u = User.authenticate('rehash@test.com', 'password')
+            self.assertTrue(u)
+            self.assertEqual(hash_rounds(u.password), rounds + 1)
+            self.assertTrue(User.authenticate('rehash@test.com', 'password'))
+        finally:
+            hasher.rounds = rounds
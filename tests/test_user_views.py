@@ -2,25 +2,19 @@
 
 # run these tests like:
 #
-#    FLASK_ENV=production python -m unittest tests/test_user_views.py
+#    python -m unittest tests/test_user_views.py
 
 
 from unittest import TestCase
-from app import app, CURR_USER_KEY
+from app import create_app, CURR_USER_KEY
 
-from models import db, User
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///nomnom_test'
-app.config['SQLALCHEMY_ECHO'] = False
-
-# Make Flask errors be real errors, rather than HTML pages with error info
-app.config['TESTING'] = True
+from models import db, User, Recipe
+from tests.querycount import count_queries, QueryBudgetMixin
 
+app = create_app('testing')
+user_cache = app.extensions['user_cache']
 db.create_all()
 
-# Don't have WTForms use CSRF to test
-app.config['WTF_CSRF_ENABLED'] = False
-
 
 class UserViewTestCase(TestCase):
     """Test views for users."""
@@ -30,6 +24,7 @@ class UserViewTestCase(TestCase):
 
         db.drop_all()
         db.create_all()
+        user_cache.backend.clear()
 
         self.client = app.test_client()
 
@@ -69,3 +64,153 @@ class UserViewTestCase(TestCase):
             self.assertEqual(res.status_code, 200)
             self.assertNotIn('Test1', str(res.data))
             self.assertIn('Please log in first.', str(res.data))
+
+    def count_user_queries(self, url, method='GET'):
+        """Request url and return how many statements touched users."""
+
+        with count_queries(app) as statements:
+            self.client.open(url, method=method)
+
+        return len([statement for statement in statements
+                    if 'users' in statement])
+
+    def test_user_loaded_lazily(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            # redirects and static files never touch g.user
+            self.assertEqual(self.count_user_queries('/register'), 0)
+            self.assertEqual(self.count_user_queries('/static/style.css'), 0)
+
+    def test_user_identity_cached(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            self.assertEqual(self.count_user_queries('/about'), 1)
+            self.assertEqual(self.count_user_queries('/about'), 0)
+
+    def test_edit_profile_forgets_identity(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            c.get('/about')
+            self.assertEqual(user_cache.peek(self.testuser_id)['first_name'],
+                             'Test')
+
+            res = c.post('/users/profile', data={
+                'first_name': 'Renamed', 'last_name': 'User',
+                'email': 'test@test.com',
+                'image_url': 'https://example.com/me.png',
+                'password': 'testuser'})
+            self.assertEqual(res.status_code, 302)
+            self.assertIsNone(user_cache.peek(self.testuser_id))
+
+            # the next request loads a fresh identity
+            self.assertEqual(self.count_user_queries('/about'), 1)
+            identity = user_cache.peek(self.testuser_id)
+            self.assertEqual(identity['first_name'], 'Renamed')
+            self.assertEqual(identity['image_url'],
+                             'https://example.com/me.png')
+
+            res = c.get(f'/users/{self.testuser_id}')
+            self.assertIn('Renamed User', str(res.data))
+
+    def test_delete_user_forgets_identity(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            c.get('/about')
+            res = c.post('/users/delete', follow_redirects=True)
+            self.assertIn('Account deleted.', str(res.data))
+
+            self.assertIsNone(user_cache.peek(self.testuser_id))
+            self.assertIsNone(User.query.get(self.testuser_id))
+
+    def test_show_user_not_modified(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser_id
+
+            url = f'/users/{self.testuser_id}'
+            etag = c.get(url).headers['ETag']
+            res = c.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 304)
+
+            user = User.query.get(self.testuser_id)
+            user.first_name = 'Renamed'
+            db.session.commit()
+            user_cache.backend.clear()
+
+            res = c.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('Renamed', str(res.data))
+
+
+# SQL statements each route may run for a logged-in user whose identity
+# isn't cached yet and who has a long recipe list
+QUERY_BUDGETS = {
+    ('GET', '/'): 1,
+    ('GET', '/about'): 1,
+    ('GET', '/users/{user_id}'): 1,
+    ('GET', '/users/profile'): 2,
+    ('GET', '/logout'): 0,
+}
+
+
+class UserQueryBudgetTestCase(QueryBudgetMixin, TestCase):
+    """Keep user routes within their query budgets."""
+
+    app = app
+
+    def setUp(self):
+        db.drop_all()
+        db.create_all()
+        user_cache.backend.clear()
+
+        self.client = app.test_client()
+
+        user = User.register('Budget', 'User', 'budget@test.com', 'password')
+        user.id = 1
+        db.session.add(user)
+        db.session.add_all(Recipe(title=f'Recipe {i}', user_id=1)
+                           for i in range(100))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_query_budgets(self):
+        for (method, url), budget in QUERY_BUDGETS.items():
+            url = url.format(user_id=1)
+            with self.subTest(route=f'{method} {url}'):
+                user_cache.backend.clear()
+                with self.client as c:
+                    with c.session_transaction() as sess:
+                        sess[CURR_USER_KEY] = 1
+
+                    res = self.assertQueryBudget(budget, method, url)
+                    self.assertLess(res.status_code, 400)
+
+    def test_login_budget(self):
+        res = self.assertQueryBudget(
+            1, 'POST', '/login',
+            data={'email': 'budget@test.com', 'password': 'password'})
+        self.assertEqual(res.status_code, 302)
+
+    def test_delete_user_budget(self):
+        """Deleting an account costs the same however many recipes it has."""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 1
+
+            # the user, and one DELETE; the database removes the recipes
+            res = self.assertQueryBudget(2, 'POST', '/users/delete')
+            self.assertEqual(res.status_code, 302)
+
+        self.assertIsNone(User.query.get(1))
+        self.assertEqual(Recipe.query.count(), 0)
@@ -0,0 +1,330 @@
+"""Thumbnails of remote recipe and profile images, cached on disk.
+
+Pages link images through thumbnail_url(), which points at our
+/thumbnails/ endpoint with a signature, so the endpoint only fetches
+URLs the app itself put on a page. Each source image is fetched once,
+cropped to a fixed size, saved as WebP and kept in a directory shared
+by every worker on the host. The directory is trimmed back under its
+byte budget, least recently used first.
+"""
+
+import hashlib
+import hmac
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+import time
+from urllib.parse import urljoin, urlparse
+
+import requests
+from flask import (Blueprint, abort, current_app, redirect, request,
+                   send_file, url_for)
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# name: (width, height)
+SIZES = {
+    'card': (640, 480),
+    'avatar': (256, 256),
+}
+
+# A .tmp file this old was left by a worker that died mid-write
+TMP_MAX_AGE = 3600
+
+bp = Blueprint('thumbnails', __name__)
+
+
+class ThumbnailError(Exception):
+    """The source image couldn't be fetched or read."""
+
+
+def is_public_address(address):
+    """Return True if an IP address string is publicly routable."""
+
+    try:
+        return ipaddress.ip_address(address).is_global
+    except ValueError:
+        # e.g. a link-local IPv6 address with a scope
+        return False
+
+
+def is_public_host(host):
+    """Return True if every address host resolves to is publicly routable."""
+
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except (socket.gaierror, UnicodeError):
+        return False
+    return all(is_public_address(info[4][0]) for info in infos)
+
+
+class PublicPeerMixin:
+    """Refuse to use a socket connected to a non-public address.
+
+    Checked on the open socket rather than on a DNS lookup of our own, so
+    a name that resolves differently by the time we connect (DNS
+    rebinding) still can't reach our network.
+    """
+
+    def _new_conn(self):
+        sock = super()._new_conn()
+        address = sock.getpeername()[0]
+        if not is_public_address(address):
+            sock.close()
+            raise NewConnectionError(
+                self, f'{self.host} connected to non-public {address}')
+        return sock
+
+
+class PublicHTTPConnection(PublicPeerMixin, HTTPConnection):
+    pass
+
+
+class PublicHTTPSConnection(PublicPeerMixin, HTTPSConnection):
+    pass
+
+
+class PublicHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = PublicHTTPConnection
+
+
+class PublicHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = PublicHTTPSConnection
+
+
+class PublicHostAdapter(HTTPAdapter):
+    """Transport adapter that only connects to public addresses."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': PublicHTTPConnectionPool,
+            'https': PublicHTTPSConnectionPool,
+        }
+
+
+class ThumbnailCache:
+    """Fixed-size WebP thumbnails in a size-bounded directory.
+
+    A cache hit bumps the file's mtime; when the directory grows past
+    max_bytes, the files with the oldest mtimes go first. Failed sources
+    are remembered for failure_ttl seconds so a broken link isn't fetched
+    on every page view.
+    """
+
+    def __init__(self, directory, max_bytes=256 << 20, max_source_bytes=10 << 20,
+                 quality=80, timeout=(3.05, 10), failure_ttl=600,
+                 allow_private=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_source_bytes = max_source_bytes
+        self.quality = quality
+        self.timeout = timeout
+        self.failure_ttl = failure_ttl
+        self.allow_private = allow_private
+        self.session = requests.Session()
+        if not allow_private:
+            adapter = PublicHostAdapter()
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+            # the peer check needs a direct connection, not a proxy's
+            self.session.trust_env = False
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, url, size):
+        return hashlib.sha256(f'{size}:{url}'.encode()).hexdigest()
+
+    def get(self, url, size):
+        """Return the path of url's thumbnail at size, making it if needed.
+
+        Raises ThumbnailError if the source can't be used.
+        """
+
+        key = self.key(url, size)
+        path = os.path.join(self.directory, f'{key}.webp')
+        failed = os.path.join(self.directory, f'{key}.failed')
+
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+
+        try:
+            if time.time() - os.path.getmtime(failed) < self.failure_ttl:
+                raise ThumbnailError(f'{url} failed recently')
+        except FileNotFoundError:
+            pass
+
+        try:
+            data = self.render(self.fetch(url), SIZES[size])
+        except ThumbnailError:
+            open(failed, 'w').close()
+            raise
+
+        self.write(path, data)
+        self.evict()
+        return path
+
+    def fetch(self, url, redirects=3):
+        """Return the bytes at a public http(s) URL, up to max_source_bytes."""
+
+        for _ in range(redirects + 1):
+            parsed = urlparse(url)
+            if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+                raise ThumbnailError(f'{url} is not an http(s) URL')
+            # never let a page make us fetch from our own network
+            if not (self.allow_private or is_public_host(parsed.hostname)):
+                raise ThumbnailError(f'{url} is not on a public host')
+
+            try:
+                res = self.session.get(url, timeout=self.timeout, stream=True,
+                                       allow_redirects=False)
+            except requests.RequestException as exc:
+                raise ThumbnailError(f'{url}: {exc}') from exc
+
+            with res:
+                if res.is_redirect:
+                    url = urljoin(url, res.headers['Location'])
+                    continue
+                if not res.ok:
+                    raise ThumbnailError(f'{url}: HTTP {res.status_code}')
+
+                data = res.raw.read(self.max_source_bytes + 1,
+                                    decode_content=True)
+                if len(data) > self.max_source_bytes:
+                    raise ThumbnailError(f'{url} is too large')
+                return data
+
+        raise ThumbnailError(f'{url} redirects too often')
+
+    def render(self, data, size):
+        """Return data cropped and scaled to size, as WebP bytes."""
+
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                # let JPEG decode at a fraction of full size
+                image.draft('RGB', size)
+                image = ImageOps.exif_transpose(image)
+                image = image.convert(
+                    'RGBA' if 'A' in image.getbands() else 'RGB')
+                image = ImageOps.fit(image, size, Image.LANCZOS)
+
+                out = io.BytesIO()
+                image.save(out, 'WEBP', quality=self.quality, method=4)
+                return out.getvalue()
+        except (OSError, ValueError, Image.DecompressionBombError) as exc:
+            raise ThumbnailError(f'unreadable image: {exc}') from exc
+
+    def write(self, path, data):
+        # write then rename, so other workers never read half a file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def evict(self):
+        """Delete least recently used thumbnails until under max_bytes.
+
+        Expired failure markers and .tmp files left by dead workers go
+        first, whatever the size.
+        """
+
+        now = time.time()
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                age = now - stat.st_mtime
+
+                if entry.name.endswith('.webp'):
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.name.endswith('.failed'):
+                    if age >= self.failure_ttl:
+                        remove(entry.path)
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                elif entry.name.endswith('.tmp'):
+                    # a younger one may still be being written
+                    if age >= TMP_MAX_AGE:
+                        remove(entry.path)
+                        continue
+                else:
+                    continue
+                total += stat.st_size
+
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            remove(path)
+            total -= size
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def init_app(app):
+    """Set up the cache and add thumbnail_url() to templates."""
+
+    if Image is not None:
+        app.extensions['thumbnails'] = ThumbnailCache(
+            app.config['THUMBNAIL_DIR'],
+            max_bytes=app.config['THUMBNAIL_CACHE_BYTES'],
+            max_source_bytes=app.config['THUMBNAIL_MAX_SOURCE_BYTES'],
+            quality=app.config['THUMBNAIL_QUALITY'],
+            allow_private=app.config['THUMBNAIL_ALLOW_PRIVATE_HOSTS'])
+    app.jinja_env.globals['thumbnail_url'] = thumbnail_url
+    app.register_blueprint(bp)
+
+
+def sign(url, size):
+    secret = current_app.config['SECRET_KEY'].encode()
+    message = f'{size}:{url}'.encode()
+    return hmac.new(secret, message, hashlib.sha256).hexdigest()[:32]
+
+
+def thumbnail_url(url, size='card'):
+    """Return the URL of url's thumbnail, or url itself if we can't make one."""
+
+    if (not url or 'thumbnails' not in current_app.extensions
+            or urlparse(url).scheme not in ('http', 'https')):
+        return url
+    return url_for('thumbnails.show_thumbnail', size=size,
+                   signature=sign(url, size), url=url)
+
+
+@bp.route('/thumbnails/<size>/<signature>')
+def show_thumbnail(size, signature):
+    """Serve a cached thumbnail, or send the browser to the original."""
+
+    url = request.args.get('url', '')
+    cache = current_app.extensions.get('thumbnails')
+    if (cache is None or size not in SIZES
+            or not hmac.compare_digest(signature, sign(url, size))):
+        abort(404)
+
+    try:
+        path = cache.get(url, size)
+    except ThumbnailError as exc:
+        current_app.logger.info('No thumbnail: %s', exc)
+        return redirect(url)
+
+    return send_file(path, mimetype='image/webp',
+                     max_age=current_app.config['THUMBNAIL_MAX_AGE'])
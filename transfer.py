@@ -0,0 +1,191 @@
+"""Bulk export and import of a user's recipes."""
+
+import csv
+import datetime
+import io
+import json
+
+from sqlalchemy import func, insert, select
+from werkzeug.datastructures import MultiDict
+
+from config import DEFAULT_RECIPE_IMG
+from forms import RecipeForm
+from models import db, Recipe, CatalogRecipe
+
+# Columns in an export, and accepted by an import
+COLUMNS = ('title', 'source_url', 'ingredients', 'instructions', 'image_url',
+           'done', 'created_on')
+
+# The columns RecipeForm validates
+FORM_COLUMNS = ('title', 'source_url', 'ingredients', 'instructions',
+                'image_url')
+
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+
+
+def export_rows(user_id, chunk_size=500):
+    """Yield a user's recipes as dicts, oldest first.
+
+    Rows come from a server-side cursor chunk_size at a time, so memory
+    stays flat however long the list is.
+    """
+
+    table = Recipe.__table__
+    canonical = CatalogRecipe.__table__
+    # shared recipes export their canonical details unless edited
+    columns = [func.coalesce(table.c[column], canonical.c[column])
+               .label(column) if column in Recipe.SHARED_COLUMNS
+               else table.c[column] for column in COLUMNS]
+
+    stmt = (select(*columns)
+            .select_from(table.outerjoin(
+                canonical, table.c.spoonacular_id == canonical.c.id))
+            .where(table.c.user_id == user_id)
+            .order_by(table.c.created_on, table.c.id))
+
+    result = db.session.execute(
+        stmt, execution_options={'stream_results': True,
+                                 'max_row_buffer': chunk_size})
+    for row in result.mappings():
+        yield dict(row)
+
+
+def to_ndjson(rows):
+    """Yield rows as newline-delimited JSON."""
+
+    for row in rows:
+        row['created_on'] = row['created_on'].isoformat()
+        yield json.dumps(row) + '\n'
+
+
+def to_csv(rows):
+    """Yield rows as CSV, header first."""
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, COLUMNS)
+
+    writer.writeheader()
+    for row in rows:
+        row['created_on'] = row['created_on'].isoformat()
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def decode_lines(stream, bad_lines):
+    """Yield the upload's lines as text, adding the numbers of lines that
+    aren't valid UTF-8 to bad_lines (they're decoded with replacements)."""
+
+    for line_num, line in enumerate(stream, 1):
+        try:
+            yield line.decode('utf-8')
+        except UnicodeDecodeError:
+            bad_lines.add(line_num)
+            yield line.decode('utf-8', 'replace')
+
+
+def read_rows(stream, filename):
+    """Yield (line number, row dict or None, error) from an upload.
+
+    CSV files must have a header row; anything else is read as
+    newline-delimited JSON. Rows that aren't valid UTF-8, e.g. from a
+    spreadsheet saved in a Windows code page, come back as errors.
+    """
+
+    bad_lines = set()
+    lines = decode_lines(stream, bad_lines)
+
+    if filename.lower().endswith('.csv'):
+        reader = csv.DictReader(lines)
+        first = 1
+        try:
+            for row in reader:
+                # a quoted field may span several lines
+                if bad_lines.intersection(range(first, reader.line_num + 1)):
+                    yield reader.line_num, None, 'not valid UTF-8'
+                else:
+                    yield reader.line_num, row, None
+                first = reader.line_num + 1
+        except csv.Error as exc:
+            yield reader.line_num, None, f'not valid CSV: {exc}'
+        return
+
+    for line_num, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        if line_num in bad_lines:
+            yield line_num, None, 'not valid UTF-8'
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_num, None, 'not valid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield line_num, None, 'not a JSON object'
+            continue
+        yield line_num, row, None
+
+
+def clean_row(row, user_id):
+    """Validate row with the RecipeForm rules.
+
+    Returns (values for a recipes insert, None) or (None, error message).
+    """
+
+    formdata = MultiDict({column: str(row[column]) for column in FORM_COLUMNS
+                          if row.get(column) is not None})
+    form = RecipeForm(formdata=formdata, meta={'csrf': False})
+
+    if not form.validate():
+        return None, '; '.join(f'{name}: {", ".join(errors)}'
+                               for name, errors in form.errors.items())
+
+    values = {column: form[column].data or None for column in FORM_COLUMNS}
+    values['image_url'] = values['image_url'] or DEFAULT_RECIPE_IMG
+    values['done'] = str(row.get('done') or '').lower() in TRUE_VALUES
+    values['user_id'] = user_id
+
+    try:
+        values['created_on'] = (
+            datetime.datetime.fromisoformat(row['created_on'])
+            if row.get('created_on') else datetime.datetime.now())
+    except (TypeError, ValueError):
+        return None, 'created_on: Not a valid date.'
+
+    return values, None
+
+
+def import_rows(rows, user_id, batch_size=500):
+    """Insert valid rows from read_rows for a user, batch_size at a time.
+
+    Invalid rows are skipped. Everything is committed once at the end.
+    Returns (number imported, [(line number, error), ...]).
+    """
+
+    stmt = insert(Recipe.__table__)
+    imported = 0
+    errors = []
+    batch = []
+
+    for line_num, row, error in rows:
+        values = None
+        if row is not None:
+            values, error = clean_row(row, user_id)
+        if error:
+            errors.append((line_num, error))
+            continue
+
+        batch.append(values)
+        if len(batch) >= batch_size:
+            db.session.execute(stmt, batch)
+            imported += len(batch)
+            batch = []
+
+    if batch:
+        db.session.execute(stmt, batch)
+        imported += len(batch)
+
+    db.session.commit()
+    return imported, errors